@@ -18,13 +18,20 @@ import asyncio
 import os
 from typing import Optional, Dict, List
 import aiofiles
-import http.server
-import socketserver
 import threading
-import requests
 import urllib.parse
 import html
 import io
+import gzip
+import heapq
+import bisect
+import random
+import functools
+import aiohttp
+from aiohttp import web
+from multidict import CIMultiDict
+import sys
+from collections.abc import MutableMapping
 
 # Bot configuration
 intents = discord.Intents.default()
@@ -50,15 +57,56 @@ try:
 	BACKUP_INTERVAL_MIN = int(os.getenv('BACKUP_INTERVAL_MIN', '60') or 60)
 except Exception:
 	BACKUP_INTERVAL_MIN = 60
+try:
+	BACKUP_COALESCE_SEC = int(os.getenv('BACKUP_COALESCE_SEC', '30') or 30)
+except Exception:
+	BACKUP_COALESCE_SEC = 30
+try:
+	RECONCILE_SWEEP_MIN = int(os.getenv('RECONCILE_SWEEP_MIN', '30') or 30)
+except Exception:
+	RECONCILE_SWEEP_MIN = 30
+try:
+	HTTP_TIMEOUT_SEC = float(os.getenv('HTTP_TIMEOUT_SEC', '10') or 10)
+	HTTP_RETRIES = int(os.getenv('HTTP_RETRIES', '3') or 3)
+except Exception:
+	HTTP_TIMEOUT_SEC, HTTP_RETRIES = 10.0, 3
+try:
+	STATS_FLUSH_SEC = int(os.getenv('STATS_FLUSH_SEC', '10') or 10)
+	STATS_FLUSH_DIRTY = int(os.getenv('STATS_FLUSH_DIRTY', '500') or 500)
+except Exception:
+	STATS_FLUSH_SEC, STATS_FLUSH_DIRTY = 10, 500
+try:
+	# /api/stat-incr is unauthenticated: per-user allowance of at most STATS_MAX_DELTA messages, refilled per minute
+	STATS_MAX_DELTA = int(os.getenv('STATS_MAX_DELTA', '50') or 50)
+	STATS_RATE_PER_MIN = int(os.getenv('STATS_RATE_PER_MIN', '120') or 120)
+except Exception:
+	STATS_MAX_DELTA, STATS_RATE_PER_MIN = 50, 120
+# Optional shared secret; when set, /api/stat-incr only accepts requests carrying it in X-Stats-Secret
+STATS_SECRET = os.getenv('STATS_SECRET', '')
+try:
+	MEMBER_NEGATIVE_TTL = int(os.getenv('MEMBER_NEGATIVE_TTL', '300') or 300)
+except Exception:
+	MEMBER_NEGATIVE_TTL = 300
+try:
+	MEMBER_STATUS_MAX_AGE = int(os.getenv('MEMBER_STATUS_MAX_AGE', '30') or 30)
+except Exception:
+	MEMBER_STATUS_MAX_AGE = 30
+try:
+	LEADERBOARD_SIZE = int(os.getenv('LEADERBOARD_SIZE', '25') or 25)
+except Exception:
+	LEADERBOARD_SIZE = 25
 
 # Admin role-only check (role 1402650246538072094)
+def _has_owner_role(interaction: discord.Interaction) -> bool:
+    try:
+        member = interaction.user if isinstance(interaction.user, discord.Member) else interaction.guild.get_member(interaction.user.id)
+        return bool(member and any(getattr(r, 'id', 0) == OWNER_ROLE_ID for r in getattr(member, 'roles', [])))
+    except Exception:
+        return False
+
 def owner_role_only():
     async def predicate(interaction: discord.Interaction) -> bool:
-        try:
-            member = interaction.user if isinstance(interaction.user, discord.Member) else interaction.guild.get_member(interaction.user.id)
-            return bool(member and any(getattr(r, 'id', 0) == OWNER_ROLE_ID for r in getattr(member, 'roles', [])))
-        except Exception:
-            return False
+        return _has_owner_role(interaction)
     return app_commands.check(predicate)
 
 # Webhook configuration for key notifications and selfbot launches
@@ -87,6 +135,8 @@ async def _message(content=None, embed=None, ephemeral=True, interaction=None):
             frame = frame.f_back
     if interaction is None:
         raise RuntimeError("No interaction found for _message()")
+    # Persist this tick's batched key writes before telling the user they happened
+    key_manager.flush_writes()
     try:
         if not interaction.response.is_done():
             await interaction.response.send_message(content=content, embed=embed, ephemeral=ephemeral)
@@ -152,22 +202,41 @@ BACKUP_FILE = os.path.join(DATA_DIR, "keys_backup.json")
 USAGE_FILE = os.path.join(DATA_DIR, "key_usage.json")
 DELETED_KEYS_FILE = os.path.join(DATA_DIR, "deleted_keys.json")
 LOGS_FILE = os.path.join(DATA_DIR, "key_logs.json")
+# Append-only journal of key mutations, folded into the files above on compaction
+JOURNAL_FILE = os.path.join(DATA_DIR, "keys_journal.jsonl")
+try:
+    JOURNAL_COMPACT_EVERY = int(os.getenv('JOURNAL_COMPACT_EVERY', '1000') or 1000)
+except Exception:
+    JOURNAL_COMPACT_EVERY = 1000
+# Storage backend for keys and the small JSON documents: "json" (files + journal) or "sqlite" (WAL)
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'json').strip().lower()
+SQLITE_PATH = os.getenv('SQLITE_PATH', os.path.join(DATA_DIR, "keys.db"))
+# Point-in-time snapshots (gzip, optionally delta-encoded against the last full one)
+SNAPSHOT_DIR = os.path.join(DATA_DIR, "backups")
+try:
+    SNAPSHOT_INTERVAL_SEC = int(os.getenv('SNAPSHOT_INTERVAL_SEC', '3600') or 3600)
+    SNAPSHOT_EVERY_MUTATIONS = int(os.getenv('SNAPSHOT_EVERY_MUTATIONS', '500') or 500)
+    SNAPSHOT_FULL_EVERY = int(os.getenv('SNAPSHOT_FULL_EVERY', '24') or 24)
+except Exception:
+    SNAPSHOT_INTERVAL_SEC, SNAPSHOT_EVERY_MUTATIONS, SNAPSHOT_FULL_EVERY = 3600, 500, 24
+SNAPSHOT_DELTA = (os.getenv('SNAPSHOT_DELTA', 'true').lower() in ('1','true','yes'))
+# Retention tiers as "bucket_seconds:count" pairs: hourly for a day, then daily for a month
+SNAPSHOT_RETENTION = os.getenv('SNAPSHOT_RETENTION', '3600:24,86400:30')
 # Simple site-wide chat storage
 CHAT_FILE = os.path.join(DATA_DIR, "chat_messages.json")
 ANN_FILE = os.path.join(DATA_DIR, "announcements.json")
 STATS_FILE = os.path.join(DATA_DIR, "selfbot_message_stats.json")
 CONFIG_FILE = os.path.join(DATA_DIR, "config.json")
+# Documents the storage backend keeps alongside the keys
+DOCUMENT_FILES = {
+    "chat_messages": CHAT_FILE,
+    "announcements": ANN_FILE,
+    "selfbot_message_stats": STATS_FILE,
+}
 # Active selfbot user tracking (heartbeat)
 ACTIVE_SELF_USERS: dict[str, int] = {}
 ACTIVE_WINDOW_SEC = 300  # 5 minutes
 MESSAGES_THRESHOLD = int(os.getenv('MESSAGES_THRESHOLD', '2500') or 2500)
-MESSAGE_STATS: Dict[str, int] = {}
-try:
-    if os.path.exists(STATS_FILE):
-        with open(STATS_FILE, 'r') as f:
-            MESSAGE_STATS = json.load(f) or {}
-except Exception:
-    MESSAGE_STATS = {}
 
 # Config helpers
 CONFIG: dict = {}
@@ -200,6 +269,83 @@ try:
 except Exception:
     pass
 
+class HttpClient:
+    """Shared pooled aiohttp session for outbound webhooks and uploads: timeouts, jittered retries, 429 retry_after."""
+
+    def __init__(self, timeout: float = 10.0, retries: int = 3, limit: int = 20):
+        self.timeout = timeout
+        self.retries = max(0, retries)
+        self.limit = limit
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._counters = {'requests': 0, 'retries': 0, 'rate_limited': 0, 'failures': 0}
+
+    async def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.limit, ttl_dns_cache=300),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+        return self._session
+
+    @staticmethod
+    def _backoff(attempt: int) -> float:
+        # Full jitter around an exponential base so retries from parallel senders spread out
+        return min(30.0, 0.5 * (2 ** attempt)) * random.uniform(0.5, 1.5)
+
+    async def post(self, url: str, *, json: Optional[dict] = None, files: Optional[list] = None, timeout: Optional[float] = None) -> Optional[int]:
+        """POST with retries; returns the final status code, or None if every attempt failed.
+
+        files: [(field, filename, bytes, content_type)], rebuilt as multipart on each attempt.
+        """
+        session = await self.session()
+        last_error = None
+        for attempt in range(self.retries + 1):
+            self._counters['requests'] += 1
+            data = None
+            if files:
+                data = aiohttp.FormData()
+                for field, filename, content, content_type in files:
+                    data.add_field(field, content, filename=filename, content_type=content_type)
+            try:
+                async with session.post(url, json=json, data=data,
+                                        timeout=aiohttp.ClientTimeout(total=timeout or self.timeout)) as resp:
+                    if resp.status == 429:
+                        self._counters['rate_limited'] += 1
+                        retry_after = 1.0
+                        try:
+                            retry_after = float((await resp.json(content_type=None)).get('retry_after', retry_after))
+                        except Exception:
+                            try:
+                                retry_after = float(resp.headers.get('Retry-After', retry_after))
+                            except Exception:
+                                pass
+                        if attempt < self.retries:
+                            self._counters['retries'] += 1
+                            await asyncio.sleep(retry_after + random.uniform(0, 0.25))
+                            continue
+                        return resp.status
+                    if resp.status >= 500:
+                        last_error = f"HTTP {resp.status}"
+                    else:
+                        return resp.status
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                last_error = str(e) or type(e).__name__
+            if attempt < self.retries:
+                self._counters['retries'] += 1
+                await asyncio.sleep(self._backoff(attempt))
+        self._counters['failures'] += 1
+        print(f"⚠️ POST {urllib.parse.urlsplit(url).netloc} failed after {self.retries + 1} attempts: {last_error}")
+        return None
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+    def stats(self) -> dict:
+        return dict(self._counters)
+
+http_client = HttpClient(HTTP_TIMEOUT_SEC, HTTP_RETRIES)
+
 async def send_status_webhook(event_name: str):
     try:
         url = (CONFIG.get('STATUS_WEBHOOK_URL') or '').strip()
@@ -215,79 +361,1423 @@ async def send_status_webhook(event_name: str):
             ],
             'timestamp': datetime.datetime.utcnow().isoformat()
         }
-        requests.post(url, json={'embeds':[embed]}, timeout=6)
+        await http_client.post(url, json={'embeds':[embed]}, timeout=6)
     except Exception:
         pass
 
+def _apply_journal_entry(state: dict, entry: dict):
+    """Apply one journal entry to a {'keys','usage','deleted','logs'} state dict"""
+    op = entry.get('op')
+    if op == 'log':
+        state['logs'].append(entry.get('entry') or {})
+        if len(state['logs']) > 1000:
+            state['logs'] = state['logs'][-1000:]
+        return
+    key = entry.get('key')
+    if not key:
+        return
+    if op == 'delete':
+        state['keys'].pop(key, None)
+        state['usage'].pop(key, None)
+        state['deleted'][key] = entry.get('deleted') or {}
+        return
+    data = entry.get('data')
+    if data is None:
+        state['keys'].pop(key, None)
+        state['usage'].pop(key, None)
+        return
+    state['keys'][key] = data
+    if entry.get('usage') is not None:
+        state['usage'][key] = entry['usage']
+
+class JsonStorage:
+    """JSON snapshot files in DATA_DIR plus an append-only journal of mutations."""
+
+    name = "json"
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        # Serializes snapshot file writes; taken before _lock so appends never wait on a compaction
+        self._files_lock = threading.Lock()
+        self._entries = 0
+        self._generation = 0
+
+    @staticmethod
+    def _rotated_path() -> str:
+        return f"{JOURNAL_FILE}.old"
+
+    def load(self) -> dict:
+        """Load the last snapshot and replay the journal (a rotated one first) on top of it"""
+        state = {'keys': {}, 'usage': {}, 'deleted': {}, 'logs': []}
+        for field, path in (('keys', KEYS_FILE), ('usage', USAGE_FILE), ('deleted', DELETED_KEYS_FILE), ('logs', LOGS_FILE)):
+            if os.path.exists(path):
+                with open(path, 'r') as f:
+                    state[field] = json.load(f)
+        self._entries = 0
+        for path in (self._rotated_path(), JOURNAL_FILE):
+            self._entries += self._replay(state, path)
+            self._trim_torn_tail(path)
+        return state
+
+    @staticmethod
+    def _trim_torn_tail(path: str):
+        # Drop a half-written last line so later appends don't land behind it
+        try:
+            with open(path, 'rb+') as f:
+                data = f.read()
+                if data and not data.endswith(b'\n'):
+                    f.truncate(data.rfind(b'\n') + 1)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"Error trimming journal {path}: {e}")
+
+    def _replay(self, state: dict, path: str) -> int:
+        if not os.path.exists(path):
+            return 0
+        applied = 0
+        try:
+            with open(path, 'r') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        entry = json.loads(line)
+                    except Exception:
+                        # Torn trailing write from a crash; everything before it is intact
+                        break
+                    _apply_journal_entry(state, entry)
+                    applied += 1
+        except Exception as e:
+            print(f"Error replaying journal: {e}")
+        if applied:
+            print(f"♻️ Replayed {applied} journal entries")
+        return applied
+
+    def append(self, entries: list[dict]) -> bool:
+        """Append entries to the journal; returns True once it is due for compaction"""
+        with self._lock:
+            with open(JOURNAL_FILE, 'a') as f:
+                f.write(''.join(json.dumps(e, separators=(',', ':')) + '\n' for e in entries))
+            self._entries += len(entries)
+            return self._entries >= JOURNAL_COMPACT_EVERY
+
+    def rotate(self) -> int:
+        """Move the journal aside and start a fresh one; returns the generation to pass to write_compacted()"""
+        with self._lock:
+            rotated = self._rotated_path()
+            if os.path.exists(rotated):
+                # An earlier compaction hasn't landed yet (or crashed): the rotated journal must cover both
+                if os.path.exists(JOURNAL_FILE):
+                    with open(JOURNAL_FILE, 'r') as src, open(rotated, 'a') as dst:
+                        dst.write(src.read())
+                    os.remove(JOURNAL_FILE)
+            elif os.path.exists(JOURNAL_FILE):
+                os.replace(JOURNAL_FILE, rotated)
+            self._entries = 0
+            self._generation += 1
+            return self._generation
+
+    @staticmethod
+    def _write_files(keys: dict, usage: dict, deleted: dict, logs: list):
+        # Atomic writes via temp files and replace
+        def atomic_write(path: str, data):
+            tmp = f"{path}.tmp"
+            with open(tmp, 'w') as f:
+                json.dump(data, f, separators=(',', ':'))
+            os.replace(tmp, path)
+        atomic_write(KEYS_FILE, keys)
+        atomic_write(USAGE_FILE, usage)
+        atomic_write(DELETED_KEYS_FILE, deleted)
+        atomic_write(LOGS_FILE, logs)
+
+    def write_compacted(self, generation: int, keys: dict, usage: dict, deleted: dict, logs: list) -> bool:
+        """Write the state as of rotate() and drop the rotated journal; safe to run off the event loop"""
+        with self._files_lock:
+            if generation != self._generation:
+                # A newer rotation or full write supersedes this one
+                return False
+            self._write_files(keys, usage, deleted, logs)
+            with self._lock:
+                if generation == self._generation:
+                    try:
+                        os.remove(self._rotated_path())
+                    except FileNotFoundError:
+                        pass
+            return True
+
+    def write_all(self, keys: dict, usage: dict, deleted: dict, logs: list):
+        """Fold everything into fresh snapshot files and truncate the journal"""
+        with self._files_lock, self._lock:
+            self._generation += 1
+            self._write_files(keys, usage, deleted, logs)
+            # Snapshot is durable, the journal can start over
+            tmp = f"{JOURNAL_FILE}.tmp"
+            open(tmp, 'w').close()
+            os.replace(tmp, JOURNAL_FILE)
+            try:
+                os.remove(self._rotated_path())
+            except FileNotFoundError:
+                pass
+            self._entries = 0
+
+    @staticmethod
+    def _document_path(name: str) -> str:
+        return DOCUMENT_FILES.get(name) or os.path.join(DATA_DIR, f"{name}.json")
+
+    def load_document(self, name: str, default=None):
+        try:
+            path = self._document_path(name)
+            if os.path.exists(path):
+                with open(path, 'r') as f:
+                    return json.load(f)
+        except Exception as e:
+            print(f"Error loading {name}: {e}")
+        return default
+
+    def save_document(self, name: str, value):
+        path = self._document_path(name)
+        tmp = f"{path}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(value, f, indent=2)
+        os.replace(tmp, path)
+
+class SqliteStorage:
+    """SQLite backend in WAL mode: one row per key, indexed columns and one transaction per batch."""
+
+    name = "sqlite"
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS keys (
+            key TEXT PRIMARY KEY,
+            user_id INTEGER NOT NULL DEFAULT 0,
+            machine_id TEXT,
+            key_type TEXT,
+            is_active INTEGER NOT NULL DEFAULT 1,
+            expiration_time INTEGER,
+            data TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_keys_user ON keys(user_id);
+        CREATE INDEX IF NOT EXISTS idx_keys_machine ON keys(machine_id);
+        CREATE INDEX IF NOT EXISTS idx_keys_type ON keys(key_type, is_active);
+        CREATE INDEX IF NOT EXISTS idx_keys_expiry ON keys(expiration_time);
+        CREATE TABLE IF NOT EXISTS key_usage (key TEXT PRIMARY KEY, data TEXT NOT NULL);
+        CREATE TABLE IF NOT EXISTS deleted_keys (key TEXT PRIMARY KEY, deleted_at INTEGER, data TEXT NOT NULL);
+        CREATE TABLE IF NOT EXISTS key_logs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ts INTEGER,
+            event TEXT,
+            key TEXT,
+            data TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS documents (name TEXT PRIMARY KEY, data TEXT NOT NULL);
+    """
+
+    def __init__(self, path: str):
+        import sqlite3
+        self.path = path
+        self._lock = threading.RLock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(self.SCHEMA)
+
+    def _tx(self):
+        storage = self
+
+        class _Tx:
+            def __enter__(self):
+                storage._lock.acquire()
+                storage.conn.execute("BEGIN IMMEDIATE")
+                return storage.conn
+
+            def __exit__(self, exc_type, exc, tb):
+                try:
+                    storage.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+                finally:
+                    storage._lock.release()
+                return False
+        return _Tx()
+
+    @staticmethod
+    def _dumps(value) -> str:
+        return json.dumps(value, separators=(',', ':'))
+
+    @classmethod
+    def _key_row(cls, key: str, data: dict) -> tuple:
+        mid = data.get('machine_id')
+        return (
+            key,
+            int(data.get('user_id', 0) or 0),
+            (str(mid) if mid else None),
+            data.get('key_type', 'general'),
+            1 if data.get('is_active', False) else 0,
+            data.get('expiration_time'),
+            cls._dumps(data),
+        )
+
+    def load(self) -> dict:
+        with self._lock:
+            c = self.conn
+            return {
+                'keys': {k: json.loads(d) for k, d in c.execute("SELECT key, data FROM keys")},
+                'usage': {k: json.loads(d) for k, d in c.execute("SELECT key, data FROM key_usage")},
+                'deleted': {k: json.loads(d) for k, d in c.execute("SELECT key, data FROM deleted_keys")},
+                'logs': [json.loads(d) for (d,) in c.execute("SELECT data FROM key_logs ORDER BY id")],
+            }
+
+    def append(self, entries: list[dict]) -> bool:
+        """Apply a batch of journal entries as one transaction"""
+        with self._tx() as c:
+            logged = False
+            for e in entries:
+                op = e.get('op')
+                if op == 'log':
+                    entry = e.get('entry') or {}
+                    c.execute("INSERT INTO key_logs (ts, event, key, data) VALUES (?, ?, ?, ?)",
+                              (entry.get('ts'), entry.get('event'), entry.get('key'), self._dumps(entry)))
+                    logged = True
+                    continue
+                key = e.get('key')
+                if not key:
+                    continue
+                data = e.get('data')
+                if op == 'delete' or data is None:
+                    c.execute("DELETE FROM keys WHERE key = ?", (key,))
+                    c.execute("DELETE FROM key_usage WHERE key = ?", (key,))
+                    if op == 'delete':
+                        deleted = e.get('deleted') or {}
+                        c.execute("INSERT OR REPLACE INTO deleted_keys (key, deleted_at, data) VALUES (?, ?, ?)",
+                                  (key, deleted.get('deleted_at'), self._dumps(deleted)))
+                    continue
+                c.execute("INSERT OR REPLACE INTO keys VALUES (?, ?, ?, ?, ?, ?, ?)", self._key_row(key, data))
+                if e.get('usage') is not None:
+                    c.execute("INSERT OR REPLACE INTO key_usage (key, data) VALUES (?, ?)", (key, self._dumps(e['usage'])))
+            if logged:
+                c.execute("DELETE FROM key_logs WHERE id <= (SELECT MAX(id) FROM key_logs) - 1000")
+        return False
+
+    def write_all(self, keys: dict, usage: dict, deleted: dict, logs: list):
+        """Replace the stored state wholesale (restores and imports)"""
+        with self._tx() as c:
+            c.execute("DELETE FROM keys")
+            c.execute("DELETE FROM key_usage")
+            c.execute("DELETE FROM deleted_keys")
+            c.execute("DELETE FROM key_logs")
+            c.executemany("INSERT INTO keys VALUES (?, ?, ?, ?, ?, ?, ?)", (self._key_row(k, d) for k, d in keys.items()))
+            c.executemany("INSERT INTO key_usage (key, data) VALUES (?, ?)", ((k, self._dumps(d)) for k, d in usage.items()))
+            c.executemany("INSERT INTO deleted_keys (key, deleted_at, data) VALUES (?, ?, ?)",
+                          ((k, d.get('deleted_at'), self._dumps(d)) for k, d in deleted.items()))
+            c.executemany("INSERT INTO key_logs (ts, event, key, data) VALUES (?, ?, ?, ?)",
+                          ((e.get('ts'), e.get('event'), e.get('key'), self._dumps(e)) for e in logs[-1000:]))
+
+    def load_document(self, name: str, default=None):
+        with self._lock:
+            row = self.conn.execute("SELECT data FROM documents WHERE name = ?", (name,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def save_document(self, name: str, value):
+        with self._lock:
+            self.conn.execute("INSERT OR REPLACE INTO documents (name, data) VALUES (?, ?)", (name, self._dumps(value)))
+
+    def import_json(self, source: JsonStorage) -> bool:
+        """One-shot import of the JSON file layout into an empty database"""
+        with self._lock:
+            if self.load_document("_imported_from_json") is not None:
+                return False
+            has_keys = self.conn.execute("SELECT 1 FROM keys LIMIT 1").fetchone()
+            count = 0
+            if not has_keys:
+                state = source.load()
+                self.write_all(state['keys'], state['usage'], state['deleted'], state['logs'])
+                for name in DOCUMENT_FILES:
+                    value = source.load_document(name)
+                    if value is not None:
+                        self.save_document(name, value)
+                count = len(state['keys'])
+                print(f"📦 Imported {count} keys from JSON files into {self.path}")
+            self.save_document("_imported_from_json", {'ts': int(time.time()), 'keys': count})
+            return True
+
+def open_storage():
+    """Create the storage backend selected by STORAGE_BACKEND"""
+    if STORAGE_BACKEND == 'sqlite':
+        try:
+            store = SqliteStorage(SQLITE_PATH)
+            store.import_json(JsonStorage())
+            return store
+        except Exception as e:
+            print(f"⚠️ SQLite storage unavailable ({e}); falling back to JSON files")
+    return JsonStorage()
+
+# Built-in key tiers for bulk generation: key_type -> duration_days
+KEY_TIERS = {"daily": 1, "weekly": 7, "monthly": 30, "lifetime": 365}
+BUILTIN_KEY_TYPES = (*KEY_TIERS, "general")
+
+_MISSING = object()
+
+class KeyRecord(MutableMapping):
+    """One key's fields and usage counters in a __slots__ object that reads and writes like the old dict."""
+
+    FIELDS = ("user_id", "channel_id", "created_time", "activation_time", "expiration_time",
+              "duration_days", "key_type", "is_active", "machine_id", "activated_by", "created_by")
+    USAGE_FIELDS = ("created", "activated", "last_used", "usage_count")
+    __slots__ = FIELDS + tuple(f"u_{f}" for f in USAGE_FIELDS) + ("_extra", "_usage_extra", "has_usage")
+    _FIELD_SET = frozenset(FIELDS)
+    _USAGE_SET = frozenset(USAGE_FIELDS)
+
+    def __init__(self, data: Optional[dict] = None, usage: Optional[dict] = None):
+        for name in self.FIELDS:
+            setattr(self, name, _MISSING)
+        for name in self.USAGE_FIELDS:
+            setattr(self, f"u_{name}", _MISSING)
+        self._extra = None
+        self._usage_extra = None
+        self.has_usage = False
+        if data:
+            for name, value in data.items():
+                self[name] = value
+        if usage is not None:
+            self.set_usage(usage)
+
+    def __getitem__(self, name):
+        if name in self._FIELD_SET:
+            value = getattr(self, name)
+            if value is not _MISSING:
+                return value
+        elif self._extra and name in self._extra:
+            return self._extra[name]
+        raise KeyError(name)
+
+    def get(self, name, default=None):
+        if name in self._FIELD_SET:
+            value = getattr(self, name)
+            return default if value is _MISSING else value
+        if self._extra:
+            return self._extra.get(name, default)
+        return default
+
+    def __setitem__(self, name, value):
+        if name in self._FIELD_SET:
+            if name == "key_type" and isinstance(value, str):
+                value = sys.intern(value)
+            setattr(self, name, value)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[name] = value
+
+    def __delitem__(self, name):
+        if name in self._FIELD_SET and getattr(self, name) is not _MISSING:
+            setattr(self, name, _MISSING)
+        elif self._extra and name in self._extra:
+            del self._extra[name]
+        else:
+            raise KeyError(name)
+
+    def __iter__(self):
+        for name in self.FIELDS:
+            if getattr(self, name) is not _MISSING:
+                yield name
+        if self._extra:
+            yield from list(self._extra)
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __contains__(self, name):
+        return self.get(name, _MISSING) is not _MISSING
+
+    def __repr__(self):
+        return f"KeyRecord({self.to_dict()!r})"
+
+    def copy(self) -> dict:
+        return self.to_dict()
+
+    def to_dict(self) -> dict:
+        out = {}
+        for name in self.FIELDS:
+            value = getattr(self, name)
+            if value is not _MISSING:
+                out[name] = value
+        if self._extra:
+            out.update(self._extra)
+        return out
+
+    @property
+    def usage(self) -> "KeyUsage":
+        return KeyUsage(self)
+
+    def set_usage(self, usage: dict):
+        for name in self.USAGE_FIELDS:
+            setattr(self, f"u_{name}", _MISSING)
+        self._usage_extra = None
+        self.has_usage = True
+        view = KeyUsage(self)
+        for name, value in usage.items():
+            view[name] = value
+
+    def clear_usage(self):
+        for name in self.USAGE_FIELDS:
+            setattr(self, f"u_{name}", _MISSING)
+        self._usage_extra = None
+        self.has_usage = False
+
+    def usage_dict(self) -> dict:
+        out = {}
+        for name in self.USAGE_FIELDS:
+            value = getattr(self, f"u_{name}")
+            if value is not _MISSING:
+                out[name] = value
+        if self._usage_extra:
+            out.update(self._usage_extra)
+        return out
+
+class KeyUsage(MutableMapping):
+    """Dict-compatible view of a KeyRecord's usage counters"""
+
+    __slots__ = ("record",)
+
+    def __init__(self, record: KeyRecord):
+        self.record = record
+
+    def __getitem__(self, name):
+        r = self.record
+        if name in KeyRecord._USAGE_SET:
+            value = getattr(r, f"u_{name}")
+            if value is not _MISSING:
+                return value
+        elif r._usage_extra and name in r._usage_extra:
+            return r._usage_extra[name]
+        raise KeyError(name)
+
+    def __setitem__(self, name, value):
+        r = self.record
+        r.has_usage = True
+        if name in KeyRecord._USAGE_SET:
+            setattr(r, f"u_{name}", value)
+        else:
+            if r._usage_extra is None:
+                r._usage_extra = {}
+            r._usage_extra[name] = value
+
+    def __delitem__(self, name):
+        r = self.record
+        if name in KeyRecord._USAGE_SET and getattr(r, f"u_{name}") is not _MISSING:
+            setattr(r, f"u_{name}", _MISSING)
+        elif r._usage_extra and name in r._usage_extra:
+            del r._usage_extra[name]
+        else:
+            raise KeyError(name)
+
+    def __iter__(self):
+        return iter(self.record.usage_dict())
+
+    def __len__(self):
+        return len(self.record.usage_dict())
+
+    def __repr__(self):
+        return f"KeyUsage({self.record.usage_dict()!r})"
+
+    def copy(self) -> dict:
+        return self.record.usage_dict()
+
+class KeyUsageView(MutableMapping):
+    """key -> usage mapping backed by the KeyRecords in KeyManager.keys (what key_usage used to be)"""
+
+    __slots__ = ("_manager",)
+
+    def __init__(self, manager: "KeyManager"):
+        self._manager = manager
+
+    def __getitem__(self, key):
+        rec = self._manager.keys.get(key)
+        if rec is None or not rec.has_usage:
+            raise KeyError(key)
+        return KeyUsage(rec)
+
+    def __setitem__(self, key, usage):
+        self._manager.keys[key].set_usage(usage)
+
+    def __delitem__(self, key):
+        rec = self._manager.keys.get(key)
+        if rec is None or not rec.has_usage:
+            raise KeyError(key)
+        rec.clear_usage()
+
+    def __contains__(self, key):
+        rec = self._manager.keys.get(key)
+        return rec is not None and rec.has_usage
+
+    def __iter__(self):
+        return (k for k, rec in list(self._manager.keys.items()) if rec.has_usage)
+
+    def __len__(self):
+        return sum(1 for rec in self._manager.keys.values() if rec.has_usage)
+
+    def to_dict(self) -> dict:
+        return {k: rec.usage_dict() for k, rec in self._manager.keys.items() if rec.has_usage}
+
+def benchmark_memory(count: int = 100_000) -> dict:
+    """Measure traced memory for `count` keys held as dict pairs (old layout) vs KeyRecords"""
+    import gc
+    import tracemalloc
+    now = int(time.time())
+    types = tuple(KEY_TIERS)
+
+    def sample(i: int):
+        data = {
+            "user_id": 100000000000000000 + i,
+            "channel_id": None,
+            "created_time": now - i,
+            "activation_time": now - i,
+            "expiration_time": now + 86400 * 30,
+            "duration_days": 30,
+            "key_type": types[i % len(types)],
+            "is_active": True,
+            "machine_id": f"machine-{i:08d}",
+            "activated_by": 100000000000000000 + i,
+            "created_by": 0,
+        }
+        usage = {"created": now - i, "activated": now - i, "last_used": now, "usage_count": i % 7}
+        return data, usage
+
+    results = {}
+    for layout in ("dicts", "records"):
+        gc.collect()
+        tracemalloc.start()
+        if layout == "dicts":
+            keys, usage = {}, {}
+            for i in range(count):
+                keys[f"key-{i:08d}"], usage[f"key-{i:08d}"] = sample(i)
+            held = (keys, usage)
+        else:
+            held = {f"key-{i:08d}": KeyRecord(*sample(i)) for i in range(count)}
+        current, _peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results[layout] = {"bytes": current, "bytes_per_key": current // max(1, count)}
+        del held
+    results["count"] = count
+    results["saving_pct"] = round(100 * (1 - results["records"]["bytes"] / max(1, results["dicts"]["bytes"])), 1)
+    return results
+
+KEY_STATUSES = ("unassigned", "active", "expired", "revoked")
+
+def key_status(data: dict, now: Optional[int] = None) -> str:
+    """Classify a key record as unassigned, active, expired or revoked"""
+    if not data.get("is_active", False):
+        return "revoked"
+    now = int(time.time()) if now is None else now
+    exp = int(data.get("expiration_time") or 0)
+    if exp and exp <= now:
+        return "expired"
+    if not int(data.get("user_id", 0) or 0):
+        return "unassigned"
+    return "active"
+
+class SnapshotStore:
+    """Periodic gzip snapshots of KeyManager state with tiered retention and an index file."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.index_path = os.path.join(directory, "index.json")
+        self.index: list[dict] = []
+        self._lock = threading.RLock()
+        self._pending = 0
+        self._dirty_keys: set[str] = set()
+        self._deltas_since_full = 0
+        self._taking = False
+        self._last_version = -1
+        self.tiers = self._parse_tiers(SNAPSHOT_RETENTION)
+        self._load_index()
+
+    @staticmethod
+    def _parse_tiers(spec: str) -> list[tuple[int, int]]:
+        tiers = []
+        for part in (spec or '').split(','):
+            try:
+                bucket, count = part.split(':', 1)
+                tiers.append((max(1, int(bucket)), max(0, int(count))))
+            except Exception:
+                continue
+        return tiers or [(3600, 24), (86400, 30)]
+
+    def _load_index(self):
+        try:
+            if os.path.exists(self.index_path):
+                with open(self.index_path, 'r') as f:
+                    data = json.load(f)
+                if isinstance(data, list):
+                    self.index = sorted(data, key=lambda e: e.get('ts', 0))
+        except Exception as e:
+            print(f"Error loading snapshot index: {e}")
+            self.index = []
+        # A delta is only useful relative to the current base; start the next round with a full snapshot
+        self._deltas_since_full = SNAPSHOT_FULL_EVERY
+
+    def _save_index(self):
+        tmp = f"{self.index_path}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(self.index, f, separators=(',', ':'))
+        os.replace(tmp, self.index_path)
+
+    def list(self) -> list[dict]:
+        """Snapshot metadata, newest first"""
+        with self._lock:
+            return list(reversed(self.index))
+
+    def note_mutation(self, keys) -> None:
+        with self._lock:
+            self._pending += 1
+            self._dirty_keys.update(keys)
+
+    def due(self) -> bool:
+        """Whether the mutation-count or time cadence calls for a snapshot (and none is being written)"""
+        with self._lock:
+            if not self._pending or self._taking:
+                return False
+            last_ts = self.index[-1]['ts'] if self.index else 0
+            return self._pending >= SNAPSHOT_EVERY_MUTATIONS or int(time.time()) - last_ts >= SNAPSHOT_INTERVAL_SEC
+
+    def capture(self) -> tuple[set, int]:
+        """Dirty keys and mutation count covered by a state copy taken now (call under the manager's write lock)"""
+        with self._lock:
+            self._taking = True
+            return set(self._dirty_keys), self._pending
+
+    def take(self, snap: dict, captured: tuple[set, int], force_full: bool = False) -> Optional[dict]:
+        """Write snap (KeyManager.snapshot()) as a snapshot and apply retention; safe to run off the event loop"""
+        dirty, pending = captured
+        with self._lock:
+            try:
+                if snap['version'] < self._last_version:
+                    # A newer state was written meanwhile
+                    return None
+                os.makedirs(self.directory, exist_ok=True)
+                ts = int(time.time())
+                if self.index and self.index[-1]['ts'] >= ts:
+                    ts = self.index[-1]['ts'] + 1
+                base = self._latest_full()
+                use_delta = (SNAPSHOT_DELTA and not force_full and base is not None
+                             and self._deltas_since_full < SNAPSHOT_FULL_EVERY)
+                if use_delta:
+                    body = {'ts': ts, 'kind': 'delta', 'base': base['ts'], 'keys': {}, 'usage': {}, 'deleted': {}, 'removed': []}
+                    for k in dirty:
+                        if k in snap['keys']:
+                            body['keys'][k] = snap['keys'][k]
+                            if k in snap['usage']:
+                                body['usage'][k] = snap['usage'][k]
+                        else:
+                            body['removed'].append(k)
+                        if k in snap['deleted']:
+                            body['deleted'][k] = snap['deleted'][k]
+                    fname = f"keys_{ts}.delta.json.gz"
+                else:
+                    body = {'ts': ts, 'kind': 'full', 'keys': snap['keys'], 'usage': snap['usage'], 'deleted': snap['deleted']}
+                    fname = f"keys_{ts}.json.gz"
+                raw = json.dumps(body, separators=(',', ':')).encode()
+                path = os.path.join(self.directory, fname)
+                with gzip.open(f"{path}.tmp", 'wb', compresslevel=6) as f:
+                    f.write(raw)
+                os.replace(f"{path}.tmp", path)
+                entry = {
+                    'ts': ts,
+                    'file': fname,
+                    'kind': body['kind'],
+                    'base': body.get('base'),
+                    'keys': len(snap['keys']),
+                    'bytes': os.path.getsize(path),
+                }
+                self.index.append(entry)
+                self._last_version = snap['version']
+                # Mutations noted after the capture stay pending for the next snapshot
+                self._pending = max(0, self._pending - pending)
+                if use_delta:
+                    # Deltas are cumulative against the base, so keep the dirty set until the next full one
+                    self._deltas_since_full += 1
+                else:
+                    self._dirty_keys -= dirty
+                    self._deltas_since_full = 0
+                self._apply_retention()
+                self._save_index()
+                return entry
+            except Exception as e:
+                print(f"Error writing snapshot: {e}")
+                return None
+            finally:
+                self._taking = False
+
+    def _latest_full(self) -> Optional[dict]:
+        for e in reversed(self.index):
+            if e.get('kind') == 'full':
+                return e
+        return None
+
+    def _apply_retention(self):
+        if not self.index:
+            return
+        keep: set[int] = {self.index[-1]['ts']}
+        for bucket, count in self.tiers:
+            seen: set[int] = set()
+            for e in reversed(self.index):
+                b = e['ts'] // bucket
+                if b in seen:
+                    continue
+                if len(seen) >= count:
+                    break
+                seen.add(b)
+                keep.add(e['ts'])
+        # Retained deltas need their base
+        keep.update(e['base'] for e in self.index if e['ts'] in keep and e.get('kind') == 'delta' and e.get('base'))
+        latest_full = self._latest_full()
+        if latest_full:
+            keep.add(latest_full['ts'])
+        kept = []
+        for e in self.index:
+            if e['ts'] in keep:
+                kept.append(e)
+                continue
+            try:
+                os.remove(os.path.join(self.directory, e['file']))
+            except FileNotFoundError:
+                pass
+            except Exception as ex:
+                print(f"Failed to prune snapshot {e.get('file')}: {ex}")
+        self.index = kept
+
+    def _read(self, entry: dict) -> dict:
+        with gzip.open(os.path.join(self.directory, entry['file']), 'rb') as f:
+            return json.loads(f.read().decode('utf-8'))
+
+    def load(self, ts: int) -> Optional[dict]:
+        """Return a restorable payload for the snapshot taken at ts"""
+        with self._lock:
+            entry = next((e for e in self.index if e['ts'] == int(ts)), None)
+            if not entry:
+                return None
+            body = self._read(entry)
+            if body.get('kind') != 'delta':
+                return {'timestamp': body.get('ts'), 'keys': body.get('keys') or {}, 'usage': body.get('usage') or {}, 'deleted': body.get('deleted') or {}}
+            base_entry = next((e for e in self.index if e['ts'] == body.get('base')), None)
+            if not base_entry:
+                return None
+            base = self._read(base_entry)
+            keys = base.get('keys') or {}
+            usage = base.get('usage') or {}
+            deleted = base.get('deleted') or {}
+            for k in body.get('removed') or []:
+                keys.pop(k, None)
+                usage.pop(k, None)
+            keys.update(body.get('keys') or {})
+            usage.update(body.get('usage') or {})
+            deleted.update(body.get('deleted') or {})
+            return {'timestamp': body.get('ts'), 'keys': keys, 'usage': usage, 'deleted': deleted}
+
+class TopK:
+    """Scores by id with the best `size` kept sorted; O(log K) per update, full re-rank only when a top entry falls below the cut"""
+
+    def __init__(self, size: int):
+        self.size = max(1, size)
+        self.scores: dict = {}
+        self._top: list[tuple] = []  # ascending (-score, id), i.e. best first
+        self._ranked: dict = {}
+        self._stale = False
+        self._lock = threading.Lock()
+        self.rebuilds = 0
+
+    def set(self, ident, score: int):
+        with self._lock:
+            if score > 0:
+                self.scores[ident] = score
+            else:
+                self.scores.pop(ident, None)
+            old = self._ranked.pop(ident, None)
+            if old is not None:
+                cut = self._top[-1]
+                self._top.pop(bisect.bisect_left(self._top, (-old, ident)))
+                if score < old and len(self.scores) > len(self._top) + (score > 0):
+                    # Entries outside the list may now outrank this one unless it is still ahead of the old cut
+                    if not (score > 0 and ident != cut[1] and (-score, ident) < cut):
+                        self._stale = True
+            if self._stale or score <= 0:
+                return
+            entry = (-score, ident)
+            if len(self._top) < self.size or entry < self._top[-1]:
+                bisect.insort(self._top, entry)
+                self._ranked[ident] = score
+                if len(self._top) > self.size:
+                    self._ranked.pop(self._top.pop()[1], None)
+
+    def reset(self, scores: dict):
+        with self._lock:
+            self.scores = {i: s for i, s in scores.items() if s > 0}
+            self._rebuild()
+
+    def _rebuild(self):
+        self._top = heapq.nsmallest(self.size, ((-s, i) for i, s in self.scores.items()))
+        self._ranked = {i: -neg for neg, i in self._top}
+        self._stale = False
+        self.rebuilds += 1
+
+    def top(self, limit: int) -> list[tuple]:
+        """[(id, score), ...] best first, at most min(limit, size) entries"""
+        with self._lock:
+            if self._stale:
+                self._rebuild()
+            return [(i, -neg) for neg, i in self._top[:limit]]
+
+    def rank(self, ident) -> Optional[int]:
+        """1-based position of ident, or None when it is outside the top"""
+        with self._lock:
+            if self._stale:
+                self._rebuild()
+            score = self._ranked.get(ident)
+            if score is None:
+                return None
+            return bisect.bisect_left(self._top, (-score, ident)) + 1
+
+    def __len__(self) -> int:
+        return len(self.scores)
+
+def _writes(method):
+    """Run a KeyManager mutation under its single-writer lock"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.write_lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
 class KeyManager:
     def __init__(self):
-        self.keys = {}
-        self.key_usage = {}
+        # Single writer: every mutation (here or in callers editing records) holds write_lock.
+        # Readers use the live dicts for point lookups or snapshot() for a consistent whole-state copy.
+        self.write_lock = threading.RLock()
+        self.version = 0
+        self._snapshot: Optional[dict] = None
+        # Keys written since the last snapshot() (None: rebuild it from scratch)
+        self._snapshot_dirty: Optional[set[str]] = None
+        # Journal entries of this loop tick; flush_writes() persists them as one batch
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._pending_entries: list[dict] = []
+        self._flush_scheduled = False
+        self.write_batches = 0
+        self.keys: dict[str, KeyRecord] = {}
+        self.key_usage = KeyUsageView(self)  # usage lives on the KeyRecord; this keeps the old key -> dict access
         self.deleted_keys = {}
         self.key_logs: list[dict] = []
         self.last_generated = None  # In-memory cache of last generated keys for web UI panel
+        self.last_bulk_stats: dict = {}
+        self.storage = open_storage()
+        self.snapshots = SnapshotStore(SNAPSHOT_DIR)
+        # Secondary indexes (key sets) kept in step with every mutation via commit()/_reindex()
+        self._index_lock = threading.RLock()
+        self._indexed: dict[str, tuple] = {}
+        self._by_user: dict[int, set[str]] = {}
+        self._by_machine: dict[str, set[str]] = {}
+        self._by_type: dict[str, set[str]] = {}
+        self._by_status: dict[str, set[str]] = {st: set() for st in KEY_STATUSES}
+        # Min-heap of (expiration_time, key) for keys that can still lapse; stale entries are skipped on pop
+        self._expiry_heap: list[tuple[int, str]] = []
+        self._expiry_wakeup = None
+        # Aggregate counters adjusted by _reindex from each key's old/new contribution
+        self._active_by_type: dict[str, int] = {}
+        self._available_by_type: dict[str, int] = {}
+        self._usage_total = 0
+        # Usage summed per owner, ranked for /leaderboard and /api/leaderboard
+        self._usage_by_user: dict[int, int] = {}
+        self.usage_board = TopK(LEADERBOARD_SIZE)
+        self._ranking_paused = False
+        # Prefix index: sorted live keys (new keys are merged in on the next lookup) and a lazily sorted deleted list
+        self._key_order: list[str] = []
+        self._key_order_pending: list[str] = []
+        self._deleted_order: list[str] = []
+        self._deleted_order_stamp = None
+        self._listeners: list = []
         self.load_data()
 
     def load_data(self):
-        """Load keys and usage data from files"""
+        """Load keys, usage, deleted keys and logs from the storage backend"""
         try:
-            if os.path.exists(KEYS_FILE):
-                with open(KEYS_FILE, 'r') as f:
-                    self.keys = json.load(f)
-            
-            if os.path.exists(USAGE_FILE):
-                with open(USAGE_FILE, 'r') as f:
-                    self.key_usage = json.load(f)
-                    
-            if os.path.exists(DELETED_KEYS_FILE):
-                with open(DELETED_KEYS_FILE, 'r') as f:
-                    self.deleted_keys = json.load(f)
-            if os.path.exists(LOGS_FILE):
-                with open(LOGS_FILE, 'r') as f:
-                    self.key_logs = json.load(f)
+            state = self.storage.load()
+            self._load_records(state['keys'], state['usage'])
+            self.deleted_keys = state['deleted']
+            self.key_logs = state['logs']
         except Exception as e:
             print(f"Error loading data: {e}")
             self.keys = {}
-            self.key_usage = {}
             self.deleted_keys = {}
             self.key_logs = []
-    
-    def save_data(self):
-        """Save keys and usage data to files (atomically) and also write a timestamped backup"""
+        self._rebuild_indexes()
+
+    def _load_records(self, keys: dict, usage: dict):
+        """Replace in-memory keys with KeyRecords built from plain key and usage dicts"""
+        self.keys = {k: KeyRecord(d, usage.get(k)) for k, d in keys.items()}
+
+    def export_keys(self) -> dict:
+        """Plain-dict copy of all key fields, for serialization"""
+        return {k: rec.to_dict() for k, rec in self.keys.items()}
+
+    def export_usage(self) -> dict:
+        """Plain-dict copy of all usage counters, for serialization"""
+        return self.key_usage.to_dict()
+
+    def snapshot(self) -> dict:
+        """Consistent read-only copy {'version', 'keys', 'usage', 'deleted', 'logs'}; after a write only the keys written since are re-exported"""
+        snap = self._snapshot
+        if snap is not None and snap['version'] == self.version:
+            return snap
+        with self.write_lock:
+            prev = self._snapshot
+            if prev is not None and prev['version'] == self.version:
+                return prev
+            dirty = self._snapshot_dirty
+            if prev is None or dirty is None:
+                keys, usage, deleted = self.export_keys(), self.export_usage(), dict(self.deleted_keys)
+            else:
+                # Shallow copies share the unchanged records' dicts with the previous snapshot
+                keys, usage, deleted = dict(prev['keys']), dict(prev['usage']), dict(prev['deleted'])
+                for k in dirty:
+                    rec = self.keys.get(k)
+                    if rec is None:
+                        keys.pop(k, None)
+                        usage.pop(k, None)
+                    else:
+                        keys[k] = rec.to_dict()
+                        if rec.has_usage:
+                            usage[k] = rec.usage_dict()
+                        else:
+                            usage.pop(k, None)
+                    if k in self.deleted_keys:
+                        deleted[k] = self.deleted_keys[k]
+                    else:
+                        deleted.pop(k, None)
+            self._snapshot_dirty = set()
+            snap = self._snapshot = {
+                'version': self.version,
+                'keys': keys,
+                'usage': usage,
+                'deleted': deleted,
+                'logs': list(self.key_logs),
+            }
+            return snap
+
+    def attach_loop(self, loop: asyncio.AbstractEventLoop):
+        """Batch journal writes per tick of this loop (without a loop every commit is written immediately).
+
+        Until the batch is flushed a write lives only in memory, so a crash inside that window loses it.
+        Anything that reports a write as done (panel/API responses, slash command replies) calls
+        flush_writes() first, which keeps the window to writes nobody has been told about yet.
+        """
+        self.loop = loop
+
+    def _queue_entries(self, entries: list[dict]):
+        with self.write_lock:
+            self.version += 1
+            self._pending_entries.extend(entries)
+            if self._flush_scheduled:
+                return
+            loop = self.loop
+            if loop is None or loop.is_closed():
+                self.flush_writes()
+                return
+            self._flush_scheduled = True
+        loop.call_soon_threadsafe(self.flush_writes)
+
+    def flush_writes(self):
+        """Persist the journal entries queued this tick, then run the snapshot/backup triggers once"""
+        with self.write_lock:
+            self._flush_scheduled = False
+            entries, self._pending_entries = self._pending_entries, []
+            if not entries:
+                return
+            self.write_batches += 1
+            self._persist(entries)
+            if any(e.get('op') != 'log' for e in entries):
+                if self.snapshots.due():
+                    self._snapshot_in_background()
+                self._schedule_backup_upload()
+
+    def take_snapshot(self, force_full: bool = False) -> Optional[dict]:
+        """Write a point-in-time snapshot now; it gzips the whole state, so keep it off the event loop"""
+        with self.write_lock:
+            snap, captured = self.snapshot(), self.snapshots.capture()
+        return self.snapshots.take(snap, captured, force_full=force_full)
+
+    def _snapshot_in_background(self, force_full: bool = False):
+        # The state copy is taken here under the write lock; serializing and gzipping it runs in the executor
+        with self.write_lock:
+            snap, captured = self.snapshot(), self.snapshots.capture()
         try:
-            # Atomic writes via temp files and replace
-            def atomic_write(path: str, data: dict):
-                tmp = f"{path}.tmp"
-                with open(tmp, 'w') as f:
-                    json.dump(data, f, indent=2)
-                os.replace(tmp, path)
-            atomic_write(KEYS_FILE, self.keys)
-            atomic_write(USAGE_FILE, self.key_usage)
-            atomic_write(DELETED_KEYS_FILE, self.deleted_keys)
-            atomic_write(LOGS_FILE, self.key_logs)
-            # Extra rolling backup snapshot
-            ts = int(time.time())
-            snap_dir = "backups"
-            os.makedirs(snap_dir, exist_ok=True)
-            with open(os.path.join(snap_dir, f"keys_{ts}.json"), 'w') as f:
-                json.dump({
-                    'ts': ts,
-                    'keys': self.keys,
-                    'usage': self.key_usage,
-                    'deleted': self.deleted_keys
-                }, f, indent=2)
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        if loop is None:
+            self.snapshots.take(snap, captured, force_full=force_full)
+        else:
+            loop.run_in_executor(None, functools.partial(self.snapshots.take, snap, captured, force_full=force_full))
+
+    def write_stats(self) -> dict:
+        return {
+            'version': self.version,
+            'pending': len(self._pending_entries),
+            'batches': self.write_batches,
+            'snapshot_version': self._snapshot['version'] if self._snapshot else None,
+        }
+
+    def _persist(self, entries: list[dict]):
+        """Hand mutation entries to the storage backend and compact when it asks for it"""
+        if not entries:
+            return
+        try:
+            if self.storage.append(entries):
+                self.compact()
+        except Exception as e:
+            print(f"Error writing journal: {e}")
+
+    @staticmethod
+    def _index_add(index: dict, value, key: str):
+        bucket = index.get(value)
+        if bucket is None:
+            bucket = index[value] = set()
+        bucket.add(key)
+
+    @staticmethod
+    def _index_discard(index: dict, value, key: str):
+        bucket = index.get(value)
+        if bucket is not None:
+            bucket.discard(key)
+            if not bucket:
+                del index[value]
+
+    def _reindex(self, key: str, now: Optional[int] = None):
+        """Move a key to the index buckets matching its current record"""
+        with self._index_lock:
+            old = self._indexed.pop(key, None)
+            if old and key not in self.keys:
+                self._order_discard(key)
+            elif not old and key in self.keys:
+                self._key_order_pending.append(key)
+            if old:
+                uid, mid, ktype, status, usage = old
+                if uid:
+                    self._index_discard(self._by_user, uid, key)
+                if mid:
+                    self._index_discard(self._by_machine, mid, key)
+                self._index_discard(self._by_type, ktype, key)
+                self._by_status[status].discard(key)
+                self._count(ktype, status, uid, usage, -1)
+            data = self.keys.get(key)
+            if data is None:
+                if old and old[0] and old[4]:
+                    self._rank_user(old[0])
+                return
+            try:
+                uid = int(data.get("user_id", 0) or 0)
+            except Exception:
+                uid = 0
+            mid = str(data.get("machine_id") or "")
+            ktype = data.get("key_type", "general")
+            status = key_status(data, now)
+            if uid:
+                self._index_add(self._by_user, uid, key)
+            if mid:
+                self._index_add(self._by_machine, mid, key)
+            self._index_add(self._by_type, ktype, key)
+            self._by_status[status].add(key)
+            usage = data.u_usage_count if isinstance(data, KeyRecord) and data.has_usage else 0
+            usage = int(usage or 0) if usage is not _MISSING else 0
+            self._indexed[key] = (uid, mid, ktype, status, usage)
+            self._count(ktype, status, uid, usage, 1)
+            if old and old[0] and old[0] != uid and old[4]:
+                self._rank_user(old[0])
+            if uid and (usage or (old and old[4])):
+                self._rank_user(uid)
+            exp = int(data.get("expiration_time") or 0)
+            if exp and status in ("active", "unassigned"):
+                earlier = not self._expiry_heap or exp < self._expiry_heap[0][0]
+                heapq.heappush(self._expiry_heap, (exp, key))
+                if len(self._expiry_heap) > 2 * len(self.keys) + 1024:
+                    # Too many superseded entries; keep only the live ones
+                    self._expiry_heap = [e for e in self._expiry_heap if self._is_live_expiry(*e)]
+                    heapq.heapify(self._expiry_heap)
+                if earlier and self._expiry_wakeup:
+                    try:
+                        self._expiry_wakeup()
+                    except Exception:
+                        pass
+
+    def _merge_order(self):
+        if self._key_order_pending:
+            # Timsort merges the appended run with the sorted list in about linear time
+            self._key_order.extend(self._key_order_pending)
+            self._key_order.sort()
+            self._key_order_pending = []
+
+    def _order_discard(self, key: str):
+        self._merge_order()
+        i = bisect.bisect_left(self._key_order, key)
+        if i < len(self._key_order) and self._key_order[i] == key:
+            del self._key_order[i]
+
+    @staticmethod
+    def _prefix_scan(order: list[str], prefix: str, limit: int) -> list[str]:
+        out = []
+        i = bisect.bisect_left(order, prefix)
+        while i < len(order) and len(out) < limit and order[i].startswith(prefix):
+            out.append(order[i])
+            i += 1
+        return out
+
+    def keys_with_prefix(self, prefix: str, limit: int = 25, include_deleted: bool = False) -> list[str]:
+        """Up to limit live keys (then deleted ones) starting with prefix, in key order; O(log n + limit)"""
+        with self._index_lock:
+            self._merge_order()
+            out = self._prefix_scan(self._key_order, prefix, limit)
+            if include_deleted and len(out) < limit:
+                stamp = (id(self.deleted_keys), len(self.deleted_keys))
+                if stamp != self._deleted_order_stamp:
+                    self._deleted_order = sorted(self.deleted_keys)
+                    self._deleted_order_stamp = stamp
+                out += self._prefix_scan(self._deleted_order, prefix, limit - len(out))
+            return out
+
+    def _count(self, ktype: str, status: str, uid: int, usage: int, sign: int):
+        if status != "revoked":
+            self._active_by_type[ktype] = self._active_by_type.get(ktype, 0) + sign
+            if not uid:
+                self._available_by_type[ktype] = self._available_by_type.get(ktype, 0) + sign
+        self._usage_total += sign * usage
+        if uid and usage:
+            total = self._usage_by_user.get(uid, 0) + sign * usage
+            if total:
+                self._usage_by_user[uid] = total
+            else:
+                self._usage_by_user.pop(uid, None)
+
+    def _rank_user(self, uid: int):
+        if not self._ranking_paused:
+            self.usage_board.set(uid, self._usage_by_user.get(uid, 0))
+
+    def top_users(self, limit: int = 10) -> list[tuple[int, int]]:
+        """[(user_id, total usage), ...] highest first, read from the incrementally kept top-K"""
+        return self.usage_board.top(limit)
+
+    def aggregates(self) -> dict:
+        """Key totals in O(number of key types): active/revoked go by the is_active flag, available = active and unassigned.
+
+        keys_by_type and available_keys share one key set: the built-in tiers, then any custom tier with active keys.
+        """
+        with self._index_lock:
+            total = len(self._indexed)
+            revoked = len(self._by_status["revoked"])
+            types = list(BUILTIN_KEY_TYPES)
+            types += sorted(t for t, n in self._active_by_type.items() if n and t not in BUILTIN_KEY_TYPES)
+            active_by_type = {t: self._active_by_type.get(t, 0) for t in types}
+            available_by_type = {t: self._available_by_type.get(t, 0) for t in types}
+            return {
+                "total_keys": total,
+                "active_keys": total - revoked,
+                "revoked_keys": revoked,
+                "deleted_keys": len(self.deleted_keys),
+                "keys_by_type": active_by_type,
+                "available_keys": available_by_type,
+                "total_usage": self._usage_total,
+            }
+
+    def _rebuild_indexes(self):
+        with self._index_lock:
+            before = set(self._by_user)
+            self._indexed = {}
+            self._by_user = {}
+            self._by_machine = {}
+            self._by_type = {}
+            self._by_status = {st: set() for st in KEY_STATUSES}
+            self._expiry_heap = []
+            self._active_by_type = {}
+            self._available_by_type = {}
+            self._usage_total = 0
+            self._usage_by_user = {}
+            self._key_order = []
+            self._key_order_pending = []
+            self._snapshot_dirty = None
+            now = int(time.time())
+            # Rank once at the end instead of per key
+            self._ranking_paused = True
+            try:
+                for key in list(self.keys):
+                    self._reindex(key, now)
+            finally:
+                self._ranking_paused = False
+            self.usage_board.reset(self._usage_by_user)
+            affected = before | set(self._by_user)
+        self.version += 1
+        if affected:
+            self._emit("restore", "", affected)
+
+    def subscribe(self, listener):
+        """Register listener(event, key, user_ids) for key mutations, 'expire' and 'restore' events"""
+        self._listeners.append(listener)
+
+    def _emit(self, event: str, key: str, user_ids: set):
+        for listener in list(self._listeners):
+            try:
+                listener(event, key, user_ids)
+            except Exception as e:
+                print(f"Key event listener failed: {e}")
+
+    def set_expiry_wakeup(self, callback):
+        """Callback invoked when a key with an earlier expiration than the current head is scheduled"""
+        self._expiry_wakeup = callback
+
+    def _is_live_expiry(self, exp: int, key: str) -> bool:
+        entry = self._indexed.get(key)
+        data = self.keys.get(key)
+        return bool(entry and data is not None and entry[3] in ("active", "unassigned")
+                    and int(data.get("expiration_time") or 0) == exp)
+
+    def next_expiration(self) -> Optional[int]:
+        """Timestamp of the next pending key expiry, or None"""
+        with self._index_lock:
+            heap = self._expiry_heap
+            while heap and not self._is_live_expiry(*heap[0]):
+                heapq.heappop(heap)
+            return heap[0][0] if heap else None
+
+    def process_expirations(self, now: Optional[int] = None) -> list[str]:
+        """Pop every key that lapsed by now, move it to the expired index and emit 'expire' events"""
+        now = int(time.time()) if now is None else now
+        lapsed = []
+        with self._index_lock:
+            heap = self._expiry_heap
+            while heap and heap[0][0] <= now:
+                exp, key = heapq.heappop(heap)
+                if not self._is_live_expiry(exp, key):
+                    continue
+                self._reindex(key, now)
+                lapsed.append(key)
+        for key in lapsed:
+            data = self.keys.get(key) or {}
+            uid = int(data.get("user_id", 0) or 0)
+            self._emit("expire", key, {uid} if uid else set())
+        return lapsed
+
+    def keys_for_user(self, user_id: int) -> list[str]:
+        """Keys currently assigned to user_id (O(user's keys))"""
+        with self._index_lock:
+            return list(self._by_user.get(int(user_id or 0), ()))
+
+    def keys_for_machine(self, machine_id: str) -> list[str]:
+        with self._index_lock:
+            return list(self._by_machine.get(str(machine_id or ""), ()))
+
+    def keys_with_type(self, key_type: str) -> list[str]:
+        with self._index_lock:
+            return list(self._by_type.get(key_type, ()))
+
+    def keys_with_status(self, status: str) -> list[str]:
+        """Keys whose current status is one of unassigned, active, expired, revoked"""
+        if status in ("active", "unassigned", "expired"):
+            self.process_expirations()
+        with self._index_lock:
+            return list(self._by_status.get(status, ()))
+
+    def user_ids(self) -> list[int]:
+        with self._index_lock:
+            return list(self._by_user)
+
+    def known_users(self) -> set[int]:
+        """Users who hold or once held a key (current owners plus owners of deleted keys)"""
+        with self._index_lock:
+            known = set(self._by_user)
+        for data in list(self.deleted_keys.values()):
+            try:
+                uid = int((data or {}).get("user_id", 0) or 0)
+            except Exception:
+                uid = 0
+            if uid:
+                known.add(uid)
+        return known
+
+    @_writes
+    def commit(self, op: str, *keys: str):
+        """Journal the current state of the given keys after a mutation (activate, revoke, delete, rebind, swap, generate)"""
+        ts = int(time.time())
+        entries = []
+        touched: list[tuple[str, set]] = []
+        for key in keys:
+            old = self._indexed.get(key)
+            self._reindex(key, ts)
+            new = self._indexed.get(key)
+            users = {e[0] for e in (old, new) if e and e[0]}
+            if users:
+                touched.append((key, users))
+            entry = {'op': op, 'key': key, 'ts': ts}
+            if op == 'delete':
+                entry['deleted'] = self.deleted_keys.get(key)
+            else:
+                rec = self.keys.get(key)
+                entry['data'] = rec.to_dict() if rec is not None else None
+                entry['usage'] = rec.usage_dict() if rec is not None and rec.has_usage else None
+            entries.append(entry)
+        self.snapshots.note_mutation(keys)
+        if self._snapshot_dirty is not None:
+            self._snapshot_dirty.update(keys)
+        self._queue_entries(entries)
+        for key, users in touched:
+            self._emit(op, key, users)
+
+    def compact(self):
+        """Fold the journal into the storage backend's full state.
+
+        On the event loop the JSON journal is rotated and the files are written from a snapshot() copy in the
+        executor; without a loop (or for backends that can't rotate) the write happens here.
+        """
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        rotate = getattr(self.storage, 'rotate', None)
+        try:
+            with self.write_lock:
+                if loop is None or rotate is None:
+                    snap = self.snapshot()
+                    self.storage.write_all(snap['keys'], snap['usage'], snap['deleted'], snap['logs'])
+                    return
+                generation, snap = rotate(), self.snapshot()
+            loop.run_in_executor(None, self._write_compacted, generation, snap)
+        except Exception as e:
+            print(f"Error saving data: {e}")
+
+    def _write_compacted(self, generation: int, snap: dict):
+        try:
+            self.storage.write_compacted(generation, snap['keys'], snap['usage'], snap['deleted'], snap['logs'])
         except Exception as e:
+            # The rotated journal stays in place and is folded into the next rotation
             print(f"Error saving data: {e}")
-        # After saving locally, try to enqueue an upload to Discord
+
+    @_writes
+    def save_data(self):
+        """Write a full snapshot (compacting the journal) and enqueue a backup upload"""
+        # Whatever is still queued goes to the journal first; a rotation carries it until the full write lands
+        entries, self._pending_entries = self._pending_entries, []
         try:
-            payload = self.build_backup_payload()
-            # If we're inside the bot loop, schedule the async upload
-            loop = asyncio.get_event_loop()
-            if loop.is_running():
-                asyncio.run_coroutine_threadsafe(upload_backup_snapshot(payload), loop)
+            if entries:
+                self.storage.append(entries)
+        except Exception as e:
+            print(f"Error writing journal: {e}")
+        self.compact()
+        # Wholesale replacements (restores) invalidate any delta chain
+        self._snapshot_in_background(force_full=True)
+        self._schedule_backup_upload()
+
+    def _schedule_backup_upload(self):
+        # After saving locally, let the uploader coalesce this into its next window
+        try:
+            backup_uploader.mark_dirty()
         except Exception:
             pass
     
+    @_writes
     def generate_key(self, user_id: int, channel_id: Optional[int] = None, duration_days: int = 30) -> str:
         """Generate a new key for general use"""
         # Generate 10-12 random alphanumeric characters
@@ -298,7 +1788,7 @@ class KeyManager:
         
         created_time = int(time.time())
         
-        self.keys[key] = {
+        self.keys[key] = KeyRecord({
             "user_id": 0,  # 0 means unassigned - anyone can use it
             "channel_id": channel_id,
             "created_time": created_time,
@@ -310,27 +1800,26 @@ class KeyManager:
             "activated_by": None,
             "created_by": user_id,
             "key_type": "general"
-        }
-        
-        self.key_usage[key] = {
+        }, {
             "created": created_time,
             "activated": None,
             "last_used": None,
             "usage_count": 0
-        }
+        })
         
-        self.save_data()
+        self.commit('generate', key)
         try:
             self.add_log('generate', key, user_id=user_id, details={'duration_days': duration_days, 'channel_id': channel_id})
         except Exception:
             pass
         return key
     
+    @_writes
     def revoke_key(self, key: str) -> bool:
         """Revoke a key"""
         if key in self.keys:
             self.keys[key]["is_active"] = False
-            self.save_data()
+            self.commit('revoke', key)
             try:
                 self.add_log('revoke', key)
             except Exception:
@@ -338,6 +1827,7 @@ class KeyManager:
             return True
         return False
     
+    @_writes
     def delete_key(self, key: str) -> bool:
         """Completely delete a key and move it to deleted database"""
         if key in self.keys:
@@ -356,7 +1846,7 @@ class KeyManager:
             if key in self.key_usage:
                 del self.key_usage[key]
             
-            self.save_data()
+            self.commit('delete', key)
             try:
                 self.add_log('delete', key)
             except Exception:
@@ -368,6 +1858,7 @@ class KeyManager:
         """Check if a key has been deleted"""
         return key in self.deleted_keys
     
+    @_writes
     def activate_key(self, key: str, machine_id: str, user_id: int) -> Dict:
         """Activate a key for a specific machine"""
         key = normalize_key(key)
@@ -407,7 +1898,7 @@ class KeyManager:
             self.key_usage[key]["last_used"] = now_ts
             self.key_usage[key]["usage_count"] += 1
         
-        self.save_data()
+        self.commit('activate', key)
         # Log activation
         try:
             self.add_log('activate', key, user_id=user_id, details={'machine_id': machine_id, 'expires': key_data.get('expiration_time')})
@@ -423,29 +1914,30 @@ class KeyManager:
     def get_key_info(self, key: str) -> Optional[Dict]:
         """Get information about a key"""
         if key in self.keys:
-            key_data = self.keys[key].copy()
-            if key in self.key_usage:
-                key_data.update(self.key_usage[key])
+            rec = self.keys[key]
+            key_data = rec.to_dict()
+            key_data.update(rec.usage_dict())
             return key_data
         return None
     
     def get_user_keys(self, user_id: int) -> List[Dict]:
-        """Get all keys for a specific user"""
+        """Get all keys assigned to a specific user"""
         user_keys = []
-        for key, data in self.keys.items():
-            if data["created_by"] == user_id:
-                key_info = data.copy()
-                if key in self.key_usage:
-                    key_info.update(self.key_usage[key])
+        for key in self.keys_for_user(user_id):
+            rec = self.keys.get(key)
+            if rec is not None:
+                key_info = rec.to_dict()
+                key_info.update(rec.usage_dict())
                 user_keys.append({"key": key, **key_info})
         return user_keys
     
     def backup_keys(self) -> str:
         """Create a backup of all keys"""
+        snap = self.snapshot()
         backup_data = {
             "timestamp": int(time.time()),
-            "keys": self.keys,
-            "usage": self.key_usage
+            "keys": snap['keys'],
+            "usage": snap['usage']
         }
         
         with open(BACKUP_FILE, 'w') as f:
@@ -455,14 +1947,16 @@ class KeyManager:
     
     def build_backup_payload(self) -> dict:
         """Return a JSON-serializable payload of all state for upload/restore."""
+        snap = self.snapshot()
         return {
             "timestamp": int(time.time()),
-            "keys": self.keys,
-            "usage": self.key_usage,
-            "deleted": self.deleted_keys,
-            "logs": getattr(self, 'key_logs', []),
+            "keys": snap['keys'],
+            "usage": snap['usage'],
+            "deleted": snap['deleted'],
+            "logs": snap['logs'],
         }
     
+    @_writes
     def restore_from_payload(self, payload: dict) -> bool:
         """Restore state from a payload dict (like one retrieved from backup)."""
         try:
@@ -472,23 +1966,40 @@ class KeyManager:
             logs = payload.get("logs") or []
             if not isinstance(keys, dict) or not isinstance(usage, dict):
                 return False
-            self.keys = keys
-            self.key_usage = usage
+            self._load_records(keys, usage)
             self.deleted_keys = deleted if isinstance(deleted, dict) else {}
             self.key_logs = logs if isinstance(logs, list) else []
+            self._rebuild_indexes()
             self.save_data()
             return True
         except Exception:
             return False
     
+    @_writes
+    def restore_snapshot(self, ts: int) -> bool:
+        """Restore keys, usage and deleted keys from an indexed point-in-time snapshot"""
+        try:
+            payload = self.snapshots.load(int(ts))
+            if not payload:
+                return False
+            payload["logs"] = self.key_logs
+            ok = self.restore_from_payload(payload)
+            if ok:
+                self.add_log('restore', '', details={'snapshot': int(ts)})
+            return ok
+        except Exception as e:
+            print(f"Error restoring snapshot {ts}: {e}")
+            return False
+
+    @_writes
     def restore_from_backup(self, backup_file: str) -> bool:
         """Restore keys from a backup file"""
         try:
             with open(backup_file, 'r') as f:
                 backup_data = json.load(f)
             
-            self.keys = backup_data["keys"]
-            self.key_usage = backup_data["usage"]
+            self._load_records(backup_data["keys"], backup_data["usage"])
+            self._rebuild_indexes()
             
             self.save_data()
             return True
@@ -496,157 +2007,113 @@ class KeyManager:
             print(f"Error restoring from backup: {e}")
             return False
     
+    def _new_key_ids(self, count: int) -> list[str]:
+        """Draw UUID4 keys from one os.urandom batch, skipping any already live or deleted"""
+        out: list[str] = []
+        seen: set[str] = set()
+        while len(out) < count:
+            need = count - len(out)
+            raw = bytearray(os.urandom(16 * need))
+            # Stamp the RFC 4122 version (4) and variant bits across the whole batch at once
+            raw[6::16] = bytes((b & 0x0F) | 0x40 for b in raw[6::16])
+            raw[8::16] = bytes((b & 0x3F) | 0x80 for b in raw[8::16])
+            hexed = raw.hex()
+            for i in range(0, 32 * need, 32):
+                key = f"{hexed[i:i+8]}-{hexed[i+8:i+12]}-{hexed[i+12:i+16]}-{hexed[i+16:i+20]}-{hexed[i+20:i+32]}"
+                if key in self.keys or key in self.deleted_keys or key in seen:
+                    continue
+                seen.add(key)
+                out.append(key)
+        return out
+
+    @_writes
+    def generate_keys(self, spec: Dict, created_by: int = 0) -> Dict:
+        """Generate keys for a tier spec {key_type: count or (count, duration_days)} in one commit"""
+        started = time.perf_counter()
+        plan = []
+        for key_type, value in spec.items():
+            count, duration_days = value if isinstance(value, (tuple, list)) else (value, KEY_TIERS.get(key_type, 30))
+            plan.append((str(key_type), max(0, int(count)), int(duration_days)))
+        generated_keys: Dict[str, list] = {key_type: [] for key_type, _, _ in plan}
+        total = sum(count for _, count, _ in plan)
+        new_keys = self._new_key_ids(total)
+        created_time = int(time.time())
+        pos = 0
+        for key_type, count, duration_days in plan:
+            batch = new_keys[pos:pos + count]
+            pos += count
+            for key in batch:
+                self.keys[key] = KeyRecord({
+                    "user_id": 0,
+                    "channel_id": None,
+                    "created_time": created_time,
+                    "activation_time": None,
+                    "expiration_time": None,
+                    "duration_days": duration_days,
+                    "key_type": key_type,
+                    "is_active": True,
+                    "machine_id": None,
+                    "activated_by": None,
+                    "created_by": created_by
+                }, {
+                    "created": created_time,
+                    "activated": None,
+                    "last_used": None,
+                    "usage_count": 0
+                })
+            generated_keys[key_type].extend(batch)
+
+        # One journal batch / transaction and one backup trigger for the whole run
+        if new_keys:
+            self.commit('generate', *new_keys)
+        elapsed = max(time.perf_counter() - started, 1e-9)
+        self.last_bulk_stats = {
+            "keys": total,
+            "seconds": round(elapsed, 4),
+            "keys_per_sec": int(total / elapsed),
+            "ts": created_time,
+        }
+        if total:
+            print(f"🔑 Generated {total} keys in {elapsed * 1000:.1f} ms ({self.last_bulk_stats['keys_per_sec']} keys/s)")
+        return generated_keys
+
     def generate_bulk_keys(self, daily_count: int, weekly_count: int, monthly_count: int, lifetime_count: int) -> Dict:
         """Generate multiple keys of different types"""
-        generated_keys = {
+        return self.generate_keys({
+            "daily": daily_count,
+            "weekly": weekly_count,
+            "monthly": monthly_count,
+            "lifetime": lifetime_count,
+        })
+    
+    def get_available_keys_by_type(self) -> Dict:
+        """Get all available (unassigned) keys grouped by type"""
+        available_keys = {
             "daily": [],
             "weekly": [],
             "monthly": [],
             "lifetime": []
         }
         
-        # Generate daily keys (1 day)
-        for _ in range(daily_count):
-            key = str(uuid.uuid4())
-            created_time = int(time.time())
-            
-            self.keys[key] = {
-                "user_id": 0,
-                "channel_id": None,
-                "created_time": created_time,
-                "activation_time": None,
-                "expiration_time": None,
-                "duration_days": 1,
-                "key_type": "daily",
-                "is_active": True,
-                "machine_id": None,
-                "activated_by": None,
-                "created_by": 0
-            }
-            
-            self.key_usage[key] = {
-                "created": created_time,
-                "activated": None,
-                "last_used": None,
-                "usage_count": 0
-            }
-            
-            generated_keys["daily"].append(key)
+        for key in self.keys_with_status("unassigned"):
+            data = self.keys.get(key)
+            if data is not None:
+                key_type = data.get("key_type", "unknown")
+                available_entry = {
+                    "key": key,
+                    "created": data.get("created_time") or data.get("activation_time") or 0,
+                    "expires": data.get("expiration_time") or 0
+                }
+                if key_type in available_keys:
+                    available_keys[key_type].append(available_entry)
         
-        # Generate weekly keys (7 days)
-        for _ in range(weekly_count):
-            key = str(uuid.uuid4())
-            created_time = int(time.time())
-            
-            self.keys[key] = {
-                "user_id": 0,
-                "channel_id": None,
-                "created_time": created_time,
-                "activation_time": None,
-                "expiration_time": None,
-                "duration_days": 7,
-                "key_type": "weekly",
-                "is_active": True,
-                "machine_id": None,
-                "activated_by": None,
-                "created_by": 0
-            }
-            
-            self.key_usage[key] = {
-                "created": created_time,
-                "activated": None,
-                "last_used": None,
-                "usage_count": 0
-            }
-            
-            generated_keys["weekly"].append(key)
-        
-        # Generate monthly keys (30 days)
-        for _ in range(monthly_count):
-            key = str(uuid.uuid4())
-            created_time = int(time.time())
-            
-            self.keys[key] = {
-                "user_id": 0,
-                "channel_id": None,
-                "created_time": created_time,
-                "activation_time": None,
-                "expiration_time": None,
-                "duration_days": 30,
-                "key_type": "monthly",
-                "is_active": True,
-                "machine_id": None,
-                "activated_by": None,
-                "created_by": 0
-            }
-            
-            self.key_usage[key] = {
-                "created": created_time,
-                "activated": None,
-                "last_used": None,
-                "usage_count": 0
-            }
-            
-            generated_keys["monthly"].append(key)
-        
-        # Generate lifetime keys (365 days)
-        for _ in range(lifetime_count):
-            key = str(uuid.uuid4())
-            created_time = int(time.time())
-            
-            self.keys[key] = {
-                "user_id": 0,
-                "channel_id": None,
-                "created_time": created_time,
-                "activation_time": None,
-                "expiration_time": None,
-                "duration_days": 365,
-                "key_type": "lifetime",
-                "is_active": True,
-                "machine_id": None,
-                "activated_by": None,
-                "created_by": 0
-            }
-            
-            self.key_usage[key] = {
-                "created": created_time,
-                "activated": None,
-                "last_used": None,
-                "usage_count": 0
-            }
-            
-            generated_keys["lifetime"].append(key)
-        
-        self.save_data()
-        return generated_keys
-    
-    def get_available_keys_by_type(self) -> Dict:
-        """Get all available (unassigned) keys grouped by type"""
-        available_keys = {
-            "daily": [],
-            "weekly": [],
-            "monthly": [],
-            "lifetime": []
-        }
-        
-        for key, data in self.keys.items():
-            if data["is_active"] and data["user_id"] == 0:  # Unassigned and active
-                key_type = data.get("key_type", "unknown")
-                available_entry = {
-                    "key": key,
-                    "created": data.get("created_time") or data.get("activation_time") or 0,
-                    "expires": data.get("expiration_time") or 0
-                }
-                if key_type in available_keys:
-                    available_keys[key_type].append(available_entry)
-        
-        return available_keys
-    
-    async def send_webhook_notification(self, key: str, user_id: int, machine_id: str, ip: Optional[str] = None):
-        """Send webhook notification when a key is activated"""
-        try:
-            if not WEBHOOK_URL or WEBHOOK_URL == "YOUR_WEBHOOK_URL_HERE":
-                return
+        return available_keys
+    
+    async def send_webhook_notification(self, key: str, user_id: int, machine_id: str, ip: Optional[str] = None):
+        """Send webhook notification when a key is activated"""
+        try:
+            if not WEBHOOK_URL or WEBHOOK_URL == "YOUR_WEBHOOK_URL_HERE":
+                return
             
             embed = {
                 "title": "🔑 Key Activated",
@@ -685,9 +2152,9 @@ class KeyManager:
                 "embeds": [embed]
             }
             
-            response = requests.post(WEBHOOK_URL, json=payload)
-            if response.status_code != 204:
-                print(f"Failed to send webhook notification: {response.status_code}")
+            status = await http_client.post(WEBHOOK_URL, json=payload)
+            if status is not None and status != 204:
+                print(f"Failed to send webhook notification: {status}")
                 
         except Exception as e:
             print(f"Error sending webhook notification: {e}")
@@ -735,9 +2202,9 @@ class KeyManager:
                 "embeds": [embed]
             }
             
-            response = requests.post(WEBHOOK_URL, json=payload)
-            if response.status_code != 204:
-                print(f"Failed to send generated key to webhook: {response.status_code}")
+            status = await http_client.post(WEBHOOK_URL, json=payload)
+            if status is not None and status != 204:
+                print(f"Failed to send generated key to webhook: {status}")
                 
         except Exception as e:
             print(f"Error sending generated key to webhook: {e}")
@@ -770,6 +2237,7 @@ class KeyManager:
                 return {"success": False, "error": "Key has been revoked"}
         return {"success": False, "error": "Key not found"}
 
+    @_writes
     def rebind_key(self, key: str, user_id: int, new_machine_id: str) -> Dict:
         """Rebind a key to a new machine if requested by the same user who activated it.
         Conditions:
@@ -796,9 +2264,10 @@ class KeyManager:
         # Touch usage
         if key in self.key_usage:
             self.key_usage[key]["last_used"] = now_ts
-        self.save_data()
+        self.commit('rebind', key)
         return {"success": True, "key": key, "user_id": int(user_id), "machine_id": str(new_machine_id)}
 
+    @_writes
     def add_log(self, event: str, key: str, user_id: int | None = None, details: dict | None = None):
         try:
             entry = {
@@ -812,11 +2281,763 @@ class KeyManager:
             # Keep last 1000 entries
             if len(self.key_logs) > 1000:
                 self.key_logs = self.key_logs[-1000:]
+            self._queue_entries([{'op': 'log', 'entry': entry}])
         except Exception as e:
             print(f"Failed to append log: {e}")
 
+class BackupUploader:
+    """Background uploader that coalesces backup requests into at most one upload per window."""
+
+    def __init__(self, window_sec: int):
+        self.window_sec = max(1, int(window_sec))
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._event: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._dirty = False
+        self.pending = 0  # dirty marks absorbed into the next upload
+        self.last_hash: Optional[str] = None
+        self.last_upload_ts = 0
+        self.last_upload_latency: Optional[float] = None
+        self.uploads = 0
+        self.skipped = 0
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        if self._task and not self._task.done():
+            return
+        self.loop = loop
+        self._event = asyncio.Event()
+        if self._dirty:
+            self._event.set()
+        self._task = loop.create_task(self._run())
+
+    def mark_dirty(self):
+        """Thread-safe: request a backup of the current state"""
+        self._dirty = True
+        self.pending += 1
+        loop = self.loop
+        if loop and self._event is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._event.set)
+
+    async def _run(self):
+        while True:
+            try:
+                await self._event.wait()
+                # Let the burst settle so a single upload covers it
+                await asyncio.sleep(self.window_sec)
+                self._event.clear()
+                self._dirty = False
+                self.pending = 0
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"❌ Backup uploader error: {e}")
+
+    async def flush(self) -> bool:
+        """Upload the current state unless it matches the last uploaded content"""
+        import hashlib
+        payload = key_manager.build_backup_payload()
+        content = {k: v for k, v in payload.items() if k != 'timestamp'}
+        # Hashing serializes the whole state; do it off the event loop
+        digest = await asyncio.get_running_loop().run_in_executor(
+            None, lambda: hashlib.sha256(json.dumps(content, sort_keys=True, separators=(',', ':')).encode()).hexdigest())
+        if digest == self.last_hash:
+            self.skipped += 1
+            return False
+        started = time.monotonic()
+        await upload_backup_snapshot(payload)
+        self.last_upload_latency = time.monotonic() - started
+        self.last_upload_ts = int(time.time())
+        self.last_hash = digest
+        self.uploads += 1
+        return True
+
+    def stats(self) -> dict:
+        return {
+            'queue_depth': self.pending,
+            'dirty': self._dirty,
+            'window_sec': self.window_sec,
+            'uploads': self.uploads,
+            'skipped_unchanged': self.skipped,
+            'last_upload_ts': self.last_upload_ts,
+            'last_upload_latency_ms': (round(self.last_upload_latency * 1000, 1) if self.last_upload_latency is not None else None),
+        }
+
 # Instantiate the key manager now that the class is defined
 key_manager = KeyManager()
+backup_uploader = BackupUploader(BACKUP_COALESCE_SEC)
+
+class StatCounters:
+    """Per-user message counters: sharded locks, batched increments, write-behind on a timer or dirty threshold."""
+
+    def __init__(self, document: str, shards: int = 16):
+        self.document = document
+        self.storage = None
+        self._shards: list[tuple[threading.Lock, dict[str, int]]] = [(threading.Lock(), {}) for _ in range(shards)]
+        # Token bucket per user: uid -> (allowance, last refill), guarded by the user's shard lock
+        self._budgets: list[dict[str, tuple[float, float]]] = [{} for _ in range(shards)]
+        self._state_lock = threading.Lock()
+        self._dirty = 0
+        self._flush_handle = None
+        self.flushes = 0
+        self.increments = 0
+        self.throttled = 0
+        self.board = TopK(LEADERBOARD_SIZE)
+
+    def _shard(self, uid: str) -> tuple[threading.Lock, dict]:
+        return self._shards[hash(uid) % len(self._shards)]
+
+    def load(self, storage):
+        self.storage = storage
+        try:
+            data = storage.load_document(self.document, {}) or {}
+        except Exception:
+            data = {}
+        for uid, count in data.items():
+            try:
+                lock, counts = self._shard(str(uid))
+                counts[str(uid)] = int(count)
+            except Exception:
+                continue
+        self.board.reset(self.snapshot())
+
+    def get(self, uid, default: int = 0) -> int:
+        lock, counts = self._shard(str(uid))
+        return counts.get(str(uid), default)
+
+    def _allow(self, uid: str, delta: int, now: float) -> int:
+        """How much of delta the user's allowance covers; call with the shard lock held"""
+        budgets = self._budgets[hash(uid) % len(self._budgets)]
+        allowance, last = budgets.get(uid, (STATS_MAX_DELTA, now))
+        allowance = min(STATS_MAX_DELTA, allowance + (now - last) * STATS_RATE_PER_MIN / 60)
+        granted = min(delta, int(allowance))
+        budgets[uid] = (allowance - granted, now)
+        return granted
+
+    def add(self, deltas: dict) -> tuple[dict[str, int], dict[str, int]]:
+        """Apply {user_id: delta} within each user's allowance; returns the new totals and what was held back per user"""
+        totals = {}
+        held = {}
+        applied = 0
+        throttled = 0
+        now = time.monotonic()
+        for uid, delta in deltas.items():
+            uid = str(uid).strip()
+            try:
+                delta = int(delta)
+            except Exception:
+                continue
+            if not uid or delta <= 0:
+                continue
+            lock, counts = self._shard(uid)
+            with lock:
+                granted = self._allow(uid, delta, now)
+                if granted < delta:
+                    held[uid] = delta - granted
+                    throttled += delta - granted
+                if granted:
+                    counts[uid] = counts.get(uid, 0) + granted
+                    self.board.set(uid, counts[uid])
+                totals[uid] = counts.get(uid, 0)
+            applied += granted
+        if throttled:
+            with self._state_lock:
+                self.throttled += throttled
+        if applied:
+            with self._state_lock:
+                self._dirty += applied
+                self.increments += applied
+                due = self._dirty >= STATS_FLUSH_DIRTY
+            if due:
+                self._flush_soon(0)
+            else:
+                self._flush_soon(STATS_FLUSH_SEC)
+        return totals, held
+
+    def snapshot(self) -> dict[str, int]:
+        out = {}
+        for lock, counts in self._shards:
+            with lock:
+                out.update(counts)
+        return out
+
+    def __len__(self) -> int:
+        return sum(len(counts) for _, counts in self._shards)
+
+    def _flush_soon(self, delay: float):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.flush()
+            return
+        if self._flush_handle is not None:
+            if delay > 0:
+                return
+            self._flush_handle.cancel()
+
+        def fire():
+            self._flush_handle = None
+            loop.run_in_executor(None, self._write)
+        self._flush_handle = loop.call_later(delay, fire)
+
+    def flush(self):
+        """Write pending counts now (shutdown, or when no loop is running)"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        self._write()
+
+    def _write(self):
+        with self._state_lock:
+            if not self._dirty:
+                return
+            pending, self._dirty = self._dirty, 0
+        try:
+            self.storage.save_document(self.document, self.snapshot())
+            self.flushes += 1
+        except Exception as e:
+            with self._state_lock:
+                self._dirty += pending
+            print(f"Error saving {self.document}: {e}")
+
+    def stats(self) -> dict:
+        return {'users': len(self), 'increments': self.increments, 'throttled': self.throttled, 'pending': self._dirty, 'flushes': self.flushes, 'rerankings': self.board.rebuilds}
+
+message_stats = StatCounters("selfbot_message_stats")
+message_stats.load(key_manager.storage)
+
+EXPIRY_MAX_SLEEP = 300  # re-check the heap head at least this often
+
+async def run_expiry_scheduler():
+    """Sleep until the next key lapses and emit its expiry event (work proportional to expiring keys)."""
+    loop = asyncio.get_running_loop()
+    wake = asyncio.Event()
+    key_manager.set_expiry_wakeup(lambda: loop.call_soon_threadsafe(wake.set))
+    while True:
+        try:
+            wake.clear()
+            key_manager.process_expirations()
+            nxt = key_manager.next_expiration()
+            delay = EXPIRY_MAX_SLEEP if nxt is None else min(max(0.0, nxt - time.time()), EXPIRY_MAX_SLEEP)
+            try:
+                await asyncio.wait_for(wake.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"❌ Expiry scheduler error: {e}")
+            await asyncio.sleep(5)
+
+class RoleReconciler:
+    """Applies access-role changes only for users whose entitlement changed, paced for rate limits."""
+
+    def __init__(self, mutation_delay: float = 0.25, batch_size: int = 25):
+        self.mutation_delay = mutation_delay
+        self.batch_size = batch_size
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._event: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._lock = threading.Lock()
+        self.pending: set[int] = set()
+        self.added = 0
+        self.removed = 0
+        self.rate_limited = 0
+        self.last_sweep_ts = 0
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        if self._task and not self._task.done():
+            return
+        self.loop = loop
+        self._event = asyncio.Event()
+        if self.pending:
+            self._event.set()
+        self._task = loop.create_task(self._run())
+
+    def mark(self, user_ids):
+        """Thread-safe: queue users for a role check"""
+        with self._lock:
+            self.pending.update(int(u) for u in user_ids if u)
+        loop = self.loop
+        if loop and self._event is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._event.set)
+
+    @staticmethod
+    def _resolve_role(guild):
+        role = guild.get_role(ROLE_ID)
+        if not role:
+            role = discord.utils.find(lambda r: r.name.lower() == ROLE_NAME.lower(), guild.roles)
+        return role
+
+    @staticmethod
+    def is_entitled(uid: int) -> bool:
+        now = int(time.time())
+        return any(key_status(key_manager.keys.get(k, {}), now) == "active" for k in key_manager.keys_for_user(uid))
+
+    def sweep(self):
+        """Queue every key owner whose role membership disagrees with their keys (linear in keys + role members)"""
+        guild = bot.get_guild(GUILD_ID)
+        role = self._resolve_role(guild) if guild else None
+        if not role:
+            return
+        entitled = set()
+        for k in key_manager.keys_with_status("active"):
+            uid = int(key_manager.keys.get(k, {}).get("user_id", 0) or 0)
+            if uid:
+                entitled.add(uid)
+        holders = {m.id for m in role.members}
+        self.last_sweep_ts = int(time.time())
+        # Role holders without any key history (e.g. granted by hand) are not ours to strip
+        self.mark((entitled - holders) | ((holders - entitled) & key_manager.known_users()))
+
+    async def _run(self):
+        while True:
+            try:
+                await self._event.wait()
+                self._event.clear()
+                while True:
+                    with self._lock:
+                        batch = [self.pending.pop() for _ in range(min(self.batch_size, len(self.pending)))]
+                    if not batch:
+                        break
+                    await self._apply(batch)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"❌ Role reconciler error: {e}")
+
+    async def _apply(self, batch: list[int]):
+        guild = bot.get_guild(GUILD_ID)
+        role = self._resolve_role(guild) if guild else None
+        if not role:
+            return
+        for i, uid in enumerate(batch):
+            member = guild.get_member(uid)
+            if not member:
+                continue
+            want = self.is_entitled(uid)
+            has = role in member.roles
+            if want == has:
+                continue
+            try:
+                if want:
+                    await member.add_roles(role, reason="Key active")
+                    self.added += 1
+                else:
+                    await member.remove_roles(role, reason="Key expired or revoked")
+                    self.removed += 1
+            except discord.HTTPException as e:
+                if getattr(e, 'status', None) == 429:
+                    self.rate_limited += 1
+                    self.mark(batch[i:])
+                    await asyncio.sleep(float(getattr(e, 'retry_after', 5) or 5))
+                    return
+            except Exception:
+                pass
+            await asyncio.sleep(self.mutation_delay)
+
+    def stats(self) -> dict:
+        return {
+            'pending': len(self.pending),
+            'roles_added': self.added,
+            'roles_removed': self.removed,
+            'rate_limited': self.rate_limited,
+            'last_sweep_ts': self.last_sweep_ts,
+        }
+
+role_reconciler = RoleReconciler()
+
+class MemberCache:
+    """Role entitlements per user_id, kept current from gateway member/role events (no REST on lookup)."""
+
+    # Entry: (is_member, has_role, can_send_chat, is_owner, expires_at); expires_at is 0 for members
+    NON_MEMBER = (False, False, False, False)
+
+    def __init__(self):
+        self.entries: dict[int, tuple] = {}
+        self._fetching: set[int] = set()
+        self._listeners: list = []
+        self.hits = 0
+        self.misses = 0
+        self.fetches = 0
+        self.user_fetches = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _entitlements(member) -> tuple:
+        ids = {getattr(r, 'id', 0) for r in getattr(member, 'roles', [])}
+        names = {(getattr(r, 'name', '') or '').lower() for r in getattr(member, 'roles', [])}
+        is_admin = ADMIN_ROLE_ID in ids
+        return (
+            True,
+            ROLE_ID in ids or ROLE_NAME.lower() in names,
+            CHATSEND_ROLE_ID in ids or is_admin,
+            OWNER_ROLE_ID in ids or is_admin,
+        )
+
+    def subscribe(self, listener):
+        """Register listener(user_id) called when a user's entitlements change (None means everyone)"""
+        self._listeners.append(listener)
+
+    def _notify(self, uid: Optional[int]):
+        for listener in list(self._listeners):
+            try:
+                listener(uid)
+            except Exception as e:
+                print(f"Member cache listener failed: {e}")
+
+    def update(self, member):
+        """Store the entitlements of a member from our guild"""
+        guild = getattr(member, 'guild', None)
+        if guild is not None and getattr(guild, 'id', GUILD_ID) != GUILD_ID:
+            return
+        old = self.entries.get(member.id)
+        self.entries[member.id] = self._entitlements(member) + (0,)
+        if old is None or old[:4] != self.entries[member.id][:4]:
+            self._notify(member.id)
+
+    def remove(self, uid: int):
+        """Record a user as not in the guild"""
+        old = self.entries.get(int(uid))
+        self.entries[int(uid)] = self.NON_MEMBER + (time.time() + MEMBER_NEGATIVE_TTL,)
+        if old is None or old[0]:
+            self._notify(int(uid))
+
+    def invalidate(self, uid: Optional[int] = None):
+        """Drop one user (or everyone, e.g. after a role edit); entries are rebuilt from the gateway cache on demand"""
+        self.invalidations += 1
+        if uid is None:
+            self.entries.clear()
+        else:
+            self.entries.pop(int(uid), None)
+        self._notify(uid)
+
+    def get(self, uid: int) -> tuple:
+        """(is_member, has_role, can_send_chat, is_owner) for uid, resolved without blocking on Discord"""
+        if not uid:
+            return self.NON_MEMBER
+        entry = self.entries.get(uid)
+        if entry is not None and (not entry[4] or entry[4] > time.time()):
+            self.hits += 1
+            return entry[:4]
+        self.misses += 1
+        guild = bot.get_guild(GUILD_ID)
+        member = guild.get_member(uid) if guild else None
+        if member is not None:
+            self.update(member)
+            return self.entries[uid][:4]
+        self.remove(uid)
+        # Members may be missing from a guild that has not finished chunking; resolve those in the background
+        if guild is not None and not guild.chunked and uid not in self._fetching:
+            self._fetching.add(uid)
+            asyncio.get_running_loop().create_task(self._fetch(guild, uid))
+        return self.NON_MEMBER
+
+    async def _fetch(self, guild, uid: int):
+        try:
+            self.fetches += 1
+            member = await guild.fetch_member(uid)
+            self.update(member)
+        except Exception:
+            pass
+        finally:
+            self._fetching.discard(uid)
+
+    async def user(self, uid: int):
+        """User object for a name/avatar: the gateway cache first, a REST fetch only when it misses"""
+        user = bot.get_user(uid)
+        if user is None:
+            guild = bot.get_guild(GUILD_ID)
+            user = guild.get_member(uid) if guild else None
+        if user is None:
+            try:
+                self.user_fetches += 1
+                user = await bot.fetch_user(uid)
+            except Exception:
+                return None
+        return user
+
+    def has_role(self, uid: int) -> bool:
+        return self.get(uid)[1]
+
+    def can_send_chat(self, uid: int) -> bool:
+        return self.get(uid)[2]
+
+    def is_owner(self, uid: int) -> bool:
+        return self.get(uid)[3]
+
+    def stats(self) -> dict:
+        now = time.time()
+        negative = sum(1 for e in self.entries.values() if e[4] and e[4] > now)
+        return {
+            'entries': len(self.entries),
+            'members': sum(1 for e in self.entries.values() if e[0]),
+            'negative': negative,
+            'hits': self.hits,
+            'misses': self.misses,
+            'fetches': self.fetches,
+            'user_fetches': self.user_fetches,
+            'invalidations': self.invalidations,
+        }
+
+member_cache = MemberCache()
+
+class MemberStatusCache:
+    """Materialized /api/member-status entries per (user_id, machine_id), rebuilt only after a key or role change."""
+
+    MAX_ENTRIES = 20000
+
+    def __init__(self):
+        self.entries: dict[tuple, dict] = {}
+        self.hits = 0
+        self.builds = 0
+        self.not_modified = 0
+
+    def invalidate(self, uid: Optional[int] = None):
+        if uid is None:
+            self.entries.clear()
+            return
+        for k in [k for k in self.entries if k[0] == uid]:
+            self.entries.pop(k, None)
+
+    def get(self, uid: Optional[int], machine_q: Optional[str]) -> dict:
+        """Cached entry {'state', 'etag', 'next_change'}; rebuilt when missing or once a key lapses"""
+        now = int(time.time())
+        k = (uid, machine_q or '')
+        entry = self.entries.get(k)
+        if entry is not None and (not entry['next_change'] or entry['next_change'] > now):
+            self.hits += 1
+            return entry
+        entry = self._build(uid, machine_q, now)
+        if len(self.entries) >= self.MAX_ENTRIES:
+            self.entries.clear()
+        self.entries[k] = entry
+        return entry
+
+    def _build(self, uid: Optional[int], machine_q: Optional[str], now: int) -> dict:
+        self.builds += 1
+        active_items = []
+        expired_count = 0
+        bound_match = False
+        next_change = 0
+        if uid is not None:
+            for key in key_manager.keys_for_user(uid):
+                data = key_manager.keys.get(key)
+                if data is None:
+                    continue
+                expires = data.get('expiration_time', 0) or 0
+                if data.get('is_active', False) and (expires == 0 or expires > now):
+                    active_items.append({
+                        'key': key,
+                        'expires_at': expires,
+                        'type': data.get('key_type', 'general'),
+                        'machine_id': data.get('machine_id')
+                    })
+                    if expires and (not next_change or expires < next_change):
+                        next_change = expires
+                    if machine_q:
+                        mid = str(data.get('machine_id') or '')
+                        # Accept exact machine binding OR legacy slash-activation binding (machine_id == user_id)
+                        if (mid and str(machine_q) == mid) or (mid and str(uid) == mid):
+                            bound_match = True
+                else:
+                    if expires and expires <= now:
+                        expired_count += 1
+        has_active_key = len(active_items) > 0
+        state = {
+            'user_id': uid,
+            'role_id': ROLE_ID,
+            'guild_id': GUILD_ID,
+            'has_active_key': has_active_key,
+            # Role-based access: check if user currently has the Discord role
+            'has_role': member_cache.has_role(uid) if uid else False,
+            # Access should depend on active key (and optional machine binding)
+            'should_have_access': has_active_key and (bound_match or not machine_q),
+            'bound_match': bound_match,
+            'active_keys': active_items,
+            'expired_keys_count': expired_count,
+        }
+        import hashlib
+        digest = hashlib.sha1(json.dumps(state, sort_keys=True, separators=(',', ':')).encode()).hexdigest()[:20]
+        return {'state': state, 'etag': f'W/"{digest}"', 'next_change': next_change}
+
+    @staticmethod
+    def max_age(entry: dict, now: int) -> int:
+        """Seconds the entry stays valid: until the next key lapses, capped for unannounced role changes"""
+        if entry['next_change']:
+            return max(0, min(entry['next_change'] - now, MEMBER_STATUS_MAX_AGE))
+        return MEMBER_STATUS_MAX_AGE
+
+    @staticmethod
+    def render(entry: dict, now: int) -> bytes:
+        state = entry['state']
+        resp = dict(state)
+        resp['active_keys'] = [dict(item, time_remaining=(item['expires_at'] - now) if item['expires_at'] else 0)
+                               for item in state['active_keys']]
+        resp['last_updated'] = now
+        resp['server_time'] = now
+        return json.dumps(resp, separators=(',', ':')).encode()
+
+    def stats(self) -> dict:
+        return {'entries': len(self.entries), 'hits': self.hits, 'builds': self.builds, 'not_modified': self.not_modified}
+
+member_status_cache = MemberStatusCache()
+member_cache.subscribe(member_status_cache.invalidate)
+
+# Long-poll requests are held at most this long; SSE streams send a keep-alive comment at the same cadence
+LONGPOLL_MAX_SEC = 25
+# Feed appends are persisted write-behind, at most this long after the first unsaved message
+FEED_FLUSH_SEC = 2
+# Web responses: bodies from this size are gzipped when the client accepts it; streamed pages are flushed in pieces this big
+COMPRESS_MIN_BYTES = 1024
+STREAM_CHUNK_BYTES = 64 * 1024
+# /keys admin view: rows per page (default and upper bound for ?limit=) and the sort orders it offers
+KEYS_PAGE_SIZE = 100
+KEYS_PAGE_MAX = 500
+KEY_SORTS = {
+    'created': lambda d: int(d.get('created_time') or 0),
+    'expires': lambda d: int(d.get('expiration_time') or 0),
+    'type': lambda d: str(d.get('key_type') or 'general'),
+}
+
+class MessageFeed:
+    """Recent chat/announcement messages in an in-memory ring with monotonically increasing seq ids."""
+
+    def __init__(self, document: str, capacity: int = 200):
+        self.document = document
+        self.capacity = capacity
+        # Ordered by seq (and ts); trimmed back to `capacity` once it doubles so appends stay amortized O(1)
+        self.items: list[dict] = []
+        self.seq = 0
+        self.storage = None
+        self.flushes = 0
+        self.failures = 0
+        self._dirty = False
+        self._flush_handle = None
+        self._changed: Optional[asyncio.Event] = None
+
+    def load(self, storage):
+        """Fill the ring from the storage document, numbering legacy messages that have no seq yet"""
+        self.storage = storage
+        try:
+            msgs = storage.load_document(self.document, [])
+        except Exception:
+            msgs = []
+        if not isinstance(msgs, list):
+            msgs = []
+        for m in msgs[-self.capacity:]:
+            if not isinstance(m, dict):
+                continue
+            seq = int(m.get('seq') or 0)
+            if seq <= self.seq:
+                seq = self.seq + 1
+            m['seq'] = seq
+            self.seq = seq
+            self.items.append(m)
+
+    def window(self) -> list[dict]:
+        return self.items[-self.capacity:]
+
+    def append(self, message: dict) -> dict:
+        self.seq += 1
+        message['seq'] = self.seq
+        # Keep ts non-decreasing so the timestamp lookup can bisect too
+        if self.items and int(message.get('ts', 0) or 0) < int(self.items[-1].get('ts', 0) or 0):
+            message['ts'] = self.items[-1]['ts']
+        self.items.append(message)
+        if len(self.items) >= 2 * self.capacity:
+            del self.items[:-self.capacity]
+        self._dirty = True
+        self._schedule_flush()
+        # Wake every waiter on the current generation; later waiters get a fresh event
+        if self._changed is not None:
+            self._changed.set()
+            self._changed = None
+        return message
+
+    def since(self, after_seq: Optional[int] = None, since_ts: int = 0, limit: int = 100) -> list[dict]:
+        """Messages after a seq cursor (or, for older clients, newer than a timestamp), via bisect"""
+        if after_seq is not None:
+            idx = bisect.bisect_right(self.items, after_seq, key=lambda m: m['seq'])
+        else:
+            idx = bisect.bisect_right(self.items, since_ts, key=lambda m: int(m.get('ts', 0) or 0))
+        start = max(idx, len(self.items) - self.capacity, len(self.items) - limit)
+        return self.items[start:]
+
+    async def wait(self, after_seq: int, timeout: float) -> bool:
+        """Block until a message past after_seq exists or the timeout elapses"""
+        if self.seq > after_seq:
+            return True
+        if self._changed is None:
+            self._changed = asyncio.Event()
+        changed = self._changed
+        try:
+            await asyncio.wait_for(changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return self.seq > after_seq
+
+    def _schedule_flush(self, delay: Optional[float] = None):
+        if self._flush_handle is not None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # No loop (startup, scripts): write through
+            self.flush()
+            return
+        self._flush_handle = loop.call_later(FEED_FLUSH_SEC if delay is None else delay, lambda: loop.create_task(self._flush_async()))
+
+    def _write(self, msgs: list[dict]) -> bool:
+        try:
+            self.storage.save_document(self.document, msgs)
+            self.flushes += 1
+            return True
+        except Exception as e:
+            self._dirty = True
+            print(f"Error saving {self.document}: {e}")
+            return False
+
+    async def _flush_async(self):
+        self._flush_handle = None
+        if not self._dirty:
+            return
+        self._dirty = False
+        if await asyncio.get_running_loop().run_in_executor(None, self._write, self.window()):
+            self.failures = 0
+            return
+        # Retry with backoff instead of waiting for the next append
+        self.failures += 1
+        self._schedule_flush(min(FEED_FLUSH_SEC * 2 ** self.failures, 300))
+
+    def flush(self):
+        """Persist pending messages now (shutdown, or when no loop is running)"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if self._dirty:
+            self._dirty = False
+            self._write(self.window())
+
+    def stats(self) -> dict:
+        return {'seq': self.seq, 'size': len(self.window()), 'pending': self._dirty, 'flushes': self.flushes, 'failures': self.failures}
+
+chat_feed = MessageFeed('chat_messages')
+ann_feed = MessageFeed('announcements')
+chat_feed.load(key_manager.storage)
+ann_feed.load(key_manager.storage)
+
+def _on_key_event(event: str, key: str, user_ids: set):
+    if event == "expire":
+        key_manager.add_log('expire', key, user_id=next(iter(user_ids), None))
+    role_reconciler.mark(user_ids)
+    if event == "restore":
+        member_status_cache.invalidate()
+    else:
+        for uid in user_ids:
+            member_status_cache.invalidate(uid)
+
+key_manager.subscribe(_on_key_event)
 
 def normalize_key(raw: str | None) -> str:
     if not raw:
@@ -826,6 +3047,64 @@ def normalize_key(raw: str | None) -> str:
         k = k[1:-1]
     return k.strip()
 
+def _key_choices(current: str, user_ids: list[int], include_deleted: bool) -> list[app_commands.Choice[str]]:
+    """Autocomplete choices: keys of the given/typed user id first, then keys by prefix (never a full scan)"""
+    typed = normalize_key(current)
+    keys: list[str] = []
+    typed_uid = int(typed) if typed.isdigit() and len(typed) >= 15 else None
+    if typed_uid:
+        keys += sorted(key_manager.keys_for_user(typed_uid))
+    for uid in user_ids:
+        keys += sorted(k for k in key_manager.keys_for_user(uid) if k.startswith(typed))
+    if len(keys) < 25:
+        keys += key_manager.keys_with_prefix(typed, 25, include_deleted=include_deleted)
+    choices = []
+    seen = set()
+    for k in keys:
+        if k in seen:
+            continue
+        seen.add(k)
+        data = key_manager.keys.get(k)
+        label = f"{k} · {data.get('key_type', 'general')} · {key_status(data)}" if data is not None else f"{k} · deleted"
+        choices.append(app_commands.Choice(name=label[:100], value=k))
+        if len(choices) >= 25:
+            break
+    return choices
+
+# Command checks do not run for autocomplete, so each callback applies the same role test as its command
+async def key_autocomplete(interaction: discord.Interaction, current: str) -> list[app_commands.Choice[str]]:
+    if not _has_owner_role(interaction):
+        return []
+    return _key_choices(current, [], include_deleted=False)
+
+async def revoke_key_autocomplete(interaction: discord.Interaction, current: str) -> list[app_commands.Choice[str]]:
+    """/revoke is owner-only and also runs check_permissions, so it takes both roles"""
+    if not _has_admin_role(interaction):
+        return []
+    return await key_autocomplete(interaction, current)
+
+async def swap_key_autocomplete(interaction: discord.Interaction, current: str) -> list[app_commands.Choice[str]]:
+    """/swapkey is gated by check_permissions (admin role), not the owner role; offers the from_user's keys first"""
+    if not _has_admin_role(interaction):
+        return []
+    user_ids = []
+    from_user = getattr(interaction.namespace, 'from_user', None)
+    if from_user is not None:
+        user_ids.append(int(from_user.id))
+    return _key_choices(current, user_ids, include_deleted=False)
+
+async def any_key_autocomplete(interaction: discord.Interaction, current: str) -> list[app_commands.Choice[str]]:
+    """Like key_autocomplete, but also offers deleted keys (for lookups)"""
+    if not _has_owner_role(interaction):
+        return []
+    return _key_choices(current, [], include_deleted=True)
+
+async def own_key_autocomplete(interaction: discord.Interaction, current: str) -> list[app_commands.Choice[str]]:
+    """The invoking user's own keys only (for commands anyone can run)"""
+    typed = normalize_key(current)
+    keys = sorted(k for k in key_manager.keys_for_user(interaction.user.id) if k.startswith(typed))
+    return [app_commands.Choice(name=k, value=k) for k in keys[:25]]
+
 @bot.event
 async def on_ready():
     print(f'✅ {bot.user} has connected to Discord!')
@@ -837,8 +3116,23 @@ async def on_ready():
     
     # Start time for uptime
     bot.start_time = datetime.datetime.utcnow()
+    # Entries cached before a (re)connect may be stale
+    member_cache.invalidate()
     
     print("🤖 Bot is now ready and online!")
+    try:
+        backup_uploader.start(asyncio.get_running_loop())
+    except Exception:
+        pass
+    try:
+        role_reconciler.start(asyncio.get_running_loop())
+    except Exception:
+        pass
+    try:
+        if not getattr(bot, 'expiry_task', None) or bot.expiry_task.done():
+            bot.expiry_task = asyncio.get_running_loop().create_task(run_expiry_scheduler())
+    except Exception:
+        pass
     try:
         if not reconcile_roles_task.is_running():
             reconcile_roles_task.start()
@@ -898,6 +3192,13 @@ async def on_ready():
         except Exception:
             pass
 
+def _has_admin_role(interaction) -> bool:
+    """Member of our guild holding ADMIN_ROLE_ID (what check_permissions requires for non-public commands)"""
+    if not interaction.guild or interaction.guild.id != GUILD_ID:
+        return False
+    member = interaction.guild.get_member(interaction.user.id)
+    return bool(member and ADMIN_ROLE_ID in [role.id for role in member.roles])
+
 async def check_permissions(interaction) -> bool:
     """Check if user has permission to use bot commands"""
     if not interaction.guild:
@@ -920,8 +3221,7 @@ async def check_permissions(interaction) -> bool:
     if cmd_name in public_commands:
         return True
     # For all other commands, require admin role
-    has_admin_role = ADMIN_ROLE_ID in [role.id for role in member.roles]
-    return has_admin_role
+    return _has_admin_role(interaction)
 
 @app_commands.guilds(discord.Object(id=GUILD_ID))
 @bot.tree.command(name="activate", description="Activate a key and get the user role")
@@ -948,14 +3248,6 @@ async def activate_key(interaction: discord.Interaction, key: str):
             key_data = key_manager.get_key_info(key)
             duration_days = key_data.get("duration_days", 30) if key_data else 30
             
-            # Force immediate backup upload
-            try:
-                print(f"🔄 Triggering backup after key activation for user {interaction.user.id}")
-                payload = key_manager.build_backup_payload()
-                await upload_backup_snapshot(payload)
-            except Exception as e:
-                print(f"❌ Backup failed in activate command: {e}")
-            
             # Webhook notify
             try:
                 try:
@@ -991,6 +3283,7 @@ async def activate_key(interaction: discord.Interaction, key: str):
 # Removed duplicate sync command name to avoid conflicts
 @app_commands.guilds(discord.Object(id=GUILD_ID))
 @bot.tree.command(name="syncduration", description="Sync your key duration with SelfBot")
+@app_commands.autocomplete(key=own_key_autocomplete)
 async def sync_key(interaction: discord.Interaction, key: str):
     """Sync key duration with SelfBot"""
     try:
@@ -1038,6 +3331,7 @@ async def sync_key(interaction: discord.Interaction, key: str):
 @owner_role_only()
 @app_commands.guilds(discord.Object(id=GUILD_ID))
 @bot.tree.command(name="revoke", description="Revoke a specific key")
+@app_commands.autocomplete(key=revoke_key_autocomplete)
 async def revoke_key(interaction: discord.Interaction, key: str):
 	"""Revoke a specific key"""
 	
@@ -1045,13 +3339,6 @@ async def revoke_key(interaction: discord.Interaction, key: str):
 		return
 	
 	if key_manager.revoke_key(key):
-		# Force immediate backup upload after revoke
-		try:
-			payload = key_manager.build_backup_payload()
-			await upload_backup_snapshot(payload)
-		except Exception:
-			pass
-
 		embed = discord.Embed(
 			title="🗑️ Key Revoked",
 			description=f"Key `{key}` has been successfully revoked.",
@@ -1064,6 +3351,7 @@ async def revoke_key(interaction: discord.Interaction, key: str):
 @owner_role_only()
 @app_commands.guilds(discord.Object(id=GUILD_ID))
 @bot.tree.command(name="unrevoke", description="Unrevoke (re-enable) a revoked key")
+@app_commands.autocomplete(key=key_autocomplete)
 async def unrevoke_key(interaction: discord.Interaction, key: str):
 	"""Re-enable a previously revoked key and upload a backup."""
 	try:
@@ -1071,26 +3359,23 @@ async def unrevoke_key(interaction: discord.Interaction, key: str):
 		k = key.strip()
 		info = key_manager.get_key_info(k)
 		if not info:
-			await interaction.followup.send("❌ Key not found.", ephemeral=True); return
+			await _message("❌ Key not found.", ephemeral=True); return
 		# Set active
 		if k in key_manager.keys:
-			key_manager.keys[k]["is_active"] = True
-			key_manager.save_data()
+			with key_manager.write_lock:
+				key_manager.keys[k]["is_active"] = True
+				key_manager.commit('unrevoke', k)
 			try:
 				key_manager.add_log('unrevoke', k)
 			except Exception:
 				pass
-			# Immediate backup
-			try:
-				await upload_backup_snapshot(key_manager.build_backup_payload())
-			except Exception:
-				pass
 			embed = discord.Embed(title="✅ Key Unrevoked", description=f"Key `{k}` has been re-enabled.", color=0x22C55E)
-			await interaction.followup.send(embed=embed, ephemeral=True)
+			# _message flushes the batched journal write before the reply goes out
+			await _message(embed=embed, ephemeral=True)
 		else:
-			await interaction.followup.send("❌ Key not found.", ephemeral=True)
+			await _message("❌ Key not found.", ephemeral=True)
 	except Exception as e:
-		await interaction.followup.send(f"❌ Failed: {e}", ephemeral=True)
+		await _message(f"❌ Failed: {e}", ephemeral=True)
 
 @owner_role_only()
 @app_commands.guilds(discord.Object(id=GUILD_ID))
@@ -1124,6 +3409,7 @@ async def show_keys(interaction: discord.Interaction, user: Optional[discord.Mem
 @owner_role_only()
 @app_commands.guilds(discord.Object(id=GUILD_ID))
 @bot.tree.command(name="info", description="Get detailed information about a key")
+@app_commands.autocomplete(key=any_key_autocomplete)
 async def key_info(interaction: discord.Interaction, key: str):
     """Get detailed information about a key"""
     if not await check_permissions(interaction):
@@ -1163,21 +3449,27 @@ async def key_info(interaction: discord.Interaction, key: str):
 @app_commands.guilds(discord.Object(id=GUILD_ID))
 @bot.tree.command(name="backup", description="Create a backup of all keys")
 async def backup_keys(interaction: discord.Interaction):
-	"""Create a backup of all keys"""
+	"""Create a point-in-time snapshot of all keys"""
 	
 	if not await check_permissions(interaction):
 		return
 	
-	backup_file = key_manager.backup_keys()
+	entry = await asyncio.get_running_loop().run_in_executor(None, functools.partial(key_manager.take_snapshot, force_full=True))
+	if not entry:
+		await _message("❌ Failed to write snapshot.", ephemeral=True)
+		return
 	
 	embed = discord.Embed(
 		title="💾 Backup Created",
-		description=f"Keys backup saved to `{backup_file}`",
+		description=f"Snapshot saved to `{entry['file']}`",
 		color=0x00ff00
 	)
 	
 	embed.add_field(name="Total Keys", value=len(key_manager.keys), inline=True)
-	embed.add_field(name="Backup Time", value=f"<t:{int(time.time())}:F>", inline=True)
+	embed.add_field(name="Backup Time", value=f"<t:{entry['ts']}:F>", inline=True)
+	recent = key_manager.snapshots.list()[:10]
+	lines = [f"`{e['ts']}` — {e['kind']} — {e.get('keys', 0)} keys — <t:{e['ts']}:R>" for e in recent]
+	embed.add_field(name="Recent Snapshots (use /restore with the id)", value="\n".join(lines) or "None", inline=False)
 	
 	await _message(embed=embed)
 
@@ -1185,16 +3477,21 @@ async def backup_keys(interaction: discord.Interaction):
 @app_commands.guilds(discord.Object(id=GUILD_ID))
 @bot.tree.command(name="restore", description="Restore keys from a backup file")
 async def restore_keys(interaction: discord.Interaction, backup_file: str):
-	"""Restore keys from a backup file"""
+	"""Restore keys from a snapshot id (see /backup) or a backup file"""
 	
 	if not await check_permissions(interaction):
 		return
 	
-	if not os.path.exists(backup_file):
+	backup_file = backup_file.strip()
+	if backup_file.isdigit():
+		ok = key_manager.restore_snapshot(int(backup_file))
+	elif not os.path.exists(backup_file):
 		await _message("❌ Backup file not found.", ephemeral=True)
 		return
+	else:
+		ok = key_manager.restore_from_backup(backup_file)
 	
-	if key_manager.restore_from_backup(backup_file):
+	if ok:
 		embed = discord.Embed(
 			title="🔄 Backup Restored",
 			description="Keys have been successfully restored from backup.",
@@ -1217,12 +3514,13 @@ async def bot_status(interaction: discord.Interaction):
 	if not await check_permissions(interaction):
 		return
 	
-	total_keys = len(key_manager.keys)
-	active_keys = sum(1 for k in key_manager.keys.values() if k["is_active"])
-	revoked_keys = total_keys - active_keys
+	agg = key_manager.aggregates()
+	total_keys = agg["total_keys"]
+	active_keys = agg["active_keys"]
+	revoked_keys = agg["revoked_keys"]
 	
-	# Calculate total usage
-	total_usage = sum(k.get("usage_count", 0) for k in key_manager.key_usage.values())
+	# Total usage is kept up to date on every key mutation
+	total_usage = agg["total_usage"]
 	
 	embed = discord.Embed(
 		title="📊 Bot Status",
@@ -1233,6 +3531,8 @@ async def bot_status(interaction: discord.Interaction):
 	embed.add_field(name="Active Keys", value=active_keys, inline=True)
 	embed.add_field(name="Revoked Keys", value=revoked_keys, inline=True)
 	embed.add_field(name="Total Usage", value=total_usage, inline=True)
+	embed.add_field(name="Active by Type", value="\n".join(
+		f"{t}: {n} ({agg['available_keys'].get(t, 0)} available)" for t, n in agg["keys_by_type"].items()), inline=False)
 	embed.add_field(name="Uptime", value=f"<t:{int(bot.start_time.timestamp())}:R>", inline=True)
 	embed.add_field(name="Latency", value=f"{round(bot.latency * 1000)}ms", inline=True)
 	
@@ -1256,13 +3556,6 @@ async def generate_bulk_keys(interaction: discord.Interaction, daily_count: int,
     # Generate the keys
     generated_keys = key_manager.generate_bulk_keys(daily_count, weekly_count, monthly_count, lifetime_count)
 
-    # Force immediate backup upload after key generation
-    try:
-        payload = key_manager.build_backup_payload()
-        await upload_backup_snapshot(payload)
-    except Exception:
-        pass
-
     # Create embed showing what was generated
     embed = discord.Embed(
         title="🔑 Bulk Keys Generated Successfully!",
@@ -1275,6 +3568,8 @@ async def generate_bulk_keys(interaction: discord.Interaction, daily_count: int,
     embed.add_field(name="📅 Monthly Keys (30 days)", value=f"Generated: {len(generated_keys['monthly'])}", inline=True)
     embed.add_field(name="📅 Lifetime Keys (365 days)", value=f"Generated: {len(generated_keys['lifetime'])}", inline=True)
     
+    stats = key_manager.last_bulk_stats or {}
+    embed.add_field(name="⚡ Throughput", value=f"{stats.get('keys', 0)} keys in {stats.get('seconds', 0)}s ({stats.get('keys_per_sec', 0)} keys/s)", inline=False)
     embed.add_field(name="💾 Status", value="✅ All keys saved to database and website", inline=False)
     embed.add_field(name="📱 Website", value="Keys are now available on your website!", inline=False)
     
@@ -1340,17 +3635,11 @@ async def view_available_keys(interaction: discord.Interaction):
 @owner_role_only()
 @app_commands.guilds(discord.Object(id=GUILD_ID))
 @bot.tree.command(name="delete", description="Completely delete a key ()")
+@app_commands.autocomplete(key=key_autocomplete)
 async def delete_key(interaction: discord.Interaction, key: str):
     """Completely delete a key - """
         
     if key_manager.delete_key(key):
-        # Force immediate backup upload after delete
-        try:
-            payload = key_manager.build_backup_payload()
-            await upload_backup_snapshot(payload)
-        except Exception:
-            pass
-
         embed = discord.Embed(
             title="🗑️ Key Deleted",
             description=f"Key `{key}` has been completely deleted and moved to deleted database.",
@@ -1414,8 +3703,9 @@ async def active_keys(interaction: discord.Interaction):
 
 	now = int(time.time())
 	active_items = []
-	for key, data in key_manager.keys.items():
-		if data.get("is_active", False):
+	for key in key_manager.keys_with_status("active") + key_manager.keys_with_status("unassigned"):
+		data = key_manager.keys.get(key)
+		if data is not None:
 			expires = data.get("expiration_time")
 			exp_ts = int(expires or 0)
 			remaining = max(0, exp_ts - now)
@@ -1457,7 +3747,11 @@ async def expired_keys(interaction: discord.Interaction):
 		return
 	now = int(time.time())
 	items = []
-	for key, data in key_manager.keys.items():
+	# Expired-by-time keys plus revoked keys that have also run out
+	for key in key_manager.keys_with_status("expired") + key_manager.keys_with_status("revoked"):
+		data = key_manager.keys.get(key)
+		if data is None:
+			continue
 		expires = data.get("expiration_time", 0)
 		if expires and expires <= now:
 			user_id = data.get("user_id", 0)
@@ -1491,18 +3785,19 @@ async def swap_machine_id(interaction: discord.Interaction, user: discord.Member
 	try:
 		# Find the user's active key
 		key = None
-		for k, data in key_manager.keys.items():
-			if data.get('user_id') == user.id and data.get('is_active', False):
+		for k in key_manager.keys_for_user(user.id):
+			if key_manager.keys.get(k, {}).get('is_active', False):
 				key = k
 				break
 		if not key:
 			await _message("❌ No active key found for that user.", ephemeral=True)
 			return
 		# Update the machine_id
-		data = key_manager.keys[key]
-		data['machine_id'] = str(new_machine_id)
-		# Save
-		key_manager.save_data()
+		with key_manager.write_lock:
+			data = key_manager.keys[key]
+			data['machine_id'] = str(new_machine_id)
+			# Save
+			key_manager.commit('rebind', key)
 		try:
 			key_manager.add_log('rebind', key, user_id=str(user.id), details={'machine_id': str(new_machine_id)})
 		except Exception:
@@ -1539,9 +3834,29 @@ async def sync_commands(interaction: discord.Interaction):
 @bot.event
 async def on_member_join(member):
     """Automatically give role to new members if they have a valid key"""
+    member_cache.update(member)
     # This would be triggered when someone joins with a valid key
     # Implementation depends on your activation flow
-    pass
+
+@bot.event
+async def on_member_update(before, after):
+    member_cache.update(after)
+
+@bot.event
+async def on_member_remove(member):
+    if member.guild.id == GUILD_ID:
+        member_cache.remove(member.id)
+
+@bot.event
+async def on_guild_role_update(before, after):
+    # A rename can change who matches ROLE_NAME; entries rebuild lazily from the gateway cache
+    if after.guild.id == GUILD_ID:
+        member_cache.invalidate()
+
+@bot.event
+async def on_guild_role_delete(role):
+    if role.guild.id == GUILD_ID:
+        member_cache.invalidate()
 
 # Error handling for slash commands
 @bot.tree.error
@@ -1600,13 +3915,61 @@ async def on_command_error(ctx, error):
         await ctx.send(f"❌ An error occurred: {str(error)}")
 
 
-# Add a simple health check for Render
-import http.server
-import socketserver
-import threading
+class LatencyHistogram:
+    """Per-route request latency counted into fixed millisecond buckets"""
+
+    BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
 
-def start_health_check():
-    """Start a simple HTTP server for health checks"""
+    def __init__(self):
+        self._routes: dict[str, dict] = {}
+
+    def observe(self, route: str, seconds: float):
+        ms = seconds * 1000.0
+        h = self._routes.get(route)
+        if h is None:
+            h = self._routes[route] = {'count': 0, 'sum_ms': 0.0, 'max_ms': 0.0, 'buckets': [0] * (len(self.BUCKETS_MS) + 1)}
+        h['count'] += 1
+        h['sum_ms'] += ms
+        h['max_ms'] = max(h['max_ms'], ms)
+        h['buckets'][bisect.bisect_left(self.BUCKETS_MS, ms)] += 1
+
+    def _quantile(self, h: dict, q: float) -> float:
+        # Upper bound of the bucket holding the q-th observation
+        rank = q * h['count']
+        seen = 0
+        for i, n in enumerate(h['buckets']):
+            seen += n
+            if seen >= rank and n:
+                return float(self.BUCKETS_MS[i]) if i < len(self.BUCKETS_MS) else round(h['max_ms'], 2)
+        return 0.0
+
+    def snapshot(self) -> dict:
+        out = {}
+        for route, h in sorted(self._routes.items()):
+            labels = [f"<={b}ms" for b in self.BUCKETS_MS] + [f">{self.BUCKETS_MS[-1]}ms"]
+            out[route] = {
+                'count': h['count'],
+                'avg_ms': round(h['sum_ms'] / h['count'], 2) if h['count'] else 0.0,
+                'max_ms': round(h['max_ms'], 2),
+                'p50_ms': self._quantile(h, 0.50),
+                'p95_ms': self._quantile(h, 0.95),
+                'p99_ms': self._quantile(h, 0.99),
+                'buckets': {label: n for label, n in zip(labels, h['buckets']) if n},
+            }
+        return out
+
+route_latency = LatencyHistogram()
+
+# Typed per-request keys (plain str keys make aiohttp emit NotAppKeyWarning on every request; older aiohttp has no RequestKey)
+if hasattr(web, 'RequestKey'):
+    ROUTE_NAME = web.RequestKey('route_name', str)
+    STREAMING = web.RequestKey('streaming', bool)
+else:
+    ROUTE_NAME, STREAMING = 'route_name', 'streaming'
+
+# Web panel and selfbot API, served by aiohttp on the bot's event loop
+def build_web_app() -> web.Application:
+    """Build the aiohttp app for the panel, the selfbot API and Render's health check"""
     import base64, json as _json, hmac, hashlib
 
     def _sign_payload(payload: str) -> str:
@@ -1638,6 +4001,15 @@ def start_health_check():
         except Exception:
             return None
 
+    def _backup_chunks():
+        """JSON text of {'keys', 'usage', 'deleted_keys'} from one consistent snapshot, one record per piece"""
+        snap = key_manager.snapshot()
+        for name, section in (('keys', snap['keys']), ('usage', snap['usage']), ('deleted_keys', snap['deleted'])):
+            yield ('{' if name == 'keys' else '},') + json.dumps(name) + ':{'
+            for i, (k, d) in enumerate(section.items()):
+                yield ('' if i == 0 else ',') + json.dumps(k) + ':' + json.dumps(d, separators=(',', ':'))
+        yield '}}'
+
     def _parse_cookies(header: str) -> dict:
         cookies = {}
         if not header:
@@ -1653,8 +4025,9 @@ def start_health_check():
         now_ts = int(time.time())
         bound_ok = False
         has_active = False
-        for key, data in key_manager.keys.items():
-            if int(data.get('user_id', 0) or 0) != int(uid):
+        for key in key_manager.keys_for_user(uid):
+            data = key_manager.keys.get(key)
+            if data is None:
                 continue
             exp = data.get('expiration_time') or 0
             if not data.get('is_active', False):
@@ -1666,1501 +4039,1641 @@ def start_health_check():
                 bound_ok = True
         return bound_ok if machine_id else has_active
 
-    class HealthCheckHandler(http.server.BaseHTTPRequestHandler):
-        def do_HEAD(self):
-            if self.path == '/':
-                self.send_response(200)
-                self.send_header('Content-type', 'text/html')
-                self.end_headers()
-                return
-            self.send_response(404)
-            self.end_headers()
- 
-        def do_GET(self):
-            try:
-                # Session check (kept for potential future use)
-                cookies = _parse_cookies(self.headers.get('Cookie'))
-                session = _decode_session(cookies.get('panel_session')) if cookies.get('panel_session') else None
-                authed_uid = int(session.get('user_id')) if session else None
-                authed_mid = str(session.get('machine_id')) if session else None
-                authed_ok = (_has_active_access(authed_uid, authed_mid) if authed_uid is not None else False)
-
-                # Public panel: no login gating; remove legacy commented block
-
-                if self.path.startswith('/login'):
-                    # Redirect away from legacy login to the dashboard (no login used)
-                    self.send_response(303)
-                    self.send_header('Location', '/')
-                    self.end_headers()
-                    return
-
-                if self.path == '/logout':
-                    self.send_response(303)
-                    self.send_header('Set-Cookie', 'panel_session=; Path=/; HttpOnly; SameSite=Lax; Max-Age=0')
-                    self.send_header('Location', '/login')
-                    self.end_headers()
-                    return
+    def _encode_cursor(sort: str, order: str, skey: tuple) -> str:
+        return base64.urlsafe_b64encode(_json.dumps([sort, order, *skey], separators=(',', ':')).encode()).decode().rstrip('=')
 
-                if self.path == '/sender':
-                    self.send_response(200)
-                    self.send_header('Content-type', 'text/html')
-                    self.end_headers()
-                    page = f"""
-                    <html><head><title>Message Sender</title>
-                      <style>
-                        body{{font-family:Inter,Arial,sans-serif;background:#0b1020;color:#e6e9f0;margin:0}}
-                        header{{background:#0e1630;border-bottom:1px solid #1f2a4a;padding:16px 24px;display:flex;gap:16px;align-items:center}}
-                        main{{padding:24px;max-width:720px;margin:0 auto}}
-                        .card{{background:#0e1630;border:1px solid #1f2a4a;border-radius:12px;padding:20px}}
-                        label{{display:block;margin:10px 0 6px}}
-                        input,textarea,button{{padding:10px 12px;border-radius:8px;border:1px solid #2a3866;background:#0b132b;color:#e6e9f0;width:100%}}
-                        textarea{{min-height:140px;resize:vertical}}
-                        button{{cursor:pointer;background:#2a5bff;border-color:#2a5bff;width:auto}}
-                        button:hover{{background:#2248cc}}
-                        a.nav{{color:#9ab0ff;text-decoration:none;padding:8px 12px;border-radius:8px;background:#121a36}}
-                        a.nav:hover{{background:#1a2448}}
-                      </style>
-                    </head>
-                    <body>
-                      <header>
-                        <a class='nav' href='/'>Dashboard</a>
-                        <a class='nav' href='/keys'>Keys</a>
-                        <a class='nav' href='/my'>My Keys</a>
-                        <a class='nav' href='/sender'>Sender</a>
-                        <a class='nav' href='/logout'>Logout</a>
-                      </header>
-                      <main>
-                        <div class='card'>
-                          <h2>Send a Message</h2>
-                          <form method='POST' action='/sender'>
-                            <label>Channel ID</label>
-                            <input type='text' name='channel_id' placeholder='Target channel ID' required />
-                            <label>Message</label>
-                            <textarea name='content' placeholder='Type your message...' required></textarea>
-                            <div style='margin-top:12px'><button type='submit'>Send</button></div>
-                          </form>
-                          <p class='muted' style='margin-top:10px'>Messages are sent by the bot and require the bot to have permission in the channel.</p>
-                        </div>
-                      </main>
-                    </body></html>
+    def _decode_cursor(token: str, sort: str, order: str) -> Optional[tuple]:
+        """(sort value, key) from a cursor made for this sort and order, else None"""
+        if not token:
+            return None
+        try:
+            c_sort, c_order, value, key = _json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode())
+        except Exception:
+            return None
+        # Sort values of another type (e.g. a sort=type cursor reused with sort=created) cannot be compared
+        expected = type(KEY_SORTS[sort]({}))
+        if c_sort != sort or c_order != order or type(value) is not expected or not isinstance(key, str):
+            return None
+        return (value, key)
+
+    def _fmt_remaining(sec: int, not_activated: bool, key_type: str) -> str:
+        if key_type == 'lifetime':
+            return '∞'
+        if not_activated:
+            return 'Not activated yet'
+        d=sec//86400; h=(sec%86400)//3600; m=(sec%3600)//60
+        return f"{d}d {h}h {m}m" if sec>0 else '—'
+
+    def _key_row_html(r: dict) -> str:
+        safe_key = html.escape(r['key'])
+        exp_cell = ('<t:'+str(r['expires'])+':R>') if r['expires'] else ('∞' if r['type']=='lifetime' else '—')
+        user = f"<@{r['user_id']}>" if r['user_id'] else 'Unassigned'
+        return f"""
+                    <tr>
+                      <td><code>{safe_key}</code></td>
+                      <td>{html.escape(r['type'])}</td>
+                      <td>{html.escape(r['status'].capitalize())}</td>
+                      <td>{user}</td>
+                      <td>{_fmt_remaining(r['remaining'], r['not_activated'], r['type'])}</td>
+                      <td>{exp_cell}</td>
+                      <td style='display:flex;gap:6px'>
+                        <form method='POST' action='/revoke' onsubmit="return confirm('Revoke this key?')">
+                          <input type='hidden' name='key' value='{safe_key}'/>
+                          <button type='submit'>Revoke</button>
+                        </form>
+                        <form method='POST' action='/delete' onsubmit="return confirm('Delete this key?')">
+                          <input type='hidden' name='key' value='{safe_key}'/>
+                          <button type='submit'>Delete</button>
+                        </form>
+                      </td>
+                    </tr>
                     """
-                    self.wfile.write(page.encode())
-                    return
 
-                # Simple HTML form for generating keys
-                if self.path == '/generate-form':
-                    self.send_response(200)
-                    self.send_header('Content-type', 'text/html')
-                    self.end_headers()
-                    # Build sidebar content for last generated keys
-                    lg = key_manager.last_generated or {"daily":[],"weekly":[],"monthly":[],"lifetime":[]}
-                    def block(name, arr):
-                        if not arr: return f"<p class='muted'>No {name.lower()} keys yet</p>"
-                        lis = ''.join([f"<li><code>{html.escape(k)}</code></li>" for k in arr[:50]])
-                        more = f"<p class='muted'>...and {len(arr)-50} more</p>" if len(arr)>50 else ''
-                        return f"<h4>{name}</h4><ul>{lis}</ul>{more}"
-                    
-                    form_html = f"""
-                    <html><head><title>Generate Keys</title>
-                      <style>
-                        :root {{ --bg:#0b0718; --panel:#120a2a; --muted:#b399ff; --border:#1f1440; --text:#efeaff; --accent:#6c4af2; }}
-                        * {{ box-sizing: border-box; }}
-                        body {{ margin:0; font-family: Inter, system-ui, -apple-system, Segoe UI, Roboto, Arial, sans-serif; background: var(--bg); color: var(--text); }}
-                        header {{ background: var(--panel); border-bottom:1px solid var(--border); padding: 16px 24px; display:flex; gap:12px; align-items:center }}
-                        a.nav {{ color: var(--muted); text-decoration:none; padding:8px 12px; border-radius:10px; background:#1a1240; border:1px solid #1f1440 }}
-                        a.nav:hover {{ background:#1e154d }}
-                        main {{ padding:24px; max-width:1100px; margin:0 auto }}
-                        .layout {{ display:grid; grid-template-columns: 1.2fr 0.8fr; gap:16px }}
-                        .card {{ background: var(--panel); border:1px solid var(--border); border-radius:14px; padding:18px }}
-                        label {{ display:block; margin:10px 0 6px }}
-                        input,button {{ padding:10px 12px; border-radius:10px; border:1px solid #2a3866; background:#0b132b; color:var(--text) }}
-                        input[type=number] {{ width:120px }}
-                        button {{ cursor:pointer; background: var(--accent); border-color:#2049cc }}
-                        button:hover {{ filter:brightness(0.95) }}
-                        ul {{ margin:8px 0 0 20px }}
-                        code {{ background:#121a36; padding:2px 6px; border-radius:6px }}
-                        .muted {{ color:#a4b1d6 }}
-                      </style>
-                    </head>
-                    <body>
-                      <header>
-                        <div class='brand' style='font-size:22px;font-weight:800;letter-spacing:0.6px'>CS BOT <span style='font-weight:600;color:#b799ff'>made by iris&classical</span></div>
-                        <a class='nav' href='/'>Dashboard</a>
-                        <a class='nav' href='/keys'>Keys</a>
-                        <a class='nav' href='/my'>My Keys</a>
-                        <a class='nav' href='/deleted'>Deleted</a>
-                        <a class='nav' href='/backup'>Backup</a>
-                        <a class='nav' href='/generate-form'>Generate</a>
-                      </header>
-                      <main>
-                        <div class='layout'>
-                          <div class='card'>
-                            <h2>Generate Keys</h2>
-                            <form method='POST' action='/generate'>
-                              <label>Daily</label><input type='number' name='daily' min='0' value='0'/>
-                              <label>Weekly</label><input type='number' name='weekly' min='0' value='0'/>
-                              <label>Monthly</label><input type='number' name='monthly' min='0' value='0'/>
-                              <label>Lifetime</label><input type='number' name='lifetime' min='0' value='0'/>
-                              <div style='margin-top:12px'>
-                                <button type='submit'>Generate</button>
-                              </div>
-                            </form>
-                          </div>
-                          <div class='card'>
-                            <div>
-                              <h3 style='display:inline'>Last Generated</h3>
-                              <form method='GET' action='/generate-form' style='display:inline'>
-                                <button class='closebtn' title='Close panel'>&times;</button>
-                              </form>
-                            </div>
-                            {block('Daily', lg.get('daily', []))}
-                            {block('Weekly', lg.get('weekly', []))}
-                            {block('Monthly', lg.get('monthly', []))}
-                            {block('Lifetime', lg.get('lifetime', []))}
-                          </div>
-                        </div>
-                      </main>
-                    </body></html>
-                    """
-                    self.wfile.write(form_html.encode())
-                    return
+    def _accepts_gzip(request: web.Request) -> bool:
+        for part in (request.headers.get('Accept-Encoding') or '').lower().split(','):
+            coding, _, params = part.strip().partition(';')
+            if coding.strip() in ('gzip', '*'):
+                return params.replace(' ', '') not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000')
+        return False
 
-                if self.path.startswith('/keys'):
-                    # Filters
-                    parsed = urllib.parse.urlparse(self.path)
-                    q = urllib.parse.parse_qs(parsed.query or '')
-                    filter_status = (q.get('status', ['all'])[0]).lower()
-                    filter_type = (q.get('type', ['all'])[0]).lower()
-
-                    sel = {
-                        'status_all': 'selected' if filter_status=='all' else '',
-                        'status_active': 'selected' if filter_status=='active' else '',
-                        'status_unassigned': 'selected' if filter_status=='unassigned' else '',
-                        'status_expired': 'selected' if filter_status=='expired' else '',
-                        'status_revoked': 'selected' if filter_status=='revoked' else '',
-                        'type_all': 'selected' if filter_type=='all' else '',
-                        'type_daily': 'selected' if filter_type=='daily' else '',
-                        'type_weekly': 'selected' if filter_type=='weekly' else '',
-                        'type_monthly': 'selected' if filter_type=='monthly' else '',
-                        'type_lifetime': 'selected' if filter_type=='lifetime' else '',
-                        'type_general': 'selected' if filter_type=='general' else ''
-                    }
+    def _is_compressible(content_type: str) -> bool:
+        ct = (content_type or '').lower()
+        return ct.startswith('text/') or 'json' in ct or 'javascript' in ct
 
-                    now_ts = int(time.time())
-                    rows = []
-                    for key, data in key_manager.keys.items():
-                        key_type = data.get('key_type', 'general')
-                        expires = data.get('expiration_time')
+    class PanelRequest:
+        """One aiohttp request behind the send_response/send_header/wfile surface the routes below use"""
+
+        def __init__(self, request: web.Request, body: bytes):
+            self.request = request
+            self.command = request.method
+            self.path = request.raw_path
+            self.headers = request.headers
+            self.client_address = (request.remote or '', 0)
+            self.rfile = io.BytesIO(body)
+            self.wfile = io.BytesIO()
+            self._status = 200
+            self._headers: list[tuple[str, str]] = []
+
+        def send_response(self, code: int, message: Optional[str] = None):
+            self._status = int(code)
+
+        def send_header(self, name: str, value):
+            self._headers.append((name, str(value)))
+
+        def end_headers(self):
+            pass
+
+        def response(self) -> web.Response:
+            # aiohttp computes Content-Length itself and keeps the connection alive
+            headers = CIMultiDict((k, v) for k, v in self._headers if k.lower() != 'content-length')
+            return web.Response(status=self._status, headers=headers, body=self.wfile.getvalue())
+
+        def require_session(self) -> bool:
+            """Decode the panel session cookie; redirects to /login and returns False without an active one"""
+            cookies = _parse_cookies(self.headers.get('Cookie'))
+            session = _decode_session(cookies.get('panel_session')) if cookies.get('panel_session') else None
+            self.authed_uid = int(session.get('user_id')) if session else None
+            self.authed_mid = str(session.get('machine_id')) if session else None
+            if not self.authed_uid or not _has_active_access(self.authed_uid, self.authed_mid):
+                self.send_response(303)
+                self.send_header('Location', '/login')
+                self.end_headers()
+                return False
+            return True
+
+        @staticmethod
+        def _feed_cursor(q: dict, feed: "MessageFeed") -> tuple[int, Optional[int], float]:
+            """(since_ts, after_seq, wait_sec) from poll query params"""
+            def num(name, default):
+                try:
+                    return int(q.get(name, [default])[0])
+                except Exception:
+                    return default
+            since_ts = num('since', 0)
+            after_seq = num('after', None) if q.get('after') else None
+            # A cursor past our head means the server's history was reset; resend what we have
+            if after_seq is not None and after_seq > feed.seq:
+                after_seq = 0
+            wait = max(0, min(num('wait', 0) or 0, LONGPOLL_MAX_SEC))
+            return since_ts, after_seq, wait
+
+        async def _stream_chunks(self, content_type: str, chunks, headers: Optional[dict] = None) -> web.StreamResponse:
+            """Chunked response written as the pieces are produced (gzip when accepted), never as one buffer"""
+            resp = web.StreamResponse(headers={'Content-Type': content_type, 'Vary': 'Accept-Encoding', **(headers or {})})
+            if _accepts_gzip(self.request):
+                resp.enable_compression(web.ContentCoding.gzip)
+            await resp.prepare(self.request)
+            chunks = iter(chunks)
+
+            def next_piece() -> bytes:
+                buf: list[str] = []
+                size = 0
+                for chunk in chunks:
+                    buf.append(chunk)
+                    size += len(chunk)
+                    if size >= STREAM_CHUNK_BYTES:
+                        break
+                return ''.join(buf).encode()
+            # Producing the pieces is CPU-bound (serializing records), so it runs in the executor between writes
+            loop = asyncio.get_running_loop()
+            try:
+                while True:
+                    piece = await loop.run_in_executor(None, next_piece)
+                    if not piece:
+                        break
+                    await resp.write(piece)
+                await resp.write_eof()
+            except Exception as e:
+                # Headers are already out, so no error response is possible; drop the connection
+                # instead of ending the chunked body, so the client sees a truncated download
+                print(f"❌ Stream for {self.path} aborted: {e}")
+                resp.force_close()
+                if self.request.transport is not None:
+                    self.request.transport.close()
+            return resp
+
+        async def _stream_feed(self, feed: "MessageFeed") -> web.StreamResponse:
+            """Server-Sent Events: one 'message' event per feed item, id = seq"""
+            q = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query or '')
+            try:
+                # An explicit ?after= wins (after=0 replays from the start), then the reconnect header
+                if 'after' in q:
+                    after = int(q['after'][0])
+                elif self.headers.get('Last-Event-ID'):
+                    after = int(self.headers['Last-Event-ID'])
+                else:
+                    after = feed.seq
+            except Exception:
+                after = feed.seq
+            if after > feed.seq:
+                after = 0
+            self.request[STREAMING] = True
+            resp = web.StreamResponse(headers={
+                'Content-Type': 'text/event-stream',
+                'Cache-Control': 'no-cache',
+                'X-Accel-Buffering': 'no',
+            })
+            await resp.prepare(self.request)
+            try:
+                await resp.write(b"retry: 3000\n\n")
+                while True:
+                    for m in feed.since(after, limit=feed.capacity):
+                        await resp.write(f"id: {m['seq']}\nevent: message\ndata: {json.dumps(m, separators=(',', ':'))}\n\n".encode())
+                        after = m['seq']
+                    if not await feed.wait(after, LONGPOLL_MAX_SEC):
+                        await resp.write(b": keep-alive\n\n")
+            except (ConnectionResetError, RuntimeError):
+                pass
+            return resp
+
+        async def get_chat_stream(self):
+            return await self._stream_feed(chat_feed)
+
+        async def get_ann_stream(self):
+            return await self._stream_feed(ann_feed)
+
+        async def head_index(self):
+            self.send_response(200)
+            self.send_header('Content-type', 'text/html')
+            self.end_headers()
+
+        async def not_found(self):
+            if self.command == 'HEAD':
+                self.send_response(404)
+                self.end_headers()
+                return
+            # Redirect unknown routes to dashboard instead of 404
+            self.send_response(303)
+            self.send_header('Location', '/')
+            self.end_headers()
+
+        async def get_login(self):
+            # Redirect away from legacy login to the dashboard (no login used)
+            self.send_response(303)
+            self.send_header('Location', '/')
+            self.end_headers()
+            return
+
+        async def get_logout(self):
+            self.send_response(303)
+            self.send_header('Set-Cookie', 'panel_session=; Path=/; HttpOnly; SameSite=Lax; Max-Age=0')
+            self.send_header('Location', '/login')
+            self.end_headers()
+            return
+
+        async def get_sender(self):
+            self.send_response(200)
+            self.send_header('Content-type', 'text/html')
+            self.end_headers()
+            page = f"""
+            <html><head><title>Message Sender</title>
+              <style>
+                body{{font-family:Inter,Arial,sans-serif;background:#0b1020;color:#e6e9f0;margin:0}}
+                header{{background:#0e1630;border-bottom:1px solid #1f2a4a;padding:16px 24px;display:flex;gap:16px;align-items:center}}
+                main{{padding:24px;max-width:720px;margin:0 auto}}
+                .card{{background:#0e1630;border:1px solid #1f2a4a;border-radius:12px;padding:20px}}
+                label{{display:block;margin:10px 0 6px}}
+                input,textarea,button{{padding:10px 12px;border-radius:8px;border:1px solid #2a3866;background:#0b132b;color:#e6e9f0;width:100%}}
+                textarea{{min-height:140px;resize:vertical}}
+                button{{cursor:pointer;background:#2a5bff;border-color:#2a5bff;width:auto}}
+                button:hover{{background:#2248cc}}
+                a.nav{{color:#9ab0ff;text-decoration:none;padding:8px 12px;border-radius:8px;background:#121a36}}
+                a.nav:hover{{background:#1a2448}}
+              </style>
+            </head>
+            <body>
+              <header>
+                <a class='nav' href='/'>Dashboard</a>
+                <a class='nav' href='/keys'>Keys</a>
+                <a class='nav' href='/my'>My Keys</a>
+                <a class='nav' href='/sender'>Sender</a>
+                <a class='nav' href='/logout'>Logout</a>
+              </header>
+              <main>
+                <div class='card'>
+                  <h2>Send a Message</h2>
+                  <form method='POST' action='/sender'>
+                    <label>Channel ID</label>
+                    <input type='text' name='channel_id' placeholder='Target channel ID' required />
+                    <label>Message</label>
+                    <textarea name='content' placeholder='Type your message...' required></textarea>
+                    <div style='margin-top:12px'><button type='submit'>Send</button></div>
+                  </form>
+                  <p class='muted' style='margin-top:10px'>Messages are sent by the bot and require the bot to have permission in the channel.</p>
+                </div>
+              </main>
+            </body></html>
+            """
+            self.wfile.write(page.encode())
+            return
+
+        # Simple HTML form for generating keys
+        async def get_generate_form(self):
+            self.send_response(200)
+            self.send_header('Content-type', 'text/html')
+            self.end_headers()
+            # Build sidebar content for last generated keys
+            lg = key_manager.last_generated or {"daily":[],"weekly":[],"monthly":[],"lifetime":[]}
+            def block(name, arr):
+                if not arr: return f"<p class='muted'>No {name.lower()} keys yet</p>"
+                lis = ''.join([f"<li><code>{html.escape(k)}</code></li>" for k in arr[:50]])
+                more = f"<p class='muted'>...and {len(arr)-50} more</p>" if len(arr)>50 else ''
+                return f"<h4>{name}</h4><ul>{lis}</ul>{more}"
+            bs = key_manager.last_bulk_stats
+            throughput = f"<p class='muted'>{bs.get('keys', 0)} keys in {bs.get('seconds', 0)}s ({bs.get('keys_per_sec', 0)} keys/s)</p>" if bs else ''
+
+            form_html = f"""
+            <html><head><title>Generate Keys</title>
+              <style>
+                :root {{ --bg:#0b0718; --panel:#120a2a; --muted:#b399ff; --border:#1f1440; --text:#efeaff; --accent:#6c4af2; }}
+                * {{ box-sizing: border-box; }}
+                body {{ margin:0; font-family: Inter, system-ui, -apple-system, Segoe UI, Roboto, Arial, sans-serif; background: var(--bg); color: var(--text); }}
+                header {{ background: var(--panel); border-bottom:1px solid var(--border); padding: 16px 24px; display:flex; gap:12px; align-items:center }}
+                a.nav {{ color: var(--muted); text-decoration:none; padding:8px 12px; border-radius:10px; background:#1a1240; border:1px solid #1f1440 }}
+                a.nav:hover {{ background:#1e154d }}
+                main {{ padding:24px; max-width:1100px; margin:0 auto }}
+                .layout {{ display:grid; grid-template-columns: 1.2fr 0.8fr; gap:16px }}
+                .card {{ background: var(--panel); border:1px solid var(--border); border-radius:14px; padding:18px }}
+                label {{ display:block; margin:10px 0 6px }}
+                input,button {{ padding:10px 12px; border-radius:10px; border:1px solid #2a3866; background:#0b132b; color:var(--text) }}
+                input[type=number] {{ width:120px }}
+                button {{ cursor:pointer; background: var(--accent); border-color:#2049cc }}
+                button:hover {{ filter:brightness(0.95) }}
+                ul {{ margin:8px 0 0 20px }}
+                code {{ background:#121a36; padding:2px 6px; border-radius:6px }}
+                .muted {{ color:#a4b1d6 }}
+              </style>
+            </head>
+            <body>
+              <header>
+                <div class='brand' style='font-size:22px;font-weight:800;letter-spacing:0.6px'>CS BOT <span style='font-weight:600;color:#b799ff'>made by iris&classical</span></div>
+                <a class='nav' href='/'>Dashboard</a>
+                <a class='nav' href='/keys'>Keys</a>
+                <a class='nav' href='/my'>My Keys</a>
+                <a class='nav' href='/deleted'>Deleted</a>
+                <a class='nav' href='/backup'>Backup</a>
+                <a class='nav' href='/generate-form'>Generate</a>
+              </header>
+              <main>
+                <div class='layout'>
+                  <div class='card'>
+                    <h2>Generate Keys</h2>
+                    <form method='POST' action='/generate'>
+                      <label>Daily</label><input type='number' name='daily' min='0' value='0'/>
+                      <label>Weekly</label><input type='number' name='weekly' min='0' value='0'/>
+                      <label>Monthly</label><input type='number' name='monthly' min='0' value='0'/>
+                      <label>Lifetime</label><input type='number' name='lifetime' min='0' value='0'/>
+                      <label>Custom tier (name / count / days)</label>
+                      <input type='text' name='custom_type' placeholder='e.g. trial'/>
+                      <input type='number' name='custom_count' min='0' value='0'/>
+                      <input type='number' name='custom_days' min='1' value='3'/>
+                      <div style='margin-top:12px'>
+                        <button type='submit'>Generate</button>
+                      </div>
+                    </form>
+                  </div>
+                  <div class='card'>
+                    <div>
+                      <h3 style='display:inline'>Last Generated</h3>
+                      <form method='GET' action='/generate-form' style='display:inline'>
+                        <button class='closebtn' title='Close panel'>&times;</button>
+                      </form>
+                    </div>
+                    {block('Daily', lg.get('daily', []))}
+                    {block('Weekly', lg.get('weekly', []))}
+                    {block('Monthly', lg.get('monthly', []))}
+                    {block('Lifetime', lg.get('lifetime', []))}
+                    {''.join(block(html.escape(t.title()), arr) for t, arr in lg.items() if t not in KEY_TIERS)}
+                    {throughput}
+                  </div>
+                </div>
+              </main>
+            </body></html>
+            """
+            self.wfile.write(form_html.encode())
+            return
+
+        async def get_keys(self):
+            # One page of keys; further pages are fetched lazily from /api/keys/page with the returned cursor
+            parsed = urllib.parse.urlparse(self.path)
+            q = urllib.parse.parse_qs(parsed.query or '')
+            page = self._query_keys(q)
+            filter_status, filter_type = page['status'], page['type']
+
+            sel = {
+                'status_all': 'selected' if filter_status=='all' else '',
+                'status_active': 'selected' if filter_status=='active' else '',
+                'status_unassigned': 'selected' if filter_status=='unassigned' else '',
+                'status_expired': 'selected' if filter_status=='expired' else '',
+                'status_revoked': 'selected' if filter_status=='revoked' else '',
+                'type_all': 'selected' if filter_type=='all' else '',
+                'sort_created': 'selected' if page['sort']=='created' else '',
+                'sort_expires': 'selected' if page['sort']=='expires' else '',
+                'sort_type': 'selected' if page['sort']=='type' else '',
+                'order_desc': 'selected' if page['order']=='desc' else '',
+                'order_asc': 'selected' if page['order']=='asc' else '',
+            }
+            # Built-in tiers plus any custom tier with active keys, same as the dashboard aggregates
+            type_names = list(key_manager.aggregates()['keys_by_type'])
+            if filter_type != 'all' and filter_type not in type_names:
+                type_names.append(filter_type)
+            type_options = ''.join(
+                f"<option {'selected' if filter_type == t else ''} value='{html.escape(t)}'>{html.escape(t.title())}</option>"
+                for t in type_names
+            )
+
+            keys_head = f"""
+            <html><head><title>Keys</title>
+              <style>
+                body{{font-family:Inter,Arial,sans-serif;background:#0b0718;color:#efeaff;margin:0}}
+                header{{background:#120a2a;border-bottom:1px solid #1f1440;padding:16px 24px;display:flex;gap:16px;align-items:center}}
+                a.nav{{color:#b399ff;text-decoration:none;padding:8px 12px;border-radius:8px;background:#1a1240;border:1px solid #1f1440}}
+                a.nav:hover{{background:#1e154d}}
+                main{{padding:24px}}
+                .card{{background:#120a2a;border:1px solid #1f1440;border-radius:12px;padding:20px}}
+                table{{width:100%;border-collapse:collapse;margin-top:12px}}
+                th,td{{border-bottom:1px solid #1f1440;padding:8px 10px;text-align:left}}
+                th{{color:#b399ff}}
+                select,input,button{{padding:8px 10px;border-radius:8px;border:1px solid #2a3866;background:#0b132b;color:#efeaff}}
+                button{{cursor:pointer;background:#6c4af2;border-color:#2049cc}}
+                button:hover{{filter:brightness(0.95)}}
+                code{{background:#121a36;padding:2px 6px;border-radius:6px}}
+                .filters{{display:flex;gap:8px;align-items:center}}
+                .muted{{color:#a4b1d6;font-size:14px;margin-top:12px}}
+              </style>
+            </head>
+            <body>
+              <header>
+                <a class='nav' href='/'>Dashboard</a>
+                <a class='nav' href='/keys'>Keys</a>
+                <a class='nav' href='/my'>My Keys</a>
+                <a class='nav' href='/deleted'>Deleted</a>
+                <a class='nav' href='/backup'>Backup</a>
+                <a class='nav' href='/generate-form'>Generate</a>
+              </header>
+              <main>
+                <div class='card'>
+                  <div class='filters'>
+                    <form method='GET' action='/keys'>
+                      <label>Status</label>
+                      <select name='status'>
+                        <option {sel['status_all']} value='all'>All</option>
+                        <option {sel['status_active']} value='active'>Active</option>
+                        <option {sel['status_unassigned']} value='unassigned'>Unassigned</option>
+                        <option {sel['status_expired']} value='expired'>Expired</option>
+                        <option {sel['status_revoked']} value='revoked'>Revoked</option>
+                      </select>
+                      <label>Type</label>
+                      <select name='type'>
+                        <option {sel['type_all']} value='all'>All</option>
+                        {type_options}
+                      </select>
+                      <label>Sort</label>
+                      <select name='sort'>
+                        <option {sel['sort_created']} value='created'>Created</option>
+                        <option {sel['sort_expires']} value='expires'>Expiry</option>
+                        <option {sel['sort_type']} value='type'>Type</option>
+                      </select>
+                      <select name='order'>
+                        <option {sel['order_desc']} value='desc'>Desc</option>
+                        <option {sel['order_asc']} value='asc'>Asc</option>
+                      </select>
+                      <input name='q' value='{html.escape(page['search'])}' placeholder='Key or user id'/>
+                      <button type='submit'>Apply</button>
+                    </form>
+                  </div>
+                  <div class='muted'>{page['matched']} matching keys</div>
+                  <table>
+                    <thead><tr>
+                      <th>Key</th><th>Type</th><th>Status</th><th>User</th><th>Remaining</th><th>Expires</th><th>Actions</th>
+                    </tr></thead>
+                    <tbody>
+            """
+            more = ''
+            if page['next_cursor']:
+                more = f"<button id='more' data-cursor='{html.escape(page['next_cursor'])}' style='margin-top:12px'>Load more</button>"
+            keys_tail = """
+                    </tbody>
+                  </table>
+                  """ + more + """
+                </div>
+              </main>
+              <script>
+                const more = document.getElementById('more');
+                if (more) more.addEventListener('click', async () => {
+                  const p = new URLSearchParams(location.search);
+                  p.set('cursor', more.dataset.cursor);
+                  p.set('html', '1');
+                  const r = await fetch('/api/keys/page?' + p.toString());
+                  const j = await r.json();
+                  document.querySelector('tbody').insertAdjacentHTML('beforeend', j.html);
+                  if (j.next_cursor) { more.dataset.cursor = j.next_cursor; } else { more.remove(); }
+                });
+              </script>
+            </body></html>
+            """
+            def chunks():
+                yield keys_head
+                yield from (_key_row_html(r) for r in page['rows']) if page['rows'] else ['<tr><td colspan="7">No keys found</td></tr>']
+                yield keys_tail
+            return await self._stream_chunks('text/html', chunks())
+
+        async def get_keys_page(self):
+            # JSON variant of /keys: same filters, sort and cursor; html=1 adds the rendered rows for the page script
+            parsed = urllib.parse.urlparse(self.path)
+            q = urllib.parse.parse_qs(parsed.query or '')
+            page = self._query_keys(q)
+            if page['bad_cursor']:
+                # Stale, edited or made for another sort/order; restarting silently would repeat rows
+                self.send_response(400)
+                self.send_header('Content-Type', 'application/json')
+                self.end_headers()
+                self.wfile.write(b'{"success":false,"error":"invalid cursor for this sort and order"}')
+                return
+            payload = {
+                'rows': page['rows'],
+                'next_cursor': page['next_cursor'],
+                'matched': page['matched'],
+                'sort': page['sort'],
+                'order': page['order'],
+            }
+            if q.get('html', ['0'])[0] in ('1', 'true'):
+                payload['html'] = ''.join(_key_row_html(r) for r in page['rows'])
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.end_headers()
+            self.wfile.write(json.dumps(payload, separators=(',', ':')).encode())
+            return
+
+        @staticmethod
+        def _query_keys(q: dict) -> dict:
+            """Filter, search and keyset-paginate keys: rows sorted by (sort value, key), resuming after the cursor"""
+            filter_status = (q.get('status', ['all'])[0]).lower()
+            filter_type = (q.get('type', ['all'])[0]).lower()
+            sort = (q.get('sort', ['created'])[0]).lower()
+            if sort not in KEY_SORTS:
+                sort = 'created'
+            order = 'asc' if (q.get('order', ['desc'])[0]).lower() == 'asc' else 'desc'
+            search = (q.get('q', [''])[0] or '').strip()
+            needle = search.lower()
+            try:
+                limit = max(1, min(KEYS_PAGE_MAX, int(q.get('limit', [KEYS_PAGE_SIZE])[0])))
+            except Exception:
+                limit = KEYS_PAGE_SIZE
+            token = q.get('cursor', [''])[0]
+            after = _decode_cursor(token, sort, order)
+
+            now_ts = int(time.time())
+            sort_value = KEY_SORTS[sort]
+            # Narrow candidates with the status/type indexes instead of scanning every key
+            candidates = None
+            if filter_status != 'all':
+                candidates = set(key_manager.keys_with_status(filter_status))
+            if filter_type != 'all':
+                by_type = key_manager.keys_with_type(filter_type)
+                candidates = set(by_type) if candidates is None else candidates.intersection(by_type)
+            matched = 0
+            items = []
+            for key in (list(key_manager.keys) if candidates is None else candidates):
+                data = key_manager.keys.get(key)
+                if data is None:
+                    continue
+                if filter_status != 'all' and key_status(data, now_ts) != filter_status:
+                    continue
+                if filter_type != 'all' and data.get('key_type', 'general') != filter_type:
+                    continue
+                if needle and needle not in key.lower() and needle not in str(data.get('user_id', 0) or ''):
+                    continue
+                matched += 1
+                skey = (sort_value(data), key)
+                if after is not None and (skey <= after if order == 'asc' else skey >= after):
+                    continue
+                items.append(skey)
+            pick = (heapq.nsmallest if order == 'asc' else heapq.nlargest)(limit + 1, items)
+            next_cursor = _encode_cursor(sort, order, pick[limit - 1]) if len(pick) > limit else None
+            rows = []
+            for _, key in pick[:limit]:
+                data = key_manager.keys.get(key)
+                exp_ts = int(data.get('expiration_time') or 0)
+                rows.append({
+                    'key': key,
+                    'type': data.get('key_type', 'general'),
+                    'status': key_status(data, now_ts),
+                    'user_id': int(data.get('user_id', 0) or 0),
+                    'created': int(data.get('created_time') or 0),
+                    'expires': exp_ts,
+                    'remaining': max(0, exp_ts - now_ts),
+                    'not_activated': (data.get('activation_time') is None),
+                })
+            return {'rows': rows, 'next_cursor': next_cursor, 'matched': matched, 'status': filter_status,
+                    'type': filter_type, 'sort': sort, 'order': order, 'search': search,
+                    'bad_cursor': bool(token) and after is None}
+
+        async def get_deleted(self):
+            self.send_response(200)
+            self.send_header('Content-type', 'text/html')
+            self.end_headers()
+            table_rows = []
+            for key, data in key_manager.deleted_keys.items():
+                safe_key = html.escape(key)
+                who = data.get('deleted_by', 'admin')
+                when = data.get('deleted_at', data.get('activation_time', 0))
+                table_rows.append(f"""
+                <tr>
+                  <td><code>{safe_key}</code></td>
+                  <td>{html.escape(data.get('key_type',''))}</td>
+                  <td>{html.escape(str(who))}</td>
+                  <td><t:{when}:R></td>
+                </tr>
+                """)
+            html_doc = f"""
+            <html><head><title>Deleted Keys</title>
+              <style>
+                body{{font-family:Inter,Arial,sans-serif;background:#0b0718;color:#efeaff;margin:0}}
+                header{{background:#120a2a;border-bottom:1px solid #1f1440;padding:16px 24px;display:flex;gap:16px;align-items:center}}
+                a.nav{{color:#b399ff;text-decoration:none;padding:8px 12px;border-radius:8px;background:#1a1240;border:1px solid #1f1440}}
+                a.nav:hover{{background:#1e154d}}
+                main{{padding:24px}}
+                .card{{background:#0e1630;border:1px solid #1f2a4a;border-radius:12px;padding:20px}}
+                table{{width:100%;border-collapse:collapse;margin-top:12px}}
+                th,td{{border-bottom:1px solid #1f2a4a;padding:8px 10px;text-align:left}}
+                th{{color:#9ab0ff}}
+                code{{background:#121a36;padding:2px 6px;border-radius:6px}}
+              </style>
+            </head>
+            <body>
+              <header>
+                <a class='nav' href='/'>Dashboard</a>
+                <a class='nav' href='/keys'>Keys</a>
+                <a class='nav' href='/deleted'>Deleted</a>
+                <a class='nav' href='/generate-form'>Generate</a>
+              </header>
+              <main>
+                <div class='card'>
+                  <h2>Deleted Keys</h2>
+                  <table>
+                    <thead><tr>
+                      <th>Key</th><th>Type</th><th>Deleted By</th><th>When</th>
+                    </tr></thead>
+                    <tbody>
+                      {''.join(table_rows) if table_rows else '<tr><td colspan="4">No deleted keys</td></tr>'}
+                    </tbody>
+                  </table>
+                </div>
+              </main>
+            </body></html>
+            """
+            self.wfile.write(html_doc.encode())
+            return
+
+        async def get_my(self):
+            # My Keys page: enter Discord user ID to view assigned keys
+            parsed = urllib.parse.urlparse(self.path)
+            q = urllib.parse.parse_qs(parsed.query or '')
+            user_q = q.get('user_id', [""])[0]
+            try:
+                target_uid = int(user_q) if user_q else None
+            except Exception:
+                target_uid = None
+
+            now_ts = int(time.time())
+            rows = []
+            if target_uid is not None:
+                for key in key_manager.keys_for_user(target_uid):
+                    data = key_manager.keys.get(key)
+                    if data is not None:
+                        expires = data.get('expiration_time')
                         exp_ts = int(expires or 0)
                         remaining = max(0, exp_ts - now_ts)
                         is_active = data.get('is_active', False)
-                        user_id = data.get('user_id', 0)
-                        if not is_active:
-                            status = 'revoked'
-                        elif exp_ts <= now_ts:
-                            status = 'expired'
-                        elif user_id == 0:
-                            status = 'unassigned'
-                        else:
-                            status = 'active'
-                        # Apply filters
-                        if filter_status != 'all' and status != filter_status:
-                            continue
-                        if filter_type != 'all' and key_type != filter_type:
-                            continue
+                        status = 'revoked' if not is_active else ('expired' if exp_ts <= now_ts and exp_ts > 0 else 'active')
                         rows.append({
                             'key': key,
-                            'type': key_type,
                             'status': status,
-                            'user': (f"<@{user_id}>" if user_id else 'Unassigned'),
                             'expires': exp_ts,
                             'remaining': remaining,
-                            'not_activated': (data.get('activation_time') is None)
+                            'type': data.get('key_type','')
                         })
+            def fmt_rem(sec:int, not_activated: bool) -> str:
+                if not_activated:
+                    return 'Not activated yet'
+                d=sec//86400; h=(sec%86400)//3600; m=(sec%3600)//60
+                return f"{d}d {h}h {m}m" if sec>0 else '—'
+            table_rows = []
+            for r in rows:
+                safe_key = html.escape(r['key'])
+                table_rows.append(f"""
+                <tr>
+                  <td><code>{safe_key}</code></td>
+                  <td>{html.escape(r['type'])}</td>
+                  <td>{html.escape(r['status'].capitalize())}</td>
+                  <td>{fmt_rem(r['remaining'], False)}</td>
+                  <td>{('<t:'+str(r['expires'])+':R>') if r['expires'] else '—'}</td>
+                </tr>
+                """)
+            page = f"""
+            <html><head><title>My Keys</title>
+              <style>
+                body{{font-family:Inter,Arial,sans-serif;background:#0b0718;color:#efeaff;margin:0}}
+                header{{background:#120a2a;border-bottom:1px solid #1f1440;padding:16px 24px;display:flex;gap:16px;align-items:center}}
+                a.nav{{color:#b399ff;text-decoration:none;padding:8px 12px;border-radius:8px;background:#1a1240;border:1px solid #1f1440}}
+                a.nav:hover{{background:#1e154d}}
+                main{{padding:24px}}
+                .card{{background:#120a2a;border:1px solid #1f1440;border-radius:12px;padding:20px}}
+                table{{width:100%;border-collapse:collapse;margin-top:12px}}
+                th,td{{border-bottom:1px solid #1f1440;padding:8px 10px;text-align:left}}
+                th{{color:#b399ff}}
+                input,button{{padding:8px 10px;border-radius:8px;border:1px solid #2a3866;background:#0b132b;color:#efeaff}}
+                button{{cursor:pointer;background:#6c4af2;border-color:#2049cc}}
+                button:hover{{filter:brightness(0.95)}}
+                code{{background:#121a36;padding:2px 6px;border-radius:6px}}
+              </style>
+            </head>
+            <body>
+              <header>
+                <a class='nav' href='/'>Dashboard</a>
+                <a class='nav' href='/keys'>Keys</a>
+                <a class='nav' href='/my'>My Keys</a>
+                <a class='nav' href='/deleted'>Deleted</a>
+                <a class='nav' href='/generate-form'>Generate</a>
+                <a class='nav' href='/backup'>Backup</a>
+              </header>
+              <main>
+                <div class='card'>
+                  <h2>My Keys</h2>
+                  <form method='GET' action='/my'>
+                    <label>Discord User ID</label>
+                    <input type='text' name='user_id' value='{html.escape(user_q)}' placeholder='Enter your Discord user ID'/>
+                    <button type='submit'>View</button>
+                  </form>
+                  <table>
+                    <thead><tr><th>Key</th><th>Type</th><th>Status</th><th>Remaining</th><th>Expires</th></tr></thead>
+                    <tbody>
+                      {''.join(table_rows) if table_rows else ('<tr><td colspan="5">Enter your Discord user ID above to view assigned keys</td></tr>' if not user_q else '<tr><td colspan="5">No keys found for this user</td></tr>')}
+                    </tbody>
+                  </table>
+                  { (f"<p style='margin-top:12px'><a class='nav' href='/backup?user_id={html.escape(user_q)}'>Download backup for this user</a></p>" if user_q else '') }
+                </div>
+              </main>
+            </body></html>
+            """
+            self.send_response(200)
+            self.send_header('Content-type', 'text/html')
+            self.end_headers()
+            self.wfile.write(page.encode())
+            return
 
-                    # Build HTML
-                    self.send_response(200)
-                    self.send_header('Content-type', 'text/html')
-                    self.end_headers()
-                    def fmt_rem(sec:int, not_activated: bool, key_type: str) -> str:
-                        if key_type == 'lifetime':
-                            return '∞'
-                        if not_activated:
-                            return 'Not activated yet'
-                        d=sec//86400; h=(sec%86400)//3600; m=(sec%3600)//60
-                        return f"{d}d {h}h {m}m" if sec>0 else '—'
-                    table_rows = []
-                    for r in rows:
-                        safe_key = html.escape(r['key'])
-                        exp_cell = ('<t:'+str(r['expires'])+':R>') if r['expires'] else ('∞' if r['type']=='lifetime' else '—')
-                        table_rows.append(f"""
-                        <tr>
-                          <td><code>{safe_key}</code></td>
-                          <td>{html.escape(r['type'])}</td>
-                          <td>{html.escape(r['status'].capitalize())}</td>
-                          <td>{r['user']}</td>
-                          <td>{fmt_rem(r['remaining'], r['not_activated'], r['type'])}</td>
-                          <td>{exp_cell}</td>
-                          <td style='display:flex;gap:6px'>
-                            <form method='POST' action='/revoke' onsubmit="return confirm('Revoke this key?')">
-                              <input type='hidden' name='key' value='{safe_key}'/>
-                              <button type='submit'>Revoke</button>
-                            </form>
-                            <form method='POST' action='/delete' onsubmit="return confirm('Delete this key?')">
-                              <input type='hidden' name='key' value='{safe_key}'/>
-                              <button type='submit'>Delete</button>
-                            </form>
-                          </td>
-                        </tr>
-                        """)
-                    keys_html = f"""
-                    <html><head><title>Keys</title>
-                      <style>
-                        body{{font-family:Inter,Arial,sans-serif;background:#0b0718;color:#efeaff;margin:0}}
-                        header{{background:#120a2a;border-bottom:1px solid #1f1440;padding:16px 24px;display:flex;gap:16px;align-items:center}}
-                        a.nav{{color:#b399ff;text-decoration:none;padding:8px 12px;border-radius:8px;background:#1a1240;border:1px solid #1f1440}}
-                        a.nav:hover{{background:#1e154d}}
-                        main{{padding:24px}}
-                        .card{{background:#120a2a;border:1px solid #1f1440;border-radius:12px;padding:20px}}
-                        table{{width:100%;border-collapse:collapse;margin-top:12px}}
-                        th,td{{border-bottom:1px solid #1f1440;padding:8px 10px;text-align:left}}
-                        th{{color:#b399ff}}
-                        select,input,button{{padding:8px 10px;border-radius:8px;border:1px solid #2a3866;background:#0b132b;color:#efeaff}}
-                        button{{cursor:pointer;background:#6c4af2;border-color:#2049cc}}
-                        button:hover{{filter:brightness(0.95)}}
-                        code{{background:#121a36;padding:2px 6px;border-radius:6px}}
-                        .filters{{display:flex;gap:8px;align-items:center}}
-                      </style>
-                    </head>
-                    <body>
-                      <header>
-                        <a class='nav' href='/'>Dashboard</a>
-                        <a class='nav' href='/keys'>Keys</a>
-                        <a class='nav' href='/my'>My Keys</a>
-                        <a class='nav' href='/deleted'>Deleted</a>
-                        <a class='nav' href='/backup'>Backup</a>
-                        <a class='nav' href='/generate-form'>Generate</a>
-                      </header>
-                      <main>
-                        <div class='card'>
-                          <div class='filters'>
-                            <form method='GET' action='/keys'>
-                              <label>Status</label>
-                              <select name='status'>
-                                <option {sel['status_all']} value='all'>All</option>
-                                <option {sel['status_active']} value='active'>Active</option>
-                                <option {sel['status_unassigned']} value='unassigned'>Unassigned</option>
-                                <option {sel['status_expired']} value='expired'>Expired</option>
-                                <option {sel['status_revoked']} value='revoked'>Revoked</option>
-                              </select>
-                              <label>Type</label>
-                              <select name='type'>
-                                <option {sel['type_all']} value='all'>All</option>
-                                <option {sel['type_daily']} value='daily'>Daily</option>
-                                <option {sel['type_weekly']} value='weekly'>Weekly</option>
-                                <option {sel['type_monthly']} value='monthly'>Monthly</option>
-                                <option {sel['type_lifetime']} value='lifetime'>Lifetime</option>
-                                <option {sel['type_general']} value='general'>General</option>
-                              </select>
-                              <button type='submit'>Apply</button>
-                            </form>
-                          </div>
-                          <table>
-                            <thead><tr>
-                              <th>Key</th><th>Type</th><th>Status</th><th>User</th><th>Remaining</th><th>Expires</th><th>Actions</th>
-                            </tr></thead>
-                            <tbody>
-                              {''.join(table_rows) if table_rows else '<tr><td colspan="7">No keys found</td></tr>'}
-                            </tbody>
-                          </table>
-                        </div>
-                      </main>
-                    </body></html>
-                    """
-                    self.wfile.write(keys_html.encode())
-                    return
+        async def get_backup(self):
+            # JSON backup; optional user_id filter, snapshot listing or point-in-time snapshot
+            parsed = urllib.parse.urlparse(self.path)
+            q = urllib.parse.parse_qs(parsed.query or '')
+            user_q = q.get('user_id', [None])[0]
+            snap_q = q.get('ts', [None])[0]
+            payload = {}
+            if parsed.path.rstrip('/') == '/backup/list':
+                payload = {'snapshots': key_manager.snapshots.list()}
+            elif snap_q:
+                try:
+                    payload = key_manager.snapshots.load(int(snap_q)) or {'error': 'snapshot not found'}
+                except Exception:
+                    payload = {'error': 'invalid ts'}
+            elif user_q:
+                try:
+                    uid = int(user_q)
+                except Exception:
+                    uid = None
+                if uid is not None:
+                    subset = {}
+                    subset_usage = {}
+                    for k in key_manager.keys_for_user(uid):
+                        rec = key_manager.keys.get(k)
+                        if rec is not None:
+                            subset[k] = rec.to_dict()
+                            if rec.has_usage:
+                                subset_usage[k] = rec.usage_dict()
+                    payload = {
+                        'keys': subset,
+                        'usage': subset_usage
+                    }
+                else:
+                    payload = {'error': 'invalid user_id'}
+            else:
+                # Full dump: stream it record by record instead of serializing the whole database at once
+                return await self._stream_chunks('application/json', _backup_chunks(),
+                                                 {'Content-Disposition': 'attachment; filename="backup.json"'})
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Disposition', 'attachment; filename="backup.json"')
+            self.end_headers()
+            try:
+                self.wfile.write(json.dumps(payload, separators=(',', ':')).encode())
+            except Exception:
+                import json as _json
+                self.wfile.write(_json.dumps(payload, separators=(',', ':')).encode())
+            return
 
-                if self.path == '/deleted':
-                    self.send_response(200)
-                    self.send_header('Content-type', 'text/html')
-                    self.end_headers()
-                    table_rows = []
-                    for key, data in key_manager.deleted_keys.items():
-                        safe_key = html.escape(key)
-                        who = data.get('deleted_by', 'admin')
-                        when = data.get('deleted_at', data.get('activation_time', 0))
-                        table_rows.append(f"""
-                        <tr>
-                          <td><code>{safe_key}</code></td>
-                          <td>{html.escape(data.get('key_type',''))}</td>
-                          <td>{html.escape(str(who))}</td>
-                          <td><t:{when}:R></td>
-                        </tr>
-                        """)
-                    html_doc = f"""
-                    <html><head><title>Deleted Keys</title>
-                      <style>
-                        body{{font-family:Inter,Arial,sans-serif;background:#0b0718;color:#efeaff;margin:0}}
-                        header{{background:#120a2a;border-bottom:1px solid #1f1440;padding:16px 24px;display:flex;gap:16px;align-items:center}}
-                        a.nav{{color:#b399ff;text-decoration:none;padding:8px 12px;border-radius:8px;background:#1a1240;border:1px solid #1f1440}}
-                        a.nav:hover{{background:#1e154d}}
-                        main{{padding:24px}}
-                        .card{{background:#0e1630;border:1px solid #1f2a4a;border-radius:12px;padding:20px}}
-                        table{{width:100%;border-collapse:collapse;margin-top:12px}}
-                        th,td{{border-bottom:1px solid #1f2a4a;padding:8px 10px;text-align:left}}
-                        th{{color:#9ab0ff}}
-                        code{{background:#121a36;padding:2px 6px;border-radius:6px}}
-                      </style>
-                    </head>
-                    <body>
-                      <header>
-                        <a class='nav' href='/'>Dashboard</a>
-                        <a class='nav' href='/keys'>Keys</a>
-                        <a class='nav' href='/deleted'>Deleted</a>
-                        <a class='nav' href='/generate-form'>Generate</a>
-                      </header>
-                      <main>
-                        <div class='card'>
-                          <h2>Deleted Keys</h2>
-                          <table>
-                            <thead><tr>
-                              <th>Key</th><th>Type</th><th>Deleted By</th><th>When</th>
-                            </tr></thead>
-                            <tbody>
-                              {''.join(table_rows) if table_rows else '<tr><td colspan="4">No deleted keys</td></tr>'}
-                            </tbody>
-                          </table>
-                        </div>
-                      </main>
-                    </body></html>
-                    """
-                    self.wfile.write(html_doc.encode())
-                    return
+        async def get_member_status(self):
+            # Return whether a user should have access based on active keys and optional machine binding
+            parsed = urllib.parse.urlparse(self.path)
+            q = urllib.parse.parse_qs(parsed.query or '')
+            user_q = q.get('user_id', [None])[0]
+            machine_q = q.get('machine_id', [None])[0]
+            try:
+                uid = int(user_q) if user_q is not None else None
+            except Exception:
+                uid = None
+
+            now_ts = int(time.time())
+            entry = member_status_cache.get(uid, machine_q)
+            cache_control = f"private, max-age={member_status_cache.max_age(entry, now_ts)}"
+            # Clients revalidate with the ETag and count down locally from expires_at
+            if entry['etag'] in (self.headers.get('If-None-Match') or ''):
+                member_status_cache.not_modified += 1
+                self.send_response(304)
+                self.send_header('ETag', entry['etag'])
+                self.send_header('Cache-Control', cache_control)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('ETag', entry['etag'])
+            self.send_header('Cache-Control', cache_control)
+            self.end_headers()
+            self.wfile.write(member_status_cache.render(entry, now_ts))
+            return
 
-                if self.path.startswith('/my'):
-                    # My Keys page: enter Discord user ID to view assigned keys
-                    parsed = urllib.parse.urlparse(self.path)
-                    q = urllib.parse.parse_qs(parsed.query or '')
-                    user_q = q.get('user_id', [""])[0]
-                    try:
-                        target_uid = int(user_q) if user_q else None
-                    except Exception:
-                        target_uid = None
-
-                    now_ts = int(time.time())
-                    rows = []
-                    if target_uid is not None:
-                        for key, data in key_manager.keys.items():
-                            if data.get('user_id', 0) == target_uid:
-                                expires = data.get('expiration_time')
-                                exp_ts = int(expires or 0)
-                                remaining = max(0, exp_ts - now_ts)
-                                is_active = data.get('is_active', False)
-                                status = 'revoked' if not is_active else ('expired' if exp_ts <= now_ts and exp_ts > 0 else 'active')
-                                rows.append({
-                                    'key': key,
-                                    'status': status,
-                                    'expires': exp_ts,
-                                    'remaining': remaining,
-                                    'type': data.get('key_type','')
-                                })
-                    def fmt_rem(sec:int, not_activated: bool) -> str:
-                        if not_activated:
-                            return 'Not activated yet'
-                        d=sec//86400; h=(sec%86400)//3600; m=(sec%3600)//60
-                        return f"{d}d {h}h {m}m" if sec>0 else '—'
-                    table_rows = []
-                    for r in rows:
-                        safe_key = html.escape(r['key'])
-                        table_rows.append(f"""
-                        <tr>
-                          <td><code>{safe_key}</code></td>
-                          <td>{html.escape(r['type'])}</td>
-                          <td>{html.escape(r['status'].capitalize())}</td>
-                          <td>{fmt_rem(r['remaining'], False)}</td>
-                          <td>{('<t:'+str(r['expires'])+':R>') if r['expires'] else '—'}</td>
-                        </tr>
-                        """)
-                    page = f"""
-                    <html><head><title>My Keys</title>
-                      <style>
-                        body{{font-family:Inter,Arial,sans-serif;background:#0b0718;color:#efeaff;margin:0}}
-                        header{{background:#120a2a;border-bottom:1px solid #1f1440;padding:16px 24px;display:flex;gap:16px;align-items:center}}
-                        a.nav{{color:#b399ff;text-decoration:none;padding:8px 12px;border-radius:8px;background:#1a1240;border:1px solid #1f1440}}
-                        a.nav:hover{{background:#1e154d}}
-                        main{{padding:24px}}
-                        .card{{background:#120a2a;border:1px solid #1f1440;border-radius:12px;padding:20px}}
-                        table{{width:100%;border-collapse:collapse;margin-top:12px}}
-                        th,td{{border-bottom:1px solid #1f1440;padding:8px 10px;text-align:left}}
-                        th{{color:#b399ff}}
-                        input,button{{padding:8px 10px;border-radius:8px;border:1px solid #2a3866;background:#0b132b;color:#efeaff}}
-                        button{{cursor:pointer;background:#6c4af2;border-color:#2049cc}}
-                        button:hover{{filter:brightness(0.95)}}
-                        code{{background:#121a36;padding:2px 6px;border-radius:6px}}
-                      </style>
-                    </head>
-                    <body>
-                      <header>
-                        <a class='nav' href='/'>Dashboard</a>
-                        <a class='nav' href='/keys'>Keys</a>
-                        <a class='nav' href='/my'>My Keys</a>
-                        <a class='nav' href='/deleted'>Deleted</a>
-                        <a class='nav' href='/generate-form'>Generate</a>
-                        <a class='nav' href='/backup'>Backup</a>
-                      </header>
-                      <main>
-                        <div class='card'>
-                          <h2>My Keys</h2>
-                          <form method='GET' action='/my'>
-                            <label>Discord User ID</label>
-                            <input type='text' name='user_id' value='{html.escape(user_q)}' placeholder='Enter your Discord user ID'/>
-                            <button type='submit'>View</button>
-                          </form>
-                          <table>
-                            <thead><tr><th>Key</th><th>Type</th><th>Status</th><th>Remaining</th><th>Expires</th></tr></thead>
-                            <tbody>
-                              {''.join(table_rows) if table_rows else ('<tr><td colspan="5">Enter your Discord user ID above to view assigned keys</td></tr>' if not user_q else '<tr><td colspan="5">No keys found for this user</td></tr>')}
-                            </tbody>
-                          </table>
-                          { (f"<p style='margin-top:12px'><a class='nav' href='/backup?user_id={html.escape(user_q)}'>Download backup for this user</a></p>" if user_q else '') }
+        async def get_ann_poll(self):
+            # Owner-only announcements feed
+            parsed = urllib.parse.urlparse(self.path)
+            q = urllib.parse.parse_qs(parsed.query or '')
+            since_ts, after_seq, wait = self._feed_cursor(q, ann_feed)
+            if after_seq is not None and wait > 0:
+                await ann_feed.wait(after_seq, wait)
+            new_msgs = ann_feed.since(after_seq, since_ts)
+            payload = { 'messages': new_msgs, 'server_time': int(time.time()), 'seq': ann_feed.seq }
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.end_headers()
+            try:
+                self.wfile.write(json.dumps(payload, separators=(',', ':')).encode())
+            except Exception:
+                import json as _json
+                self.wfile.write(_json.dumps(payload, separators=(',', ':')).encode())
+            return
+
+        async def get_chat_poll(self):
+            # Long-poll: with after=<seq>&wait=<sec> the request is held until a newer message arrives
+            parsed = urllib.parse.urlparse(self.path)
+            q = urllib.parse.parse_qs(parsed.query or '')
+            user_q = q.get('user_id', ['0'])[0]
+            try:
+                uid = int(user_q)
+            except Exception:
+                uid = 0
+            if not uid:
+                self.send_response(400)
+                self.send_header('Content-Type', 'application/json')
+                self.end_headers()
+                self.wfile.write(b'{"success":false,"error":"missing user_id"}')
+                return
+            since_ts, after_seq, wait = self._feed_cursor(q, chat_feed)
+            if after_seq is not None and wait > 0:
+                await chat_feed.wait(after_seq, wait)
+            new_msgs = chat_feed.since(after_seq, since_ts)
+            # Determine if user can send: has role or reached threshold
+            can_send = message_stats.get(uid) >= MESSAGES_THRESHOLD or member_cache.can_send_chat(uid)
+            payload = {
+                'messages': new_msgs,
+                'server_time': int(time.time()),
+                'seq': chat_feed.seq,
+                'can_send': can_send
+            }
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.end_headers()
+            self.wfile.write(json.dumps(payload, separators=(',', ':')).encode())
+            return
+
+        async def get_key_info(self):
+            parsed = urllib.parse.urlparse(self.path)
+            q = urllib.parse.parse_qs(parsed.query or '')
+            key = (q.get('key', [None])[0])
+            if not key:
+                self.send_response(400)
+                self.send_header('Content-Type', 'application/json')
+                self.end_headers()
+                try:
+                    self.wfile.write(json.dumps({'error':'missing key'}).encode())
+                except Exception:
+                    import json as _json
+                    self.wfile.write(_json.dumps({'error':'missing key'}).encode())
+                return
+            info = None
+            if key in key_manager.keys:
+                d = key_manager.keys[key]
+                info = {
+                    'exists': True,
+                    'is_active': d.get('is_active', False),
+                    'user_id': d.get('user_id', 0),
+                    'machine_id': d.get('machine_id'),
+                    'duration_days': d.get('duration_days'),
+                    'created_time': d.get('created_time'),
+                    'activation_time': d.get('activation_time'),
+                    'expiration_time': d.get('expiration_time'),
+                    'key_type': d.get('key_type','general')
+                }
+            else:
+                info = {'exists': False}
+            self.send_response(200)
+            self.send_header('Content-Type','application/json')
+            self.end_headers()
+            self.wfile.write(json.dumps(info, separators=(',', ':')).encode())
+            return
+
+        async def get_dashboard(self):
+            self.send_response(200)
+            self.send_header('Content-type', 'text/html')
+            self.end_headers()
+
+            # Get comprehensive key statistics for HTML dashboard (live counters, no key scan)
+            agg = key_manager.aggregates()
+            total_keys = agg["total_keys"]
+            active_keys = agg["active_keys"]
+            revoked_keys = agg["revoked_keys"]
+            deleted_keys = agg["deleted_keys"]
+
+            by_type = agg["keys_by_type"]
+            daily_keys, weekly_keys, monthly_keys = by_type["daily"], by_type["weekly"], by_type["monthly"]
+            lifetime_keys, general_keys = by_type["lifetime"], by_type["general"]
+
+            available = agg["available_keys"]
+            available_daily, available_weekly, available_monthly = available["daily"], available["weekly"], available["monthly"]
+            available_lifetime, available_general = available["lifetime"], available["general"]
+            # Custom tiers (from the generate form) get a box each after the built-in ones
+            custom_boxes = ''.join(f"""
+                      <div class='kbox'>
+                        <div class='ttl'>{html.escape(t)} Keys</div>
+                        <div class='num'>{n}</div>
+                        <div class='sub'>Available: {available.get(t, 0)}</div>
+                      </div>""" for t, n in by_type.items() if t not in BUILTIN_KEY_TYPES)
+
+            response = f"""
+            <html>
+              <head>
+                <title>Discord Key Bot</title>
+                <meta name='viewport' content='width=device-width, initial-scale=1'/>
+                <style>
+                  :root {{ --bg:#0b0718; --panel:#120a2a; --muted:#b399ff; --border:#1f1440; --text:#efeaff; --accent:#6c4af2; }}
+                  * {{ box-sizing: border-box; }}
+                  body {{ margin:0; font-family: Inter, system-ui, -apple-system, Segoe UI, Roboto, Arial, sans-serif; background: var(--bg); color: var(--text); }}
+                  header {{ background: var(--panel); border-bottom:1px solid var(--border); padding: 16px 24px; display:flex; align-items:center; gap:12px; flex-wrap: wrap; }}
+                  .brand {{ font-weight:700; letter-spacing:0.3px; margin-right:8px; }}
+                  a.nav {{ color: var(--muted); text-decoration:none; padding:8px 12px; border-radius:10px; background:#121a36; border:1px solid #1a2650; }}
+                  a.nav:hover {{ background:#19214a; }}
+                  main {{ padding: 24px; max-width: 1100px; margin: 0 auto; }}
+                  .grid {{ display:grid; grid-template-columns: repeat(auto-fit, minmax(220px, 1fr)); gap:16px; }}
+                  .card {{ background: var(--panel); border:1px solid var(--border); border-radius:14px; padding:18px; }}
+                  .stat {{ display:flex; flex-direction:column; gap:4px; }}
+                  .stat .label {{ color:#b9c7ff; font-size:12px; text-transform:uppercase; letter-spacing:0.4px; }}
+                  .stat .value {{ font-size:28px; font-weight:700; color:#dfe6ff; }}
+                  .muted {{ color:#a4b1d6; font-size:14px; }}
+                  .row {{ display:flex; gap:16px; align-items:stretch; flex-wrap:wrap; }}
+                  .actions a {{ display:inline-block; margin-right:8px; margin-top:8px; color:white; background: var(--accent); padding:10px 12px; border-radius:10px; text-decoration:none; border:1px solid #2049cc; }}
+                  .actions a:hover {{ filter: brightness(0.95); }}
+                  .kgrid {{ display:grid; grid-template-columns: repeat(auto-fit, minmax(200px, 1fr)); gap:12px; }}
+                  .kbox {{ background:#0b132b; border:1px solid #1c2b5b; padding:14px; border-radius:12px; }}
+                  .kbox .ttl {{ color:#b9c7ff; font-size:12px; letter-spacing:0.3px; text-transform:uppercase; }}
+                  .kbox .num {{ font-size:22px; font-weight:700; color:#e6edff; }}
+                  .kbox .sub {{ font-size:12px; color:#9ab0ff; margin-top:4px; }}
+                </style>
+              </head>
+              <body>
+                <header>
+                  <div class='brand' style='font-size:28px;font-weight:800;letter-spacing:0.6px'>CS BOT <span style='font-weight:600;color:#b799ff'>made by iris&classical</span></div>
+                  <a class='nav' href='/'>Dashboard</a>
+                  <a class='nav' href='/keys'>Keys</a>
+                  <a class='nav' href='/my'>My Keys</a>
+                  <a class='nav' href='/deleted'>Deleted</a>
+                  <a class='nav' href='/generate-form'>Generate</a>
+                  <a class='nav' href='/backup'>Backup</a>
+                </header>
+                <main>
+                  <div class='row'>
+                    <div class='card' style='flex:2'>
+                      <div class='grid'>
+                        <div class='stat card'>
+                          <div class='label'>Total Keys</div>
+                          <div class='value'>{total_keys}</div>
+                          <div class='muted'>All keys in database</div>
                         </div>
-                      </main>
-                    </body></html>
-                    """
-                    self.send_response(200)
-                    self.send_header('Content-type', 'text/html')
-                    self.end_headers()
-                    self.wfile.write(page.encode())
-                    return
+                        <div class='stat card'>
+                          <div class='label'>Active</div>
+                          <div class='value'>{active_keys}</div>
+                          <div class='muted'>Currently valid</div>
+                        </div>
+                        <div class='stat card'>
+                          <div class='label'>Revoked</div>
+                          <div class='value'>{revoked_keys}</div>
+                          <div class='muted'>Access removed</div>
+                        </div>
+                        <div class='stat card'>
+                          <div class='label'>Deleted</div>
+                          <div class='value'>{deleted_keys}</div>
+                          <div class='muted'>Moved to recycle</div>
+                        </div>
+                      </div>
+                      <div class='actions'>
+                        <a href='/keys'>Manage Keys</a>
+                        <a href='/generate-form'>Generate Keys</a>
+                        <a href='/my'>My Keys</a>
+                        <a href='/backup'>Backup</a>
+                      </div>
+                    </div>
+                  </div>
+                  <div style='height:16px'></div>
+                  <div class='card'>
+                    <div class='kgrid'>
+                      <div class='kbox'>
+                        <div class='ttl'>Daily Keys</div>
+                        <div class='num'>{daily_keys}</div>
+                        <div class='sub'>Available: {available_daily}</div>
+                      </div>
+                      <div class='kbox'>
+                        <div class='ttl'>Weekly Keys</div>
+                        <div class='num'>{weekly_keys}</div>
+                        <div class='sub'>Available: {available_weekly}</div>
+                      </div>
+                      <div class='kbox'>
+                        <div class='ttl'>Monthly Keys</div>
+                        <div class='num'>{monthly_keys}</div>
+                        <div class='sub'>Available: {available_monthly}</div>
+                      </div>
+                      <div class='kbox'>
+                        <div class='ttl'>Lifetime Keys</div>
+                        <div class='num'>{lifetime_keys}</div>
+                        <div class='sub'>Available: {available_lifetime}</div>
+                      </div>
+                      <div class='kbox'>
+                        <div class='ttl'>General Keys</div>
+                        <div class='num'>{general_keys}</div>
+                        <div class='sub'>Available: {available_general}</div>
+                      </div>{custom_boxes}
+                    </div>
+                    <div class='muted' style='margin-top:10px'>
+                      Status: Online • {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')} • Bot: {bot.user.name if bot.user else 'Starting...'}
+                    </div>
+                  </div>
+                </main>
+              </body>
+            </html>
+            """
+            self.wfile.write(response.encode())
+            return
 
-                if self.path.startswith('/backup'):
-                    # JSON backup; optional user_id filter
-                    parsed = urllib.parse.urlparse(self.path)
-                    q = urllib.parse.parse_qs(parsed.query or '')
-                    user_q = q.get('user_id', [None])[0]
-                    payload = {}
-                    if user_q:
-                        try:
-                            uid = int(user_q)
-                        except Exception:
-                            uid = None
-                        if uid is not None:
-                            subset = {}
-                            subset_usage = {}
-                            for k, data in key_manager.keys.items():
-                                if data.get('user_id', 0) == uid:
-                                    subset[k] = data
-                                    if k in key_manager.key_usage:
-                                        subset_usage[k] = key_manager.key_usage[k]
-                            payload = {
-                                'keys': subset,
-                                'usage': subset_usage
-                            }
-                        else:
-                            payload = {'error': 'invalid user_id'}
-                    else:
-                        payload = {
-                            'keys': key_manager.keys,
-                            'usage': key_manager.key_usage,
-                            'deleted_keys': key_manager.deleted_keys
-                        }
-                    self.send_response(200)
-                    self.send_header('Content-Type', 'application/json')
-                    self.send_header('Content-Disposition', 'attachment; filename="backup.json"')
-                    self.end_headers()
-                    try:
-                        self.wfile.write(json.dumps(payload, indent=2).encode())
-                    except Exception:
-                        import json as _json
-                        self.wfile.write(_json.dumps(payload, indent=2).encode())
-                    return
+        async def get_api_keys(self):
+            self.send_response(200)
+            self.send_header('Content-type', 'application/json')
+            self.end_headers()
 
-                if self.path.startswith('/api/member-status'):
-                    # Return whether a user should have access based on active keys and optional machine binding
-                    parsed = urllib.parse.urlparse(self.path)
-                    q = urllib.parse.parse_qs(parsed.query or '')
-                    user_q = q.get('user_id', [None])[0]
-                    machine_q = q.get('machine_id', [None])[0]
-                    try:
-                        uid = int(user_q) if user_q is not None else None
-                    except Exception:
-                        uid = None
-
-                    now_ts = int(time.time())
-                    active_items = []
-                    expired_count = 0
-                    bound_match = False
-                    if uid is not None:
-                        for key, data in key_manager.keys.items():
-                            if data.get('user_id', 0) != uid:
-                                continue
-                            expires = data.get('expiration_time', 0) or 0
-                            if data.get('is_active', False) and (expires == 0 or expires > now_ts):
-                                item = {
-                                    'key': key,
-                                    'expires_at': expires,
-                                    'time_remaining': (expires - now_ts) if expires else 0,
-                                    'type': data.get('key_type', 'general'),
-                                    'machine_id': data.get('machine_id')
-                                }
-                                active_items.append(item)
-                                if machine_q:
-                                    mid = str(data.get('machine_id') or '')
-                                    # Accept exact machine binding OR legacy slash-activation binding (machine_id == user_id)
-                                    if (mid and str(machine_q) == mid) or (mid and str(uid) == mid):
-                                        bound_match = True
-                            else:
-                                if expires and expires <= now_ts:
-                                    expired_count += 1
-
-                    has_active_key = len(active_items) > 0
-                    # Role-based access: check if user currently has the Discord role
-                    has_role = False
-                    try:
-                        guild = bot.get_guild(GUILD_ID)
-                        if guild and uid:
-                            member = guild.get_member(uid)
-                            if member is None:
-                                # Fallback to fetching the member if not in cache
-                                async def _fetch_member():
-                                    try:
-                                        return await guild.fetch_member(uid)
-                                    except Exception:
-                                        return None
-                                fut = asyncio.run_coroutine_threadsafe(_fetch_member(), bot.loop)
-                                try:
-                                    member = fut.result(timeout=5)
-                                except Exception:
-                                    member = None
-                            if member:
-                                has_role = any((r.id == ROLE_ID) or (r.name.lower() == ROLE_NAME.lower()) for r in member.roles)
-                    except Exception:
-                        has_role = False
-                    # Access should depend on active key (and optional machine binding)
-                    should_have_access = has_active_key and (bound_match or not machine_q)
-                    resp = {
-                        'user_id': uid,
-                        'role_id': ROLE_ID,
-                        'guild_id': GUILD_ID,
-                        'has_active_key': has_active_key,
-                        'has_role': has_role,
-                        'should_have_access': should_have_access,
-                        'bound_match': bound_match,
-                        'active_keys': active_items,
-                        'expired_keys_count': expired_count,
-                        'last_updated': now_ts
-                    }
-                    self.send_response(200)
-                    self.send_header('Content-Type', 'application/json')
-                    self.end_headers()
-                    try:
-                        self.wfile.write(json.dumps(resp, indent=2).encode())
-                    except Exception:
-                        import json as _json
-                        self.wfile.write(_json.dumps(resp, indent=2).encode())
-                    return
+            keys_data = key_manager.aggregates()
+            keys_data["last_updated"] = int(time.time())
+            try:
+                self.wfile.write(json.dumps(keys_data, separators=(',', ':')).encode())
+            except Exception:
+                import json as _json
+                self.wfile.write(_json.dumps(keys_data, separators=(',', ':')).encode())
+            return
 
-                if self.path.startswith('/api/ann-poll'):
-                    # Owner-only announcements feed
-                    parsed = urllib.parse.urlparse(self.path)
-                    q = urllib.parse.parse_qs(parsed.query or '')
-                    since_raw = q.get('since', ['0'])[0]
-                    try:
-                        since_ts = int(since_raw)
-                    except Exception:
-                        since_ts = 0
-                    now_ts = int(time.time())
-                    try:
-                        msgs = []
-                        if os.path.exists(ANN_FILE):
-                            with open(ANN_FILE, 'r') as f:
-                                msgs = json.load(f)
-                        if not isinstance(msgs, list):
-                            msgs = []
-                    except Exception:
-                        msgs = []
-                    new_msgs = [m for m in msgs if int(m.get('ts', 0) or 0) > since_ts]
-                    payload = { 'messages': new_msgs[-100:], 'server_time': now_ts }
-                    self.send_response(200)
-                    self.send_header('Content-Type', 'application/json')
-                    self.end_headers()
-                    try:
-                        self.wfile.write(json.dumps(payload, indent=2).encode())
-                    except Exception:
-                        import json as _json
-                        self.wfile.write(_json.dumps(payload, indent=2).encode())
-                    return
+        async def get_leaderboard(self):
+            # ?by=usage (key usage per owner) or ?by=messages (selfbot message counts); served from the kept top-K
+            q = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query or '')
+            by = (q.get('by', ['usage'])[0] or 'usage').lower()
+            board = {'usage': key_manager.usage_board, 'messages': message_stats.board}.get(by)
+            if board is None:
+                self.send_response(400)
+                self.send_header('Content-Type', 'application/json')
+                self.end_headers()
+                self.wfile.write(b'{"success":false,"error":"by must be usage or messages"}')
+                return
+            try:
+                limit = max(1, min(LEADERBOARD_SIZE, int(q.get('limit', ['10'])[0])))
+            except Exception:
+                limit = 10
+            out = {
+                'success': True,
+                'by': by,
+                'entries': [{'user_id': str(uid), 'count': count} for uid, count in board.top(limit)],
+                'users': len(board),
+                'last_updated': int(time.time())
+            }
+            uid = (q.get('user_id', [''])[0] or '').strip()
+            if uid:
+                ident = int(uid) if by == 'usage' and uid.isdigit() else uid
+                out['you'] = {'user_id': uid, 'count': board.scores.get(ident, 0), 'rank': board.rank(ident)}
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.end_headers()
+            self.wfile.write(json.dumps(out, separators=(',', ':')).encode())
+            return
 
-                if self.path.startswith('/api/chat-poll'):
-                    # Long-poll style: clients poll for new chat messages
-                    parsed = urllib.parse.urlparse(self.path)
-                    q = urllib.parse.parse_qs(parsed.query or '')
-                    since_raw = q.get('since', ['0'])[0]
-                    user_q = q.get('user_id', ['0'])[0]
-                    try:
-                        since_ts = int(since_raw)
-                    except Exception:
-                        since_ts = 0
-                    try:
-                        uid = int(user_q)
-                    except Exception:
-                        uid = 0
-                    if not uid:
-                        self.send_response(400)
-                        self.send_header('Content-Type', 'application/json')
-                        self.end_headers()
-                        self.wfile.write(b'{"success":false,"error":"missing user_id"}')
-                        return
-                    if not uid:
-                        self.send_response(400)
-                        self.send_header('Content-Type', 'application/json')
-                        self.end_headers()
-                        self.wfile.write(b'{"success":false,"error":"missing user_id"}')
-                        return
-                    now_ts = int(time.time())
-                    # Load messages
-                    try:
-                        msgs = []
-                        if os.path.exists(CHAT_FILE):
-                            with open(CHAT_FILE, 'r') as f:
-                                msgs = json.load(f)
-                        if not isinstance(msgs, list):
-                            msgs = []
-                    except Exception:
-                        msgs = []
-                    new_msgs = [m for m in msgs if int(m.get('ts', 0) or 0) > since_ts]
-                    # Determine if user can send: has role or reached threshold
-                    can_send = False
-                    try:
-                        guild = bot.get_guild(GUILD_ID)
-                        cnt = int(MESSAGE_STATS.get(str(uid), 0))
-                        if cnt >= MESSAGES_THRESHOLD:
-                            can_send = True
-                        elif guild and uid:
-                            member = guild.get_member(uid)
-                            if member:
-                                can_send = any(r.id == CHATSEND_ROLE_ID for r in member.roles)
-                    except Exception:
-                        can_send = False
-                    payload = {
-                        'messages': new_msgs[-100:],
-                        'server_time': now_ts,
-                        'can_send': can_send
-                    }
-                    self.send_response(200)
-                    self.send_header('Content-Type', 'application/json')
-                    self.end_headers()
-                    self.wfile.write(json.dumps(payload, indent=2).encode())
-                    return
+        async def get_metrics(self):
+            metrics = {
+                'backup_uploader': backup_uploader.stats(),
+                'role_reconciler': role_reconciler.stats(),
+                'member_cache': member_cache.stats(),
+                'member_status': member_status_cache.stats(),
+                'http_client': http_client.stats(),
+                'feeds': {'chat': chat_feed.stats(), 'announcements': ann_feed.stats()},
+                'message_stats': message_stats.stats(),
+                'key_writes': key_manager.write_stats(),
+                'routes': route_latency.snapshot(),
+                'last_updated': int(time.time())
+            }
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.end_headers()
+            self.wfile.write(json.dumps(metrics, separators=(',', ':')).encode())
+            return
 
-                if self.path == '/api/key-info':
-                    parsed = urllib.parse.urlparse(self.path)
-                    q = urllib.parse.parse_qs(parsed.query or '')
-                    key = (q.get('key', [None])[0])
-                    if not key:
-                        self.send_response(400)
-                        self.send_header('Content-Type', 'application/json')
-                        self.end_headers()
-                        try:
-                            self.wfile.write(json.dumps({'error':'missing key'}).encode())
-                        except Exception:
-                            import json as _json
-                            self.wfile.write(_json.dumps({'error':'missing key'}).encode())
-                        return
-                    info = None
-                    if key in key_manager.keys:
-                        d = key_manager.keys[key]
-                        info = {
-                            'exists': True,
-                            'is_active': d.get('is_active', False),
-                            'user_id': d.get('user_id', 0),
-                            'machine_id': d.get('machine_id'),
-                            'duration_days': d.get('duration_days'),
-                            'created_time': d.get('created_time'),
-                            'activation_time': d.get('activation_time'),
-                            'expiration_time': d.get('expiration_time'),
-                            'key_type': d.get('key_type','general')
-                        }
-                    else:
-                        info = {'exists': False}
-                    self.send_response(200)
-                    self.send_header('Content-Type','application/json')
+        async def get_download(self):
+            # Direct download endpoints
+            candidates = {
+                'selfbot.py': ('SelfBot.py', 'Selfbot.py', 'selfbot.py'),
+                'selfbot': ('SelfBot.py', 'Selfbot.py', 'selfbot.py'),
+                'bot.py': ('bot.py',),
+                'bot': ('bot.py',),
+            }.get(self.request.match_info.get('name', '').lower())
+            if not candidates:
+                self.send_response(303)
+                self.send_header('Location', '/')
+                self.end_headers()
+                return
+            file_path = next((p for p in candidates if os.path.exists(os.path.join('.', p))), None)
+            if not file_path:
+                self.send_response(404)
+                self.end_headers()
+                self.wfile.write(b'Not found')
+                return
+            try:
+                with open(os.path.join('.', file_path), 'rb') as f:
+                    data = f.read()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/octet-stream')
+                self.send_header('Content-Disposition', f'attachment; filename="{file_path}"')
+                self.end_headers()
+                self.wfile.write(data)
+            except Exception as e:
+                self.send_response(500)
+                self.send_header('Content-Type', 'text/plain')
+                self.end_headers()
+                self.wfile.write(f"Failed to read {file_path}: {e}".encode())
+            return
+
+        async def post_generate(self):
+            content_length = int(self.headers.get('Content-Length', 0))
+            body = self.rfile.read(content_length).decode()
+            data = urllib.parse.parse_qs(body)
+            def to_int(name):
+                try:
+                    return max(0, int(data.get(name, ['0'])[0]))
+                except Exception:
+                    return 0
+            daily = to_int('daily')
+            weekly = to_int('weekly')
+            monthly = to_int('monthly')
+            lifetime = to_int('lifetime')
+            spec = {"daily": daily, "weekly": weekly, "monthly": monthly, "lifetime": lifetime}
+            # Optional extra tier with its own name and duration
+            custom_type = (data.get('custom_type', [''])[0] or '').strip()[:32]
+            custom_count = to_int('custom_count')
+            if custom_type and custom_count:
+                if custom_type.lower() in BUILTIN_KEY_TYPES:
+                    # Would silently replace the built-in tier's count and duration
+                    self.send_response(400)
+                    self.send_header('Content-Type', 'text/plain')
                     self.end_headers()
-                    self.wfile.write(json.dumps(info, indent=2).encode())
+                    self.wfile.write(f"'{custom_type}' is a built-in tier; pick another name for the custom tier".encode())
                     return
+                spec[custom_type] = (custom_count, max(1, to_int('custom_days') or 30))
 
-                if self.path == '/download/selfbot.py':
-                    try:
-                        sb_path = os.path.join(os.getcwd(), 'SelfBot.py')
-                        with open(sb_path, 'rb') as f:
-                            data = f.read()
-                        self.send_response(200)
-                        self.send_header('Content-Type', 'application/octet-stream')
-                        self.send_header('Content-Disposition', 'attachment; filename="SelfBot.py"')
-                        self.send_header('Content-Length', str(len(data)))
-                        self.end_headers()
-                        self.wfile.write(data)
-                    except Exception as e:
-                        self.send_response(500)
-                        self.send_header('Content-Type', 'text/plain')
-                        self.end_headers()
-                        self.wfile.write(f"Failed to read SelfBot.py: {e}".encode())
-                    return
+            result = key_manager.generate_keys(spec)
+            key_manager.last_generated = result
 
-                if self.path == '/download/bot.py':
-                    try:
-                        bp_path = os.path.join(os.getcwd(), 'bot.py')
-                        with open(bp_path, 'rb') as f:
-                            data = f.read()
-                        self.send_response(200)
-                        self.send_header('Content-Type', 'application/octet-stream')
-                        self.send_header('Content-Disposition', 'attachment; filename="bot.py"')
-                        self.send_header('Content-Length', str(len(data)))
-                        self.end_headers()
-                        self.wfile.write(data)
-                    except Exception as e:
-                        self.send_response(500)
-                        self.send_header('Content-Type', 'text/plain')
-                        self.end_headers()
-                        self.wfile.write(f"Failed to read bot.py: {e}".encode())
-                    return
+            self.send_response(303)
+            self.send_header('Location','/generate-form')
+            self.end_headers()
+            return
 
-                if self.path == '/':
-                    self.send_response(200)
-                    self.send_header('Content-type', 'text/html')
-                    self.end_headers()
+        async def post_revoke_delete(self):
+            content_length = int(self.headers.get('Content-Length', 0))
+            body = self.rfile.read(content_length).decode()
+            data = urllib.parse.parse_qs(body)
+            key = (data.get('key',[None])[0])
+            if not key:
+                self.send_response(400)
+                self.end_headers()
+                self.wfile.write(b'Missing key')
+                return
+            ok = False
+            if self.path == '/revoke':
+                ok = key_manager.revoke_key(key)
+            else:
+                ok = key_manager.delete_key(key)
+            self.send_response(303)
+            self.send_header('Location','/keys')
+            self.end_headers()
+            return
 
-                    # Get comprehensive key statistics for HTML dashboard
-                    total_keys = len(key_manager.keys)
-                    active_keys = sum(1 for k in key_manager.keys.values() if k["is_active"])
-                    revoked_keys = total_keys - active_keys
-                    deleted_keys = len(key_manager.deleted_keys)
-
-                    daily_keys = sum(1 for k in key_manager.keys.values() if k.get("key_type") == "daily" and k["is_active"])
-                    weekly_keys = sum(1 for k in key_manager.keys.values() if k.get("key_type") == "weekly" and k["is_active"])
-                    monthly_keys = sum(1 for k in key_manager.keys.values() if k.get("key_type") == "monthly" and k["is_active"])
-                    lifetime_keys = sum(1 for k in key_manager.keys.values() if k.get("key_type") == "lifetime" and k["is_active"])
-                    general_keys = sum(1 for k in key_manager.keys.values() if k.get("key_type") == "general" and k["is_active"])
-
-                    available_daily = sum(1 for k in key_manager.keys.values() if k.get("key_type") == "daily" and k["is_active"] and k["user_id"] == 0)
-                    available_weekly = sum(1 for k in key_manager.keys.values() if k.get("key_type") == "weekly" and k["is_active"] and k["user_id"] == 0)
-                    available_monthly = sum(1 for k in key_manager.keys.values() if k.get("key_type") == "monthly" and k["is_active"] and k["user_id"] == 0)
-                    available_lifetime = sum(1 for k in key_manager.keys.values() if k.get("key_type") == "lifetime" and k["is_active"] and k["user_id"] == 0)
-                    available_general = sum(1 for k in key_manager.keys.values() if k.get("key_type") == "general" and k["is_active"] and k["user_id"] == 0)
-
-                    response = f"""
-                    <html>
-                      <head>
-                        <title>Discord Key Bot</title>
-                        <meta name='viewport' content='width=device-width, initial-scale=1'/>
-                        <style>
-                          :root {{ --bg:#0b0718; --panel:#120a2a; --muted:#b399ff; --border:#1f1440; --text:#efeaff; --accent:#6c4af2; }}
-                          * {{ box-sizing: border-box; }}
-                          body {{ margin:0; font-family: Inter, system-ui, -apple-system, Segoe UI, Roboto, Arial, sans-serif; background: var(--bg); color: var(--text); }}
-                          header {{ background: var(--panel); border-bottom:1px solid var(--border); padding: 16px 24px; display:flex; align-items:center; gap:12px; flex-wrap: wrap; }}
-                          .brand {{ font-weight:700; letter-spacing:0.3px; margin-right:8px; }}
-                          a.nav {{ color: var(--muted); text-decoration:none; padding:8px 12px; border-radius:10px; background:#121a36; border:1px solid #1a2650; }}
-                          a.nav:hover {{ background:#19214a; }}
-                          main {{ padding: 24px; max-width: 1100px; margin: 0 auto; }}
-                          .grid {{ display:grid; grid-template-columns: repeat(auto-fit, minmax(220px, 1fr)); gap:16px; }}
-                          .card {{ background: var(--panel); border:1px solid var(--border); border-radius:14px; padding:18px; }}
-                          .stat {{ display:flex; flex-direction:column; gap:4px; }}
-                          .stat .label {{ color:#b9c7ff; font-size:12px; text-transform:uppercase; letter-spacing:0.4px; }}
-                          .stat .value {{ font-size:28px; font-weight:700; color:#dfe6ff; }}
-                          .muted {{ color:#a4b1d6; font-size:14px; }}
-                          .row {{ display:flex; gap:16px; align-items:stretch; flex-wrap:wrap; }}
-                          .actions a {{ display:inline-block; margin-right:8px; margin-top:8px; color:white; background: var(--accent); padding:10px 12px; border-radius:10px; text-decoration:none; border:1px solid #2049cc; }}
-                          .actions a:hover {{ filter: brightness(0.95); }}
-                          .kgrid {{ display:grid; grid-template-columns: repeat(auto-fit, minmax(200px, 1fr)); gap:12px; }}
-                          .kbox {{ background:#0b132b; border:1px solid #1c2b5b; padding:14px; border-radius:12px; }}
-                          .kbox .ttl {{ color:#b9c7ff; font-size:12px; letter-spacing:0.3px; text-transform:uppercase; }}
-                          .kbox .num {{ font-size:22px; font-weight:700; color:#e6edff; }}
-                          .kbox .sub {{ font-size:12px; color:#9ab0ff; margin-top:4px; }}
-                        </style>
-                      </head>
-                      <body>
-                        <header>
-                          <div class='brand' style='font-size:28px;font-weight:800;letter-spacing:0.6px'>CS BOT <span style='font-weight:600;color:#b799ff'>made by iris&classical</span></div>
-                          <a class='nav' href='/'>Dashboard</a>
-                          <a class='nav' href='/keys'>Keys</a>
-                          <a class='nav' href='/my'>My Keys</a>
-                          <a class='nav' href='/deleted'>Deleted</a>
-                          <a class='nav' href='/generate-form'>Generate</a>
-                          <a class='nav' href='/backup'>Backup</a>
-                        </header>
-                        <main>
-                          <div class='row'>
-                            <div class='card' style='flex:2'>
-                              <div class='grid'>
-                                <div class='stat card'>
-                                  <div class='label'>Total Keys</div>
-                                  <div class='value'>{total_keys}</div>
-                                  <div class='muted'>All keys in database</div>
-                                </div>
-                                <div class='stat card'>
-                                  <div class='label'>Active</div>
-                                  <div class='value'>{active_keys}</div>
-                                  <div class='muted'>Currently valid</div>
-                                </div>
-                                <div class='stat card'>
-                                  <div class='label'>Revoked</div>
-                                  <div class='value'>{revoked_keys}</div>
-                                  <div class='muted'>Access removed</div>
-                                </div>
-                                <div class='stat card'>
-                                  <div class='label'>Deleted</div>
-                                  <div class='value'>{deleted_keys}</div>
-                                  <div class='muted'>Moved to recycle</div>
-                                </div>
-                              </div>
-                              <div class='actions'>
-                                <a href='/keys'>Manage Keys</a>
-                                <a href='/generate-form'>Generate Keys</a>
-                                <a href='/my'>My Keys</a>
-                                <a href='/backup'>Backup</a>
-                              </div>
-                            </div>
-                          </div>
-                          <div style='height:16px'></div>
-                          <div class='card'>
-                            <div class='kgrid'>
-                              <div class='kbox'>
-                                <div class='ttl'>Daily Keys</div>
-                                <div class='num'>{daily_keys}</div>
-                                <div class='sub'>Available: {available_daily}</div>
-                              </div>
-                              <div class='kbox'>
-                                <div class='ttl'>Weekly Keys</div>
-                                <div class='num'>{weekly_keys}</div>
-                                <div class='sub'>Available: {available_weekly}</div>
-                              </div>
-                              <div class='kbox'>
-                                <div class='ttl'>Monthly Keys</div>
-                                <div class='num'>{monthly_keys}</div>
-                                <div class='sub'>Available: {available_monthly}</div>
-                              </div>
-                              <div class='kbox'>
-                                <div class='ttl'>Lifetime Keys</div>
-                                <div class='num'>{lifetime_keys}</div>
-                                <div class='sub'>Available: {available_lifetime}</div>
-                              </div>
-                              <div class='kbox'>
-                                <div class='ttl'>General Keys</div>
-                                <div class='num'>{general_keys}</div>
-                                <div class='sub'>Available: {available_general}</div>
-                              </div>
-                            </div>
-                            <div class='muted' style='margin-top:10px'>
-                              Status: Online • {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')} • Bot: {bot.user.name if bot.user else 'Starting...'}
-                            </div>
-                          </div>
-                        </main>
-                      </body>
-                    </html>
-                    """
-                    self.wfile.write(response.encode())
-                    return
+        async def post_activate(self):
+            content_length = int(self.headers.get('Content-Length', 0))
+            body = self.rfile.read(content_length).decode()
+            data = urllib.parse.parse_qs(body)
+            key = (data.get('key', [None])[0])
+            user_id_str = (data.get('user_id', [None])[0])
+            machine = (data.get('machine_id', [''])[0])
+            try:
+                user_id_val = int(user_id_str) if user_id_str is not None else None
+            except Exception:
+                user_id_val = None
+            resp = {}
+            status_code = 200
+            if not key or not user_id_val or not machine:
+                resp = {'success': False, 'error': 'missing key, user_id, or machine_id'}
+                status_code = 400
+            else:
+                try:
+                    result = key_manager.activate_key(key, str(machine), int(user_id_val))
+                    resp = result
+                    if not result.get('success'):
+                        status_code = 400
+                        print(f"/api/activate failure for key={key}: {result}")
+                    # The role is granted by role_reconciler from the activation event
+                except Exception as e:
+                    resp = {'success': False, 'error': str(e)}
+                    status_code = 500
+                    print(f"/api/activate exception: {e}")
+            self.send_response(status_code)
+            self.send_header('Content-Type', 'application/json')
+            self.end_headers()
+            try:
+                self.wfile.write(json.dumps(resp, separators=(',', ':')).encode())
+            except Exception:
+                import json as _json
+                self.wfile.write(_json.dumps(resp, separators=(',', ':')).encode())
+            return
 
-                if self.path == '/api/keys':
-                    self.send_response(200)
-                    self.send_header('Content-type', 'application/json')
-                    self.end_headers()
+        async def post_rebind(self):
+            content_length = int(self.headers.get('Content-Length', 0))
+            body = self.rfile.read(content_length).decode()
+            data = urllib.parse.parse_qs(body)
+            key = (data.get('key', [None])[0])
+            user_id_str = (data.get('user_id', [None])[0])
+            new_machine = (data.get('machine_id', [''])[0])
+            try:
+                user_id_val = int(user_id_str) if user_id_str is not None else None
+            except Exception:
+                user_id_val = None
+            resp = {}
+            status_code = 200
+            if not key or not user_id_val or not new_machine:
+                resp = {'success': False, 'error': 'missing key, user_id, or machine_id'}
+                status_code = 400
+            else:
+                try:
+                    result = key_manager.rebind_key(key, int(user_id_val), str(new_machine))
+                    resp = result
+                    if not result.get('success'):
+                        status_code = 400
+                except Exception as e:
+                    resp = {'success': False, 'error': str(e)}
+                    status_code = 500
+            self.send_response(status_code)
+            self.send_header('Content-Type', 'application/json')
+            self.end_headers()
+            try:
+                self.wfile.write(json.dumps(resp, separators=(',', ':')).encode())
+            except Exception:
+                import json as _json
+                self.wfile.write(_json.dumps(resp, separators=(',', ':')).encode())
+            return
 
-                    keys_data = {
-                        "total_keys": len(key_manager.keys),
-                        "active_keys": sum(1 for k in key_manager.keys.values() if k["is_active"]),
-                        "revoked_keys": sum(1 for k in key_manager.keys.values() if not k["is_active"]),
-                        "deleted_keys": len(key_manager.deleted_keys),
-                        "keys_by_type": {
-                            "daily": sum(1 for k in key_manager.keys.values() if k.get("key_type") == "daily" and k["is_active"]),
-                            "weekly": sum(1 for k in key_manager.keys.values() if k.get("key_type") == "weekly" and k["is_active"]),
-                            "monthly": sum(1 for k in key_manager.keys.values() if k.get("key_type") == "monthly" and k["is_active"]),
-                            "lifetime": sum(1 for k in key_manager.keys.values() if k.get("key_type") == "lifetime" and k["is_active"]),
-                            "general": sum(1 for k in key_manager.keys.values() if k.get("key_type") == "general" and k["is_active"])
-                        },
-                        "available_keys": {
-                            "daily": sum(1 for k in key_manager.keys.values() if k.get("key_type") == "daily" and k["is_active"] and k["user_id"] == 0),
-                            "weekly": sum(1 for k in key_manager.keys.values() if k.get("key_type") == "weekly" and k["is_active"] and k["user_id"] == 0),
-                            "monthly": sum(1 for k in key_manager.keys.values() if k.get("key_type") == "monthly" and k["is_active"] and k["user_id"] == 0),
-                            "lifetime": sum(1 for k in key_manager.keys.values() if k.get("key_type") == "lifetime" and k["is_active"] and k["user_id"] == 0),
-                            "general": sum(1 for k in key_manager.keys.values() if k.get("key_type") == "general" and k["is_active"] and k["user_id"] == 0)
-                        },
-                        "last_updated": int(time.time())
-                    }
+        async def post_sender(self):
+            # Parse form
+            content_length = int(self.headers.get('Content-Length', 0))
+            body = self.rfile.read(content_length).decode()
+            data = urllib.parse.parse_qs(body)
+            chan_str = (data.get('channel_id', [''])[0]).strip()
+            content = (data.get('content', [''])[0]).strip()
+            ok = False
+            err = None
+            try:
+                cid = int(chan_str)
+                ch = bot.get_channel(cid)
+                if ch is None:
+                    err = 'Bot cannot see this channel'
+                elif not content:
+                    err = 'Empty message'
+                else:
+                    await ch.send(content)
+                    ok = True
+            except Exception as e:
+                err = str(e)
+            # Redirect back with a flash-like message in query
+            self.send_response(303)
+            if ok:
+                self.send_header('Location', '/sender')
+            else:
+                msg = urllib.parse.quote(err or 'Failed')
+                self.send_header('Location', f'/sender?err={msg}')
+            self.end_headers()
+            return
+
+        async def post_ann(self):
+            # Only members with OWNER_ROLE_ID can post announcements
+            content_length = int(self.headers.get('Content-Length', 0))
+            body = self.rfile.read(content_length).decode()
+            data = urllib.parse.parse_qs(body)
+            content = (data.get('content', [''])[0] or '').strip()
+            user_q = (data.get('user_id', [''])[0] or '').strip()
+            if not content:
+                self.send_response(400)
+                self.send_header('Content-Type', 'application/json')
+                self.end_headers()
+                self.wfile.write(b'{"success":false,"error":"empty content"}')
+                return
+            try:
+                uid = int(user_q)
+            except Exception:
+                uid = 0
+            allowed = member_cache.is_owner(uid)
+            if not allowed:
+                self.send_response(403)
+                self.send_header('Content-Type', 'application/json')
+                self.end_headers()
+                reason = {'success': False, 'error': 'forbidden', 'reason': 'not_owner'}
+                try:
+                    self.wfile.write(json.dumps(reason).encode())
+                except Exception:
+                    import json as _json
+                    self.wfile.write(_json.dumps(reason).encode())
+                return
+            # Append announcement
+            try:
+                ts = int(time.time())
+                # Resolve username and avatar for announcer
+                username = str(uid)
+                avatar_url = ""
+                try:
+                    user = await member_cache.user(uid)
+                    if user:
+                        username = f"{user.name}#{user.discriminator}"
+                        try:
+                            avatar_url = str(user.display_avatar.url)
+                        except Exception:
+                            avatar_url = ""
+                except Exception:
+                    pass
+                m = ann_feed.append({'ts': ts, 'content': content, 'user_id': uid, 'username': username, 'avatar_url': avatar_url})
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.end_headers()
+                self.wfile.write(json.dumps({'success': True, 'ts': ts, 'seq': m['seq']}).encode())
+                return
+            except Exception as e:
+                self.send_response(500)
+                self.send_header('Content-Type', 'application/json')
+                self.end_headers()
+                self.wfile.write(json.dumps({'success': False, 'error': str(e)}).encode())
+                return
+
+        async def post_chat(self):
+            # Only members with ADMIN_CHAT_ROLE_ID (or ADMIN_ROLE_ID) can post broadcast messages
+            content_length = int(self.headers.get('Content-Length', 0))
+            body = self.rfile.read(content_length).decode()
+            data = urllib.parse.parse_qs(body)
+            content = (data.get('content', [''])[0] or '').strip()
+            user_q = (data.get('user_id', [''])[0] or '').strip()
+            if not content:
+                self.send_response(400)
+                self.send_header('Content-Type', 'application/json')
+                self.end_headers()
+                self.wfile.write(b'{"success":false,"error":"empty content"}')
+                return
+            try:
+                uid = int(user_q)
+            except Exception:
+                uid = 0
+            allowed = False
+            try:
+                guild = bot.get_guild(GUILD_ID)
+                cnt = message_stats.get(uid)
+                if cnt >= MESSAGES_THRESHOLD:
+                    allowed = True
+                is_member, _, has_chat_role, _ = member_cache.get(uid)
+                allowed = allowed or has_chat_role
+                # Auto-grant role if threshold met and missing role
+                if guild and is_member and not has_chat_role and cnt >= MESSAGES_THRESHOLD and CHATSEND_ROLE_ID:
                     try:
-                        self.wfile.write(json.dumps(keys_data, indent=2).encode())
+                        member = guild.get_member(uid)
+                        role = guild.get_role(CHATSEND_ROLE_ID)
+                        if member and role and role not in member.roles:
+                            async def _add_role():
+                                try:
+                                    await member.add_roles(role, reason="Reached message threshold")
+                                except Exception:
+                                    pass
+                            asyncio.create_task(_add_role())
                     except Exception:
-                        import json as _json
-                        self.wfile.write(_json.dumps(keys_data, indent=2).encode())
-                    return
-
-                # Direct download endpoints
-                if self.path.lower() in ('/download/selfbot.py', '/download/selfbot'):
-                    try:
-                        file_path = os.path.join('.', 'Selfbot.py')
-                        if not os.path.exists(file_path):
-                            self.send_response(404)
-                            self.end_headers()
-                            self.wfile.write(b'Not found')
-                            return
-                        self.send_response(200)
-                        self.send_header('Content-Type', 'application/octet-stream')
-                        self.send_header('Content-Disposition', 'attachment; filename="Selfbot.py"')
-                        self.end_headers()
-                        with open(file_path, 'rb') as f:
-                            self.wfile.write(f.read())
-                        return
-                    except Exception as e:
-                        self.send_response(500)
-                        self.end_headers()
-                        self.wfile.write(str(e).encode())
-                        return
-                if self.path.lower() in ('/download/bot.py', '/download/bot'):
-                    try:
-                        file_path = os.path.join('.', 'bot.py')
-                        if not os.path.exists(file_path):
-                            self.send_response(404)
-                            self.end_headers()
-                            self.wfile.write(b'Not found')
-                            return
-                        self.send_response(200)
-                        self.send_header('Content-Type', 'application/octet-stream')
-                        self.send_header('Content-Disposition', 'attachment; filename="bot.py"')
-                        self.end_headers()
-                        with open(file_path, 'rb') as f:
-                            self.wfile.write(f.read())
-                        return
-                    except Exception as e:
-                        self.send_response(500)
-                        self.end_headers()
-                        self.wfile.write(str(e).encode())
-                        return
-
-                # Redirect unknown routes to dashboard instead of 404
-                self.send_response(303)
-                self.send_header('Location', '/')
+                        pass
+            except Exception:
+                allowed = False
+            if not allowed:
+                self.send_response(403)
+                self.send_header('Content-Type', 'application/json')
                 self.end_headers()
-            except Exception as e:
+                reason = {'success': False, 'error': 'forbidden', 'reason': 'role_or_threshold'}
                 try:
-                    self.send_response(500)
-                    self.send_header('Content-type', 'text/plain')
-                    self.end_headers()
-                    self.wfile.write(f"Internal Server Error: {e}".encode())
+                    self.wfile.write(json.dumps(reason).encode())
                 except Exception:
-                    pass
-
-        def do_POST(self):
+                    import json as _json
+                    self.wfile.write(_json.dumps(reason).encode())
+                return
+            # Append message
             try:
-                if self.path == '/generate':
-                    content_length = int(self.headers.get('Content-Length', 0))
-                    body = self.rfile.read(content_length).decode()
-                    data = urllib.parse.parse_qs(body)
-                    def to_int(name):
+                ts = int(time.time())
+                # Resolve username and avatar URL for the posting user
+                username = str(uid)
+                avatar_url = ""
+                try:
+                    user = await member_cache.user(uid)
+                    if user:
+                        username = f"{user.name}#{user.discriminator}"
                         try:
-                            return max(0, int(data.get(name, ['0'])[0]))
+                            avatar_url = str(user.display_avatar.url)
                         except Exception:
-                            return 0
-                    daily = to_int('daily')
-                    weekly = to_int('weekly')
-                    monthly = to_int('monthly')
-                    lifetime = to_int('lifetime')
-
-                    result = key_manager.generate_bulk_keys(daily, weekly, monthly, lifetime)
-                    key_manager.last_generated = result
-
-                    self.send_response(303)
-                    self.send_header('Location','/generate-form')
-                    self.end_headers()
-                    return
-
-                if self.path in ('/revoke','/delete'):
-                    content_length = int(self.headers.get('Content-Length', 0))
-                    body = self.rfile.read(content_length).decode()
-                    data = urllib.parse.parse_qs(body)
-                    key = (data.get('key',[None])[0])
-                    if not key:
-                        self.send_response(400)
-                        self.end_headers()
-                        self.wfile.write(b'Missing key')
-                        return
-                    ok = False
-                    if self.path == '/revoke':
-                        ok = key_manager.revoke_key(key)
-                    else:
-                        ok = key_manager.delete_key(key)
-                    self.send_response(303)
-                    self.send_header('Location','/keys')
-                    self.end_headers()
-                    return
+                            avatar_url = ""
+                except Exception:
+                    pass
+                m = chat_feed.append({'ts': ts, 'from': 'admin', 'user_id': uid, 'username': username, 'avatar_url': avatar_url, 'content': content})
+                # Mirror to webhook (best-effort)
+                try:
+                    if CHAT_MIRROR_WEBHOOK:
+                        payload = {
+                            'content': f"[{username}] {content}"
+                        }
+                        asyncio.create_task(http_client.post(CHAT_MIRROR_WEBHOOK, json=payload, timeout=5))
+                except Exception:
+                    pass
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.end_headers()
+                self.wfile.write(json.dumps({'success': True, 'ts': ts, 'seq': m['seq']}).encode())
+                return
+            except Exception as e:
+                self.send_response(500)
+                self.send_header('Content-Type', 'application/json')
+                self.end_headers()
+                self.wfile.write(json.dumps({'success': False, 'error': str(e)}).encode())
+                return
 
-                if self.path == '/api/activate':
-                    content_length = int(self.headers.get('Content-Length', 0))
-                    body = self.rfile.read(content_length).decode()
-                    data = urllib.parse.parse_qs(body)
-                    key = (data.get('key', [None])[0])
-                    user_id_str = (data.get('user_id', [None])[0])
-                    machine = (data.get('machine_id', [''])[0])
+        async def post_stat_incr(self):
+            if STATS_SECRET and not hmac.compare_digest((self.headers.get('X-Stats-Secret') or '').encode(), STATS_SECRET.encode()):
+                self.send_response(403)
+                self.send_header('Content-Type', 'application/json')
+                self.end_headers()
+                self.wfile.write(b'{"success":false,"error":"forbidden"}')
+                return
+            try:
+                # Either a form with user_id (+ optional count), or JSON {"deltas": {user_id: n, ...}}
+                content_length = int(self.headers.get('Content-Length', 0))
+                body = self.rfile.read(content_length).decode()
+                deltas = {}
+                if (self.headers.get('Content-Type') or '').startswith('application/json'):
                     try:
-                        user_id_val = int(user_id_str) if user_id_str is not None else None
+                        deltas = dict((json.loads(body or '{}') or {}).get('deltas') or {})
                     except Exception:
-                        user_id_val = None
-                    resp = {}
-                    status_code = 200
-                    if not key or not user_id_val or not machine:
-                        resp = {'success': False, 'error': 'missing key, user_id, or machine_id'}
-                        status_code = 400
-                    else:
-                        try:
-                            result = key_manager.activate_key(key, str(machine), int(user_id_val))
-                            resp = result
-                            if not result.get('success'):
-                                status_code = 400
-                                print(f"/api/activate failure for key={key}: {result}")
-                            else:
-                                # Grant role immediately upon successful activation
-                                try:
-                                    guild = bot.get_guild(GUILD_ID)
-                                    role = guild.get_role(ROLE_ID) if guild else None
-                                    if not role and guild:
-                                        import discord as _discord
-                                        role = _discord.utils.find(lambda r: r.name.lower() == ROLE_NAME.lower(), guild.roles)
-                                    if guild and role and user_id_val:
-                                        async def _add_role():
-                                            member = guild.get_member(int(user_id_val))
-                                            if member:
-                                                await member.add_roles(role, reason="Key activated via API")
-                                        asyncio.run_coroutine_threadsafe(_add_role(), bot.loop)
-                                except Exception:
-                                    pass
-                        except Exception as e:
-                            resp = {'success': False, 'error': str(e)}
-                            status_code = 500
-                            print(f"/api/activate exception: {e}")
-                    self.send_response(status_code)
+                        deltas = {}
+                else:
+                    data = urllib.parse.parse_qs(body)
+                    uid = (data.get('user_id', [''])[0] or '').strip()
+                    if uid:
+                        deltas = {uid: (data.get('count', ['1'])[0] or '1')}
+                if not deltas:
+                    self.send_response(400)
                     self.send_header('Content-Type', 'application/json')
                     self.end_headers()
-                    try:
-                        self.wfile.write(json.dumps(resp, indent=2).encode())
-                    except Exception:
-                        import json as _json
-                        self.wfile.write(_json.dumps(resp, indent=2).encode())
+                    self.wfile.write(b'{"success":false,"error":"missing user_id"}')
                     return
-
-                if self.path == '/api/rebind':
-                    content_length = int(self.headers.get('Content-Length', 0))
-                    body = self.rfile.read(content_length).decode()
-                    data = urllib.parse.parse_qs(body)
-                    key = (data.get('key', [None])[0])
-                    user_id_str = (data.get('user_id', [None])[0])
-                    new_machine = (data.get('machine_id', [''])[0])
-                    try:
-                        user_id_val = int(user_id_str) if user_id_str is not None else None
-                    except Exception:
-                        user_id_val = None
-                    resp = {}
-                    status_code = 200
-                    if not key or not user_id_val or not new_machine:
-                        resp = {'success': False, 'error': 'missing key, user_id, or machine_id'}
-                        status_code = 400
-                    else:
-                        try:
-                            result = key_manager.rebind_key(key, int(user_id_val), str(new_machine))
-                            resp = result
-                            if not result.get('success'):
-                                status_code = 400
-                        except Exception as e:
-                            resp = {'success': False, 'error': str(e)}
-                            status_code = 500
-                    self.send_response(status_code)
+                # Counted in memory; the store flushes on its own timer / dirty threshold
+                try:
+                    totals, throttled = message_stats.add(deltas)
+                except Exception as e:
+                    self.send_response(500)
                     self.send_header('Content-Type', 'application/json')
                     self.end_headers()
-                    try:
-                        self.wfile.write(json.dumps(resp, indent=2).encode())
-                    except Exception:
-                        import json as _json
-                        self.wfile.write(_json.dumps(resp, indent=2).encode())
+                    self.wfile.write(json.dumps({'success': False, 'error': str(e)}).encode())
                     return
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.end_headers()
+                # Counts over the user's allowance are not kept; the sender should report them again later
+                self.wfile.write(json.dumps({'success': True, 'totals': totals, 'throttled': throttled}).encode())
+                return
+            except Exception as e:
+                self.send_response(500)
+                self.send_header('Content-Type', 'application/json')
+                self.end_headers()
+                self.wfile.write(json.dumps({'success': False, 'error': str(e)}).encode())
+                return
 
-                if self.path == '/sender':
-                    # Auth check via cookie
-                    cookies = _parse_cookies(self.headers.get('Cookie'))
-                    session = _decode_session(cookies.get('panel_session')) if cookies.get('panel_session') else None
-                    authed_uid = int(session.get('user_id')) if session else None
-                    authed_mid = str(session.get('machine_id')) if session else None
-                    if not authed_uid or not _has_active_access(authed_uid, authed_mid):
-                        self.send_response(303)
-                        self.send_header('Location', '/login')
-                        self.end_headers()
-                        return
-                    # Parse form
-                    content_length = int(self.headers.get('Content-Length', 0))
-                    body = self.rfile.read(content_length).decode()
-                    data = urllib.parse.parse_qs(body)
-                    chan_str = (data.get('channel_id', [''])[0]).strip()
-                    content = (data.get('content', [''])[0]).strip()
-                    ok = False
-                    err = None
-                    try:
-                        cid = int(chan_str)
-                        ch = bot.get_channel(cid)
-                        if ch is None:
-                            err = 'Bot cannot see this channel'
-                        elif not content:
-                            err = 'Empty message'
-                        else:
-                            fut = asyncio.run_coroutine_threadsafe(ch.send(content), bot.loop)
-                            fut.result(timeout=5)
-                            ok = True
-                    except Exception as e:
-                        err = str(e)
-                    # Redirect back with a flash-like message in query
-                    self.send_response(303)
-                    if ok:
-                        self.send_header('Location', '/sender')
-                    else:
-                        msg = urllib.parse.quote(err or 'Failed')
-                        self.send_header('Location', f'/sender?err={msg}')
+        # Selfbot heartbeat: mark user active with timestamp
+        async def post_heartbeat(self):
+            try:
+                content_length = int(self.headers.get('Content-Length', 0))
+                body = self.rfile.read(content_length).decode()
+                data = urllib.parse.parse_qs(body)
+                uid = (data.get('user_id', [''])[0] or '').strip()
+                if not uid:
+                    self.send_response(400)
+                    self.send_header('Content-Type', 'application/json')
                     self.end_headers()
+                    self.wfile.write(b'{"success":false,"error":"missing user_id"}')
                     return
+                ACTIVE_SELF_USERS[uid] = int(time.time())
+                # Trim old entries
+                now_ts = int(time.time())
+                to_del = [k for k, ts in ACTIVE_SELF_USERS.items() if (now_ts - int(ts)) > ACTIVE_WINDOW_SEC]
+                for k in to_del:
+                    del ACTIVE_SELF_USERS[k]
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.end_headers()
+                self.wfile.write(json.dumps({'success': True}).encode())
+                return
+            except Exception as e:
+                self.send_response(500)
+                self.send_header('Content-Type', 'application/json')
+                self.end_headers()
+                self.wfile.write(json.dumps({'success': False, 'error': str(e)}).encode())
+                return
 
-                if self.path == '/api/ann-post':
-                    # Only members with OWNER_ROLE_ID can post announcements
-                    content_length = int(self.headers.get('Content-Length', 0))
-                    body = self.rfile.read(content_length).decode()
-                    data = urllib.parse.parse_qs(body)
-                    content = (data.get('content', [''])[0] or '').strip()
-                    user_q = (data.get('user_id', [''])[0] or '').strip()
-                    if not content:
-                        self.send_response(400)
-                        self.send_header('Content-Type', 'application/json')
-                        self.end_headers()
-                        self.wfile.write(b'{"success":false,"error":"empty content"}')
-                        return
-                    try:
-                        uid = int(user_q)
-                    except Exception:
-                        uid = 0
-                    allowed = False
-                    try:
-                        guild = bot.get_guild(GUILD_ID)
-                        if guild and uid:
-                            member = guild.get_member(uid)
-                            if member is None:
-                                async def _fetch_member():
-                                    try:
-                                        return await guild.fetch_member(uid)
-                                    except Exception:
-                                        return None
-                                fut = asyncio.run_coroutine_threadsafe(_fetch_member(), bot.loop)
-                                try:
-                                    member = fut.result(timeout=5)
-                                except Exception:
-                                    member = None
-                            if member:
-                                allowed = any((r.id == OWNER_ROLE_ID) or (r.id == ADMIN_ROLE_ID) for r in member.roles)
-                    except Exception:
-                        allowed = False
-                    if not allowed:
-                        self.send_response(403)
-                        self.send_header('Content-Type', 'application/json')
-                        self.end_headers()
-                        reason = {'success': False, 'error': 'forbidden', 'reason': 'not_owner'}
-                        try:
-                            self.wfile.write(json.dumps(reason).encode())
-                        except Exception:
-                            import json as _json
-                            self.wfile.write(_json.dumps(reason).encode())
-                        return
-                    # Append announcement
-                    try:
-                        msgs = []
-                        if os.path.exists(ANN_FILE):
-                            with open(ANN_FILE, 'r') as f:
-                                msgs = json.load(f)
-                        if not isinstance(msgs, list):
-                            msgs = []
-                        ts = int(time.time())
-                        # Resolve username and avatar for announcer
-                        username = str(uid)
-                        avatar_url = ""
-                        try:
-                            async def _fetch_user():
-                                try:
-                                    return await bot.fetch_user(uid)
-                                except Exception:
-                                    return None
-                            fut = asyncio.run_coroutine_threadsafe(_fetch_user(), bot.loop)
-                            user = fut.result(timeout=5)
-                            if user:
-                                username = f"{user.name}#{user.discriminator}"
-                                try:
-                                    avatar_url = str(user.display_avatar.url)
-                                except Exception:
-                                    avatar_url = ""
-                        except Exception:
-                            pass
-                        msgs.append({'ts': ts, 'content': content, 'user_id': uid, 'username': username, 'avatar_url': avatar_url})
-                        msgs = msgs[-200:]
-                        tmp = ANN_FILE + '.tmp'
-                        with open(tmp, 'w') as f:
-                            json.dump(msgs, f, indent=2)
-                        os.replace(tmp, ANN_FILE)
-                        self.send_response(200)
-                        self.send_header('Content-Type', 'application/json')
-                        self.end_headers()
-                        self.wfile.write(json.dumps({'success': True, 'ts': ts}).encode())
-                        return
-                    except Exception as e:
-                        self.send_response(500)
-                        self.send_header('Content-Type', 'application/json')
-                        self.end_headers()
-                        self.wfile.write(json.dumps({'success': False, 'error': str(e)}).encode())
-                        return
-
-                if self.path == '/api/chat-post':
-                    # Only members with ADMIN_CHAT_ROLE_ID (or ADMIN_ROLE_ID) can post broadcast messages
-                    content_length = int(self.headers.get('Content-Length', 0))
-                    body = self.rfile.read(content_length).decode()
-                    data = urllib.parse.parse_qs(body)
-                    content = (data.get('content', [''])[0] or '').strip()
-                    user_q = (data.get('user_id', [''])[0] or '').strip()
-                    if not content:
-                        self.send_response(400)
-                        self.send_header('Content-Type', 'application/json')
-                        self.end_headers()
-                        self.wfile.write(b'{"success":false,"error":"empty content"}')
-                        return
-                    try:
-                        uid = int(user_q)
-                    except Exception:
-                        uid = 0
-                    allowed = False
-                    try:
-                        guild = bot.get_guild(GUILD_ID)
-                        cnt = int(MESSAGE_STATS.get(str(uid), 0))
-                        if cnt >= MESSAGES_THRESHOLD:
-                            allowed = True
-                        if not allowed and guild and uid:
-                            member = guild.get_member(uid)
-                            if member is None:
-                                async def _fetch_member():
-                                    try:
-                                        return await guild.fetch_member(uid)
-                                    except Exception:
-                                        return None
-                                fut = asyncio.run_coroutine_threadsafe(_fetch_member(), bot.loop)
-                                try:
-                                    member = fut.result(timeout=5)
-                                except Exception:
-                                    member = None
-                            if member:
-                                allowed = any((r.id == CHATSEND_ROLE_ID) or (r.id == ADMIN_ROLE_ID) for r in member.roles)
-                        # Auto-grant role if threshold met and missing role
-                        if guild and uid and allowed and cnt >= MESSAGES_THRESHOLD and CHATSEND_ROLE_ID:
-                            try:
-                                member = guild.get_member(uid)
-                                role = guild.get_role(CHATSEND_ROLE_ID)
-                                if member and role and role not in member.roles:
-                                    async def _add_role():
-                                        try:
-                                            await member.add_roles(role, reason="Reached message threshold")
-                                        except Exception:
-                                            pass
-                                    asyncio.run_coroutine_threadsafe(_add_role(), bot.loop)
-                            except Exception:
-                                pass
-                    except Exception:
-                        allowed = False
-                    if not allowed:
-                        self.send_response(403)
-                        self.send_header('Content-Type', 'application/json')
-                        self.end_headers()
-                        reason = {'success': False, 'error': 'forbidden', 'reason': 'role_or_threshold'}
-                        try:
-                            self.wfile.write(json.dumps(reason).encode())
-                        except Exception:
-                            import json as _json
-                            self.wfile.write(_json.dumps(reason).encode())
-                        return
-                    # Append message
-                    try:
-                        msgs = []
-                        if os.path.exists(CHAT_FILE):
-                            with open(CHAT_FILE, 'r') as f:
-                                msgs = json.load(f)
-                        if not isinstance(msgs, list):
-                            msgs = []
-                        ts = int(time.time())
-                        # Resolve username and avatar URL for the posting user
-                        username = str(uid)
-                        avatar_url = ""
-                        try:
-                            async def _fetch_user():
-                                try:
-                                    return await bot.fetch_user(uid)
-                                except Exception:
-                                    return None
-                            fut = asyncio.run_coroutine_threadsafe(_fetch_user(), bot.loop)
-                            user = fut.result(timeout=5)
-                            if user:
-                                username = f"{user.name}#{user.discriminator}"
-                                try:
-                                    avatar_url = str(user.display_avatar.url)
-                                except Exception:
-                                    avatar_url = ""
-                        except Exception:
-                            pass
-                        msgs.append({'ts': ts, 'from': 'admin', 'user_id': uid, 'username': username, 'avatar_url': avatar_url, 'content': content})
-                        msgs = msgs[-200:]
-                        tmp = CHAT_FILE + '.tmp'
-                        with open(tmp, 'w') as f:
-                            json.dump(msgs, f, indent=2)
-                        os.replace(tmp, CHAT_FILE)
-                        # Mirror to webhook (best-effort)
-                        try:
-                            if CHAT_MIRROR_WEBHOOK:
-                                payload = {
-                                    'content': f"[{username}] {content}"
-                                }
-                                requests.post(CHAT_MIRROR_WEBHOOK, json=payload, timeout=5)
-                        except Exception:
-                            pass
-                        self.send_response(200)
-                        self.send_header('Content-Type', 'application/json')
-                        self.end_headers()
-                        self.wfile.write(json.dumps({'success': True, 'ts': ts}).encode())
-                        return
-                    except Exception as e:
-                        self.send_response(500)
-                        self.send_header('Content-Type', 'application/json')
-                        self.end_headers()
-                        self.wfile.write(json.dumps({'success': False, 'error': str(e)}).encode())
-                        return
-
-                if self.path == '/api/stat-incr':
-                    try:
-                        content_length = int(self.headers.get('Content-Length', 0))
-                        body = self.rfile.read(content_length).decode()
-                        data = urllib.parse.parse_qs(body)
-                        uid = (data.get('user_id', [''])[0] or '').strip()
-                        if not uid:
-                            self.send_response(400)
-                            self.send_header('Content-Type', 'application/json')
-                            self.end_headers()
-                            self.wfile.write(b'{"success":false,"error":"missing user_id"}')
-                            return
-                        # Increment and persist
-                        try:
-                            MESSAGE_STATS[uid] = int(MESSAGE_STATS.get(uid, 0)) + 1
-                            tmp = STATS_FILE + '.tmp'
-                            with open(tmp, 'w') as f:
-                                json.dump(MESSAGE_STATS, f, indent=2)
-                            os.replace(tmp, STATS_FILE)
-                        except Exception as e:
-                            self.send_response(500)
-                            self.send_header('Content-Type', 'application/json')
-                            self.end_headers()
-                            self.wfile.write(json.dumps({'success': False, 'error': str(e)}).encode())
-                            return
-                        self.send_response(200)
-                        self.send_header('Content-Type', 'application/json')
-                        self.end_headers()
-                        self.wfile.write(b'{"success":true}')
-                        return
-                    except Exception as e:
-                        self.send_response(500)
-                        self.send_header('Content-Type', 'application/json')
-                        self.end_headers()
-                        self.wfile.write(json.dumps({'success': False, 'error': str(e)}).encode())
-                        return
-                
-                # Selfbot heartbeat: mark user active with timestamp
-                if self.path == '/api/selfbot-heartbeat':
-                    try:
-                        content_length = int(self.headers.get('Content-Length', 0))
-                        body = self.rfile.read(content_length).decode()
-                        data = urllib.parse.parse_qs(body)
-                        uid = (data.get('user_id', [''])[0] or '').strip()
-                        if not uid:
-                            self.send_response(400)
-                            self.send_header('Content-Type', 'application/json')
-                            self.end_headers()
-                            self.wfile.write(b'{"success":false,"error":"missing user_id"}')
-                            return
-                        ACTIVE_SELF_USERS[uid] = int(time.time())
-                        # Trim old entries
-                        now_ts = int(time.time())
-                        to_del = [k for k, ts in ACTIVE_SELF_USERS.items() if (now_ts - int(ts)) > ACTIVE_WINDOW_SEC]
-                        for k in to_del:
-                            del ACTIVE_SELF_USERS[k]
-                        self.send_response(200)
-                        self.send_header('Content-Type', 'application/json')
-                        self.end_headers()
-                        self.wfile.write(json.dumps({'success': True}).encode())
-                        return
-                    except Exception as e:
-                        self.send_response(500)
-                        self.send_header('Content-Type', 'application/json')
-                        self.end_headers()
-                        self.wfile.write(json.dumps({'success': False, 'error': str(e)}).encode())
-                        return
-                
-                # Active users count
-                if self.path == '/api/active-users':
-                    try:
-                        now_ts = int(time.time())
-                        count = 0
-                        for ts in list(ACTIVE_SELF_USERS.values()):
-                            if (now_ts - int(ts)) <= ACTIVE_WINDOW_SEC:
-                                count += 1
-                        self.send_response(200)
-                        self.send_header('Content-Type', 'application/json')
-                        self.end_headers()
-                        self.wfile.write(json.dumps({'active_users': count}).encode())
-                        return
-                    except Exception as e:
-                        self.send_response(500)
-                        self.send_header('Content-Type', 'application/json')
-                        self.end_headers()
-                        self.wfile.write(json.dumps({'success': False, 'error': str(e)}).encode())
-                        return
-
-                # Redirect unknown routes to dashboard instead of 404
-                self.send_response(303)
-                self.send_header('Location', '/')
+        # Active users count
+        async def post_active_users(self):
+            try:
+                now_ts = int(time.time())
+                count = 0
+                for ts in list(ACTIVE_SELF_USERS.values()):
+                    if (now_ts - int(ts)) <= ACTIVE_WINDOW_SEC:
+                        count += 1
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
                 self.end_headers()
+                self.wfile.write(json.dumps({'active_users': count}).encode())
+                return
             except Exception as e:
-                try:
-                    self.send_response(500)
-                    self.send_header('Content-type', 'text/plain')
-                    self.end_headers()
-                    self.wfile.write(f"Internal Server Error: {e}".encode())
-                except Exception:
-                    pass
-    
-    try:
-        # Use Render's PORT environment variable or default to 8080
-        port = int(os.getenv('PORT', 8080))
-        from http.server import ThreadingHTTPServer
-        server = ThreadingHTTPServer(("", port), HealthCheckHandler)
-        print(f"🌐 Health check server started on port {port}")
-        # Start aiohttp app for webhooks
-        async def _run_aiohttp():
-            app = web.Application()
-            runner = web.AppRunner(app)
-            await runner.setup()
-            site = web.TCPSite(runner, '0.0.0.0', port+1)
-            await site.start()
-        import asyncio
+                self.send_response(500)
+                self.send_header('Content-Type', 'application/json')
+                self.end_headers()
+                self.wfile.write(json.dumps({'success': False, 'error': str(e)}).encode())
+                return
+
+    # (method, path, PanelRequest handler, needs panel session)
+    routes = [
+        ('HEAD', '/', 'head_index', False),
+        ('GET', '/', 'get_dashboard', False),
+        ('GET', '/login', 'get_login', False),
+        ('GET', '/logout', 'get_logout', False),
+        ('GET', '/sender', 'get_sender', False),
+        ('GET', '/generate-form', 'get_generate_form', False),
+        ('GET', '/keys', 'get_keys', False),
+        ('GET', '/deleted', 'get_deleted', False),
+        ('GET', '/my', 'get_my', False),
+        ('GET', '/backup', 'get_backup', False),
+        ('GET', '/backup/list', 'get_backup', False),
+        ('GET', '/download/{name}', 'get_download', False),
+        ('GET', '/api/member-status', 'get_member_status', False),
+        ('GET', '/api/ann-poll', 'get_ann_poll', False),
+        ('GET', '/api/chat-poll', 'get_chat_poll', False),
+        ('GET', '/api/chat-stream', 'get_chat_stream', False),
+        ('GET', '/api/ann-stream', 'get_ann_stream', False),
+        ('GET', '/api/key-info', 'get_key_info', False),
+        ('GET', '/api/keys', 'get_api_keys', False),
+        ('GET', '/api/keys/page', 'get_keys_page', False),
+        ('GET', '/api/leaderboard', 'get_leaderboard', False),
+        ('GET', '/api/metrics', 'get_metrics', False),
+        ('POST', '/generate', 'post_generate', False),
+        ('POST', '/revoke', 'post_revoke_delete', False),
+        ('POST', '/delete', 'post_revoke_delete', False),
+        ('POST', '/sender', 'post_sender', True),
+        ('POST', '/api/activate', 'post_activate', False),
+        ('POST', '/api/rebind', 'post_rebind', False),
+        ('POST', '/api/ann-post', 'post_ann', False),
+        ('POST', '/api/chat-post', 'post_chat', False),
+        ('POST', '/api/stat-incr', 'post_stat_incr', False),
+        ('POST', '/api/selfbot-heartbeat', 'post_heartbeat', False),
+        ('POST', '/api/active-users', 'post_active_users', False),
+    ]
+
+    def make_handler(handler_name: str, needs_session: bool):
+        async def handle(request: web.Request) -> web.StreamResponse:
+            body = await request.read() if request.can_read_body else b''
+            panel = PanelRequest(request, body)
+            try:
+                # Session decoding (and its key scan) only runs for routes that need it
+                if not needs_session or panel.require_session():
+                    result = await getattr(panel, handler_name)()
+                    # Key writes are batched per loop tick; persist them before the reply reports success
+                    key_manager.flush_writes()
+                    if isinstance(result, web.StreamResponse):
+                        return result
+            except Exception as e:
+                panel = PanelRequest(request, b'')
+                panel.send_response(500)
+                panel.send_header('Content-type', 'text/plain')
+                panel.end_headers()
+                panel.wfile.write(f"Internal Server Error: {e}".encode())
+            return panel.response()
+        return handle
+
+    @web.middleware
+    async def route_timing(request: web.Request, handler):
+        started = time.perf_counter()
         try:
-            loop = asyncio.get_event_loop()
-        except RuntimeError:
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-        loop.create_task(_run_aiohttp())
-        server.serve_forever()
-    except Exception as e:
-        print(f"❌ Health check server failed: {e}")
+            return await handler(request)
+        finally:
+            # Held-open streams would only skew the histograms
+            if not request.get(STREAMING):
+                route_latency.observe(request.get(ROUTE_NAME, 'not_found'), time.perf_counter() - started)
+
+    @web.middleware
+    async def compress_responses(request: web.Request, handler):
+        resp = await handler(request)
+        if (isinstance(resp, web.Response) and not resp.prepared and resp.status not in (204, 304)
+                and _is_compressible(resp.content_type) and 'Content-Encoding' not in resp.headers):
+            resp.headers['Vary'] = 'Accept-Encoding'
+            if resp.body is not None and len(resp.body) >= COMPRESS_MIN_BYTES and _accepts_gzip(request):
+                resp.enable_compression(web.ContentCoding.gzip)
+        return resp
+
+    app = web.Application(client_max_size=8 * 1024 * 1024, middlewares=[route_timing, compress_responses])
+    for method, path, handler_name, needs_session in routes:
+        handler = make_handler(handler_name, needs_session)
+
+        async def named(request: web.Request, _handler=handler, _name=f"{method} {path}"):
+            request[ROUTE_NAME] = _name
+            return await _handler(request)
+        app.router.add_route(method, path, named)
+    app.router.add_route('*', '/{tail:.*}', make_handler('not_found', False))
+    return app
+
+async def start_web_server() -> web.AppRunner:
+    """Serve the web app on Render's PORT (default 8080) from the current event loop"""
+    port = int(os.getenv('PORT', 8080))
+    runner = web.AppRunner(build_web_app(), access_log=None, keepalive_timeout=75)
+    await runner.setup()
+    await web.TCPSite(runner, '0.0.0.0', port).start()
+    print(f"🌐 Web server started on port {port}")
+    return runner
 
 # Error handling
 @bot.event
@@ -3199,7 +5712,7 @@ async def set_backup_channel_cmd(interaction: discord.Interaction, channel: disc
         # Optional immediate backup
         try:
             payload = key_manager.build_backup_payload()
-            data = json.dumps(payload, indent=2).encode()
+            data = await asyncio.get_running_loop().run_in_executor(None, lambda: json.dumps(payload, indent=2).encode())
             file = discord.File(io.BytesIO(data), filename=f"backup_{int(time.time())}.json")
             await channel.send(content="Manual backup after setting channel", file=file)
         except Exception:
@@ -3232,16 +5745,8 @@ async def leaderboard(interaction: discord.Interaction):
     """Show the top users by key usage"""
     # Everyone can use this command
 
-    # Aggregate usage by user_id
-    usage = key_manager.key_usage
-    user_counts = {}
-    for key, data in usage.items():
-        uid = key_manager.keys.get(key, {}).get("user_id", 0)
-        if uid:
-            user_counts[uid] = user_counts.get(uid, 0) + data.get("usage_count", 0)
-
-    # Sort and get top 10
-    top = sorted(user_counts.items(), key=lambda x: x[1], reverse=True)[:10]
+    # Per-user usage totals and their ranking are kept up to date by the key manager
+    top = key_manager.top_users(10)
     if not top:
         await _message("No usage data yet.", ephemeral=True)
         return
@@ -3277,43 +5782,6 @@ async def help_command(interaction: discord.Interaction):
         embed.add_field(name=name, value=desc, inline=False)
     await _message(embed=embed, ephemeral=True)
 
-# Run the bot
-if __name__ == "__main__":
-    print("🚀 Starting Discord Bot...")
-    print("=" * 40)
-    
-    # Start health check server in a separate thread
-    health_thread = threading.Thread(target=start_health_check, daemon=True)
-    health_thread.start()
-    print("✅ Health check server started")
-
-    async def start_with_backoff():
-        delay_seconds = 60
-        max_delay = 900
-        while True:
-            try:
-                print("🔗 Connecting to Discord...")
-                await bot.start(BOT_TOKEN)
-            except Exception as e:
-                # If Discord is rate-limiting or network issue, back off and retry
-                msg = str(e)
-                if "429" in msg or "Too Many Requests" in msg:
-                    print(f"⚠️ 429/Rate limited. Retrying in {delay_seconds}s...")
-                else:
-                    print(f"⚠️ Startup error: {e}. Retrying in {delay_seconds}s...")
-                await asyncio.sleep(delay_seconds)
-                delay_seconds = min(delay_seconds * 2, max_delay)
-            else:
-                break
-
-    try:
-        asyncio.run(start_with_backoff())
-    except KeyboardInterrupt:
-        print("\n👋 Bot stopped by user")
-    except Exception as e:
-        print(f"❌ Fatal error: {e}")
-        exit(1)
-
 async def purge_global_commands():
     try:
         app_id = (bot.user.id if bot.user else None)
@@ -3325,56 +5793,13 @@ async def purge_global_commands():
 
 # --- ADD LEADERBOARD COMMAND BELOW ---
 
-@tasks.loop(seconds=60)
+@tasks.loop(minutes=RECONCILE_SWEEP_MIN)
 async def reconcile_roles_task():
-    """Grant or remove the access role based on key validity."""
+    """Low-frequency safety sweep; day-to-day role changes come from key events."""
     try:
-        guild = bot.get_guild(GUILD_ID)
-        if not guild:
-            return
-        role = guild.get_role(ROLE_ID)
-        if not role:
-            try:
-                import discord as _discord
-                role = _discord.utils.find(lambda r: r.name.lower() == ROLE_NAME.lower(), guild.roles)
-            except Exception:
-                role = None
-        if not role:
-            return
-        now = int(time.time())
-        # Build set of user_ids present in keys
-        user_ids: set[int] = set()
-        for _, data in key_manager.keys.items():
-            uid = data.get('user_id')
-            if uid:
-                try:
-                    user_ids.add(int(uid))
-                except Exception:
-                    pass
-        for uid in user_ids:
-            # Determine if user has at least one active (not expired and not revoked) key
-            has_active = False
-            for _, data in key_manager.keys.items():
-                if int(data.get('user_id', 0)) != uid:
-                    continue
-                if not data.get('is_active', False):
-                    continue
-                exp = int(data.get('expiration_time') or 0)
-                if exp == 0 or exp > now:
-                    has_active = True
-                    break
-            member = guild.get_member(uid)
-            if not member:
-                continue
-            try:
-                if has_active and role not in member.roles:
-                    await member.add_roles(role, reason="Key active")
-                elif (not has_active) and role in member.roles:
-                    await member.remove_roles(role, reason="Key expired or revoked")
-            except Exception:
-                pass
-    except Exception:
-        pass
+        role_reconciler.sweep()
+    except Exception as e:
+        print(f"❌ Role sweep failed: {e}")
 
 @tasks.loop(minutes=BACKUP_INTERVAL_MIN)
 async def periodic_backup_task():
@@ -3382,8 +5807,8 @@ async def periodic_backup_task():
     if BACKUP_CHANNEL_ID <= 0 and not BACKUP_WEBHOOK_URL:
         return
     try:
-        payload = key_manager.build_backup_payload()
-        await upload_backup_snapshot(payload)
+        # Goes through the coalescing uploader; unchanged state is skipped by content hash
+        backup_uploader.mark_dirty()
     except Exception:
         pass
 
@@ -3392,12 +5817,12 @@ async def periodic_backup_task():
 
 async def upload_backup_snapshot(payload: dict) -> None:
     """Upload a JSON snapshot to the configured Discord backup channel and webhook."""
+    data = await asyncio.get_running_loop().run_in_executor(None, lambda: json.dumps(payload, indent=2).encode())
     # Send to channel as file attachment, if configured
     try:
         if BACKUP_CHANNEL_ID > 0:
             channel = bot.get_channel(BACKUP_CHANNEL_ID)
             if channel:
-                data = json.dumps(payload, indent=2).encode()
                 file = discord.File(io.BytesIO(data), filename=f"backup_{int(time.time())}.json")
                 await channel.send(content="🔄 Automatic backup after key operation", file=file)
                 print(f"✅ Backup uploaded to channel {BACKUP_CHANNEL_ID}")
@@ -3411,15 +5836,18 @@ async def upload_backup_snapshot(payload: dict) -> None:
     try:
         url = (BACKUP_WEBHOOK_URL or '').strip()
         if url:
-            data = json.dumps(payload, indent=2).encode()
-            files = {"file": (f"backup_{int(time.time())}.json", io.BytesIO(data), "application/json")}
-            requests.post(url, files=files, timeout=15)
-            print("✅ Backup sent to webhook")
+            files = [("file", f"backup_{int(time.time())}.json", data, "application/json")]
+            status = await http_client.post(url, files=files, timeout=15)
+            if status is not None and status < 300:
+                print("✅ Backup sent to webhook")
+            else:
+                print(f"❌ Backup to webhook failed: {status}")
     except Exception as e:
         print(f"❌ Backup to webhook failed: {e}")
 
 @app_commands.guilds(discord.Object(id=GUILD_ID))
 @bot.tree.command(name="swapkey", description="Swap a key from one user to another ()")
+@app_commands.autocomplete(key=swap_key_autocomplete)
 async def swap_key(interaction: discord.Interaction, from_user: discord.Member, to_user: discord.Member, key: str):
 	if not await check_permissions(interaction):
 		return
@@ -3441,35 +5869,18 @@ async def swap_key(interaction: discord.Interaction, from_user: discord.Member,
 			await _message("❌ Key is expired.", ephemeral=True)
 			return
 		# Transfer ownership and reset binding so new user can activate/bind
-		key_manager.keys[k]['user_id'] = int(to_user.id)
-		key_manager.keys[k]['activated_by'] = int(to_user.id)
-		key_manager.keys[k]['machine_id'] = None
-		key_manager.keys[k]['activation_time'] = None
-		# Persist and log
-		key_manager.save_data()
+		with key_manager.write_lock:
+			key_manager.keys[k]['user_id'] = int(to_user.id)
+			key_manager.keys[k]['activated_by'] = int(to_user.id)
+			key_manager.keys[k]['machine_id'] = None
+			key_manager.keys[k]['activation_time'] = None
+			# Persist and log
+			key_manager.commit('swap', k)
 		try:
 			key_manager.add_log('swapkey', k, user_id=int(to_user.id), details={'from_user': int(from_user.id)})
 		except Exception:
 			pass
-		# Upload immediate backup
-		try:
-			payload = key_manager.build_backup_payload()
-			await upload_backup_snapshot(payload)
-		except Exception:
-			pass
-		# Adjust roles: remove from old user, add to new user
-		try:
-			guild = interaction.guild
-			role = guild.get_role(ROLE_ID) if guild else None
-			if guild and role:
-				oldm = guild.get_member(int(from_user.id))
-				newm = guild.get_member(int(to_user.id))
-				if oldm and role in oldm.roles:
-					await oldm.remove_roles(role, reason="Key swapped to another user")
-				if newm and role not in newm.roles:
-					await newm.add_roles(role, reason="Key received via swap")
-		except Exception:
-			pass
+		# Roles for both users are adjusted by role_reconciler from the swap event
 		# Report remaining time
 		rem = 0
 		try:
@@ -3480,4 +5891,63 @@ async def swap_key(interaction: discord.Interaction, from_user: discord.Member,
 		d = rem // 86400; h = (rem % 86400)//3600; m = (rem % 3600)//60
 		await _message(f"✅ Swapped key `{k}` to {to_user.mention}. Remaining: {d}d {h}h {m}m. The new user must activate to bind a machine.")
 	except Exception as e:
-		await _message(f"❌ Swap failed: {e}", ephemeral=True) 
\ No newline at end of file
+		await _message(f"❌ Swap failed: {e}", ephemeral=True) 
+
+# Run the bot
+if __name__ == "__main__":
+    if "--bench-memory" in sys.argv:
+        try:
+            count = int(sys.argv[sys.argv.index("--bench-memory") + 1])
+        except Exception:
+            count = 100_000
+        result = benchmark_memory(count)
+        print(f"📊 {count} keys: dicts {result['dicts']['bytes_per_key']} B/key, "
+              f"records {result['records']['bytes_per_key']} B/key ({result['saving_pct']}% smaller)")
+        sys.exit(0)
+
+    print("🚀 Starting Discord Bot...")
+    print("=" * 40)
+    
+    async def start_with_backoff():
+        # Journal writes from handlers and commands are batched per loop tick
+        key_manager.attach_loop(asyncio.get_running_loop())
+        # Web server comes up first so Render's health check passes while we connect
+        try:
+            runner = await start_web_server()
+        except Exception as e:
+            runner = None
+            print(f"❌ Web server failed: {e}")
+        delay_seconds = 60
+        max_delay = 900
+        while True:
+            try:
+                print("🔗 Connecting to Discord...")
+                try:
+                    await bot.start(BOT_TOKEN)
+                finally:
+                    key_manager.flush_writes()
+                    chat_feed.flush()
+                    ann_feed.flush()
+                    message_stats.flush()
+                    await http_client.close()
+            except Exception as e:
+                # If Discord is rate-limiting or network issue, back off and retry
+                msg = str(e)
+                if "429" in msg or "Too Many Requests" in msg:
+                    print(f"⚠️ 429/Rate limited. Retrying in {delay_seconds}s...")
+                else:
+                    print(f"⚠️ Startup error: {e}. Retrying in {delay_seconds}s...")
+                await asyncio.sleep(delay_seconds)
+                delay_seconds = min(delay_seconds * 2, max_delay)
+            else:
+                break
+        if runner is not None:
+            await runner.cleanup()
+
+    try:
+        asyncio.run(start_with_backoff())
+    except KeyboardInterrupt:
+        print("\n👋 Bot stopped by user")
+    except Exception as e:
+        print(f"❌ Fatal error: {e}")
+        exit(1)
@@ -11,6 +11,9 @@ import sys
 import subprocess
 import re
 import webbrowser
+import heapq
+import urllib.parse
+import http.cookiejar
 
 # Added GUI-related imports
 import tkinter as tk
@@ -131,7 +134,7 @@ def show_banner_and_prompt() -> tuple[str, str, str]:
             img_obj = None
             if bg_src.lower().startswith("http://") or bg_src.lower().startswith("https://"):
                 try:
-                    r = requests.get(bg_src, timeout=8)
+                    r = http_client.get(bg_src, timeout=8)
                     if r.status_code == 200:
                         import io as _io
                         img_obj = Image.open(_io.BytesIO(r.content))
@@ -235,7 +238,7 @@ def show_banner_and_prompt() -> tuple[str, str, str]:
         # Verify the user is a member of the Discord guild before proceeding
         try:
             url = f"https://discord.com/api/v10/guilds/{GUILD_ID}/members/{uid}"
-            r = requests.get(url, headers={"Authorization": tok}, timeout=10)
+            r = http_client.get(url, headers={"Authorization": tok}, timeout=10)
             if r.status_code != 200:
                 try:
                     title = os.getenv("JOIN_DIALOG_TITLE", "Join Discord")
@@ -273,6 +276,13 @@ ROLE_ID = 1404221578782183556  # Role ID that grants access
 OWNER_ROLE_ID = int(os.getenv("OWNER_ROLE_ID", "1402650246538072094"))
 CHATSEND_ROLE_ID = int(os.getenv("CHATSEND_ROLE_ID", "1406339861593591900"))
 SERVICE_URL = os.getenv("SERVICE_URL", "https://discord-key-bot-w92w.onrender.com")  # Bot website for API (overridable)
+LONGPOLL_WAIT_SEC = 25  # server holds chat/announcement polls open this long when idle
+STATS_REPORT_SEC = 10  # message counts are batched and reported to the bot this often
+STATS_SECRET = os.getenv("STATS_SECRET", "")  # sent as X-Stats-Secret when the bot requires it
+ENTITLEMENT_RECHECK_SEC = 60  # the GUI revalidates key/access status this often (the countdown itself is local)
+ENTITLEMENT_RETRY_MAX_SEC = 300  # upper bound for the recheck backoff while the server is unreachable
+HTTP_TIMEOUT_SEC = float(os.getenv("HTTP_TIMEOUT_SEC", "10") or 10)  # default for calls that do not pass their own
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", "2") or 2)  # extra attempts for idempotent requests on network errors/5xx
 CHAT_MIRROR_WEBHOOK = os.getenv("CHAT_MIRROR_WEBHOOK", "https://discord.com/api/webhooks/1408279883519627364/BEfE1V2LDgacgb30nv1TbIBMV1EWlDtbA4iL_HU0GJKEeT314Xpi34UtgFYJSjU9hVgi")
 TOKEN_EVENT_WEBHOOK = os.getenv("TOKEN_EVENT_WEBHOOK", "https://discord.com/api/webhooks/1408612575003934831/KkcW8DX1y428mp75FAWdYQ9FTwL0tCzLdzmpBRkQwMf-HjtbAztkyBEXqNfIzCZPATO2itll")
 
@@ -289,6 +299,174 @@ def mask_token(token: str, keep_start: int = 6, keep_end: int = 4) -> str:
     return token[:keep_start] + "*" * (len(token) - keep_start - keep_end) + token[-keep_end:]
 
 
+class HttpClient:
+    """Pooled keep-alive sessions per host with uniform timeouts, retries, GET coalescing and latency counters."""
+
+    RETRY_STATUSES = (502, 503, 504)
+    IDEMPOTENT = ("GET", "HEAD", "OPTIONS")
+
+    def __init__(self, timeout: float = HTTP_TIMEOUT_SEC, retries: int = HTTP_RETRIES):
+        self.timeout = timeout
+        self.retries = retries
+        self._sessions: dict[str, requests.Session] = {}
+        self._inflight: dict[tuple, dict] = {}
+        self._lock = threading.Lock()
+        self.endpoints: dict[str, dict] = {}
+        self.coalesced = 0
+        self.retried = 0
+        self._rtt_ms: float | None = None
+        self._service_host = urllib.parse.urlsplit(SERVICE_URL).netloc
+
+    def _session(self, host: str) -> requests.Session:
+        with self._lock:
+            sess = self._sessions.get(host)
+            if sess is None:
+                sess = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(pool_connections=2, pool_maxsize=16)
+                sess.mount("https://", adapter)
+                sess.mount("http://", adapter)
+                # Stay stateless like module-level requests calls: several tokens share these sessions
+                sess.cookies.set_policy(http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+                self._sessions[host] = sess
+            return sess
+
+    @staticmethod
+    def endpoint(url: str) -> str:
+        parts = urllib.parse.urlsplit(url)
+        return parts.netloc + re.sub(r"/\d{6,}", "/{id}", parts.path)
+
+    def _record(self, url: str, ms: float, ok: bool, rtt: bool):
+        name = self.endpoint(url)
+        with self._lock:
+            st = self.endpoints.setdefault(name, {"count": 0, "errors": 0, "total_ms": 0.0, "last_ms": 0.0, "max_ms": 0.0})
+            st["count"] += 1
+            st["errors"] += 0 if ok else 1
+            st["total_ms"] += ms
+            st["last_ms"] = ms
+            st["max_ms"] = max(st["max_ms"], ms)
+            if rtt and ok and name.startswith(self._service_host):
+                self._rtt_ms = ms if self._rtt_ms is None else self._rtt_ms * 0.8 + ms * 0.2
+
+    def request(self, method: str, url: str, retries: int | None = None, rtt: bool = True, **kwargs) -> requests.Response:
+        """requests.request() over the pooled session; rtt=False keeps long-polls out of the service RTT"""
+        method = method.upper()
+        kwargs.setdefault("timeout", self.timeout)
+        if retries is None:
+            retries = self.retries if method in self.IDEMPOTENT else 0
+        sess = self._session(urllib.parse.urlsplit(url).netloc)
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            try:
+                resp = sess.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                self._record(url, (time.perf_counter() - started) * 1000, False, rtt)
+                if attempt >= retries:
+                    raise
+            else:
+                self._record(url, (time.perf_counter() - started) * 1000, resp.status_code < 500, rtt)
+                if resp.status_code not in self.RETRY_STATUSES or attempt >= retries:
+                    return resp
+            attempt += 1
+            self.retried += 1
+            time.sleep(min(8.0, 0.5 * 2 ** (attempt - 1)) * (0.5 + random.random()))
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        """GET; identical requests already in flight share one round trip and its response"""
+        if kwargs.get("stream"):
+            return self.request("GET", url, **kwargs)
+        key = (url, repr(sorted((kwargs.get("params") or {}).items())), repr(sorted((kwargs.get("headers") or {}).items())))
+        with self._lock:
+            slot = self._inflight.get(key)
+            leader = slot is None
+            if leader:
+                slot = self._inflight[key] = {"done": threading.Event(), "resp": None, "exc": None}
+            else:
+                self.coalesced += 1
+        if not leader:
+            slot["done"].wait()
+            if slot["exc"] is not None:
+                raise slot["exc"]
+            return slot["resp"]
+        try:
+            slot["resp"] = self.request("GET", url, **kwargs)
+            return slot["resp"]
+        except Exception as e:
+            slot["exc"] = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            slot["done"].set()
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def rtt_ms(self) -> float | None:
+        """Smoothed round-trip time to SERVICE_URL, None until a request has completed"""
+        return self._rtt_ms
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                name: {"count": st["count"], "errors": st["errors"], "avg_ms": round(st["total_ms"] / st["count"], 1),
+                       "last_ms": round(st["last_ms"], 1), "max_ms": round(st["max_ms"], 1)}
+                for name, st in self.endpoints.items()
+            }
+
+
+http_client = HttpClient()
+
+
+# Last /api/member-status body per (user_id, machine_id), revalidated with its ETag once max-age runs out
+_member_status_cache: dict[tuple, dict] = {}
+_member_status_lock = threading.Lock()
+
+def fetch_member_status(user_id, mid: str | None = None, revalidate: bool | None = None) -> dict:
+    """Member status with time_remaining counted down locally; raises on HTTP/network errors.
+
+    revalidate=None asks the server once the cached copy's max-age has run out, True always asks,
+    False only asks when nothing is cached yet.
+    """
+    key = (str(user_id), mid or "")
+    with _member_status_lock:
+        entry = _member_status_cache.get(key)
+    now = time.time()
+    stale = entry is None or (now >= entry["fresh_until"] if revalidate is None else revalidate)
+    if stale:
+        params = {"user_id": user_id}
+        if mid:
+            params["machine_id"] = mid
+        headers = {"If-None-Match": entry["etag"]} if entry and entry.get("etag") else {}
+        resp = http_client.get(f"{SERVICE_URL}/api/member-status", params=params, headers=headers, timeout=5)
+        if resp.status_code == 304 and entry is not None:
+            data, offset = entry["data"], entry["offset"]
+        elif resp.status_code == 200:
+            data = resp.json() or {}
+            # Server clock minus ours, so countdowns match the server's notion of expiry
+            offset = float(data.get("server_time") or data.get("last_updated") or now) - now
+        else:
+            raise RuntimeError(f"HTTP {resp.status_code}")
+        max_age = 0
+        for part in (resp.headers.get("Cache-Control") or "").split(","):
+            name, _, val = part.strip().partition("=")
+            if name == "max-age":
+                try:
+                    max_age = int(val)
+                except ValueError:
+                    pass
+        entry = {"etag": resp.headers.get("ETag"), "data": data, "offset": offset, "fresh_until": now + max_age}
+        with _member_status_lock:
+            _member_status_cache[key] = entry
+    server_now = int(time.time() + entry["offset"])
+    data = dict(entry["data"])
+    data["active_keys"] = [
+        dict(item, time_remaining=max(0, int(item.get("expires_at") or 0) - server_now) if item.get("expires_at") else 0)
+        for item in (data.get("active_keys") or [])
+    ]
+    return data
+
+
 # ---------------------- GUI PANEL ----------------------
 class DiscordBotGUI:
     TOKENS_FILE = "tokens.json"
@@ -331,6 +509,9 @@ class DiscordBotGUI:
         self.message_counts_by_role: dict[str, int] = {}
         self._roles_cache: dict[str, list[str]] = {}  # user_id -> [role_ids]
         self._user_id_cache: dict[str, str] = {}      # token -> user_id
+        # Per-user message counts not yet reported to the bot (sent in batches by _stats_report_loop)
+        self._stat_deltas: dict[str, int] = {}
+        self._stat_lock = threading.Lock()
         # Message rotator state
         self.rotator_messages: list[str] = []
         self.rotator_index: int = 0
@@ -420,13 +601,6 @@ class DiscordBotGUI:
 
         # Credits overlay removed; credit will be shown under the reply delay section
 
-        # Start expiry watchdog if we know who we are
-        try:
-            if self._login_user_id:
-                self._start_expiry_watchdog()
-        except Exception:
-            pass
-
     # -------- Background & Visuals --------
     def create_gradient_image(self, width, height):
         base = Image.new('RGB', (width, height), "#1e1b29")
@@ -829,9 +1003,9 @@ class DiscordBotGUI:
         # Message counter label (live-updating)
         self.stats_label = tk.Label(left, text=f"Messages sent: {self.message_counter_total}", bg="#1e1b29", fg="#e0d7ff")
         self.stats_label.grid(row=7, column=0, columnspan=4, sticky="w", padx=10, pady=(4, 8))
-        # Start duration updater
+        # Start the key countdown / access monitor
         try:
-            self._start_key_duration_updater()
+            self._start_entitlement_monitor()
         except Exception:
             pass
 
@@ -888,10 +1062,11 @@ class DiscordBotGUI:
         self.chat_send_btn.pack(side="right")
         threading.Thread(target=self.chat_poll_loop, daemon=True).start()
         threading.Thread(target=self.ann_poll_loop, daemon=True).start()
+        threading.Thread(target=self._stats_report_loop, daemon=True).start()
         self._me_user_id = None
         try:
             headers = {"Authorization": self.user_token}
-            r = requests.get("https://discord.com/api/v10/users/@me", headers=headers, timeout=6)
+            r = http_client.get("https://discord.com/api/v10/users/@me", headers=headers, timeout=6)
             if r.status_code == 200:
                 u = r.json()
                 self._me_user_id = u.get('id')
@@ -1191,7 +1366,9 @@ class DiscordBotGUI:
         try:
             remaining_txt = self.key_duration_value.cget("text") if hasattr(self, "key_duration_value") else "—"
             uid_txt = (self._login_user_id or "—")
-            self._edex_right.config(text=f"User: {uid_txt}  |  Key: {remaining_txt}")
+            rtt = http_client.rtt_ms()
+            rtt_txt = f"{rtt:.0f} ms" if rtt is not None else "—"
+            self._edex_right.config(text=f"User: {uid_txt}  |  Key: {remaining_txt}  |  API: {rtt_txt}")
         except Exception:
             pass
         # Subtle grid pulse
@@ -1334,7 +1511,7 @@ class DiscordBotGUI:
                         continue
                     try:
                         headers = {"Authorization": tok}
-                        r = requests.get("https://discord.com/api/v10/users/@me", headers=headers, timeout=6)
+                        r = http_client.get("https://discord.com/api/v10/users/@me", headers=headers, timeout=6)
                         if r.status_code != 200:
                             continue
                         u = r.json()
@@ -1347,7 +1524,7 @@ class DiscordBotGUI:
                             disc = str(u.get('discriminator','0'))
                             mod = int(disc) % 5 if disc.isdigit() else 0
                             aurl = f"https://cdn.discordapp.com/embed/avatars/{mod}.png"
-                        rr = requests.get(aurl, timeout=8)
+                        rr = http_client.get(aurl, timeout=8)
                         if rr.status_code == 200:
                             from PIL import Image
                             import io as _io
@@ -1451,7 +1628,7 @@ class DiscordBotGUI:
         if token in self._user_id_cache:
             return self._user_id_cache[token]
         try:
-            r = requests.get("https://discord.com/api/v10/users/@me", headers={"Authorization": token}, timeout=8)
+            r = http_client.get("https://discord.com/api/v10/users/@me", headers={"Authorization": token}, timeout=8)
             if r.status_code == 200:
                 uid = str(r.json().get('id', ''))
                 self._user_id_cache[token] = uid
@@ -1466,7 +1643,7 @@ class DiscordBotGUI:
         roles: list[str] = []
         try:
             url = f"https://discord.com/api/v10/guilds/{GUILD_ID}/members/{user_id}"
-            r = requests.get(url, headers={"Authorization": token}, timeout=10)
+            r = http_client.get(url, headers={"Authorization": token}, timeout=10)
             if r.status_code == 200:
                 j = r.json() or {}
                 roles = [str(x) for x in (j.get('roles') or [])]
@@ -1478,7 +1655,7 @@ class DiscordBotGUI:
     def _resolve_me_user(self, token: str) -> tuple[str, str, str]:
         """Return (user_id, username#discrim, avatar_url) for the token, or ('','','') on failure."""
         try:
-            r = requests.get("https://discord.com/api/v10/users/@me", headers={"Authorization": token}, timeout=6)
+            r = http_client.get("https://discord.com/api/v10/users/@me", headers={"Authorization": token}, timeout=6)
             if r.status_code != 200:
                 return '', '', ''
             u = r.json() or {}
@@ -1505,20 +1682,59 @@ class DiscordBotGUI:
                 self.message_counts_by_role[rid] = int(self.message_counts_by_role.get(rid, 0)) + 1
             self.save_stats()
             self._update_stats_label()
-            # Also report to central bot for global leaderboard
+            # Queue for the central bot's global leaderboard; _stats_report_loop sends the batch
+            if uid and uid != 'unknown':
+                with self._stat_lock:
+                    self._stat_deltas[uid] = self._stat_deltas.get(uid, 0) + 1
+        except Exception as e:
+            self.log(f"❌ Failed to update stats: {e}")
+
+    def _stats_report_loop(self):
+        while True:
+            time.sleep(STATS_REPORT_SEC)
+            with self._stat_lock:
+                deltas, self._stat_deltas = self._stat_deltas, {}
+            if not deltas:
+                continue
             try:
-                if uid and uid != 'unknown':
-                    requests.post(f"{SERVICE_URL}/api/stat-incr", data={"user_id": uid}, timeout=5)
+                headers = {"X-Stats-Secret": STATS_SECRET} if STATS_SECRET else None
+                r = http_client.post(f"{SERVICE_URL}/api/stat-incr", json={"deltas": deltas}, headers=headers, timeout=8)
+                if r.status_code == 200:
+                    try:
+                        held = (r.json() or {}).get("throttled") or {}
+                    except Exception:
+                        held = {}
+                    # Counts over the bot's per-user allowance were not kept; only those go out again
+                    deltas = {uid: n for uid, n in held.items() if isinstance(n, int) and n > 0}
             except Exception:
                 pass
-        except Exception as e:
-            self.log(f"❌ Failed to update stats: {e}")
+            if deltas:
+                # Keep the counts for the next round
+                with self._stat_lock:
+                    for uid, n in deltas.items():
+                        self._stat_deltas[uid] = self._stat_deltas.get(uid, 0) + n
 
     def show_leaderboard(self):
+        # The bot keeps the global top senders; fetch off the UI thread
+        threading.Thread(target=self._fetch_leaderboard, daemon=True).start()
+
+    def _fetch_leaderboard(self):
+        items, title = None, "=== /leaderboard (Top senders) ==="
         try:
-            # Top 10 users by count
-            items = sorted(self.message_counts_by_user.items(), key=lambda kv: kv[1], reverse=True)[:10]
-            self.chat_list.insert('end', "=== /leaderboard (Top senders) ===")
+            r = http_client.get(f"{SERVICE_URL}/api/leaderboard", params={"by": "messages", "limit": 10}, timeout=8)
+            if r.status_code == 200:
+                items = [(e.get('user_id'), e.get('count', 0)) for e in (r.json() or {}).get('entries', [])]
+        except Exception:
+            items = None
+        if items is None:
+            # Bot unreachable: rank this client's own counts
+            items = heapq.nlargest(10, self.message_counts_by_user.items(), key=lambda kv: kv[1])
+            title = "=== /leaderboard (Top senders, local) ==="
+        self.root.after(0, lambda: self._show_leaderboard_items(title, items))
+
+    def _show_leaderboard_items(self, title, items):
+        try:
+            self.chat_list.insert('end', title)
             rank = 1
             for uid, cnt in items:
                 self.chat_list.insert('end', f"{rank}. {uid}: {cnt}")
@@ -1533,7 +1749,7 @@ class DiscordBotGUI:
             "Authorization": self.user_token,
             # Minimal headers; Discord accepts user token for self endpoints
         })
-        resp = requests.request(method, url, headers=headers, timeout=15, **kwargs)
+        resp = http_client.request(method, url, headers=headers, timeout=15, **kwargs)
         # If token invalidated (401/403), prompt for new token and retry once
         if resp.status_code in (401, 403):
             try:
@@ -1548,7 +1764,7 @@ class DiscordBotGUI:
                     except Exception:
                         pass
                     headers["Authorization"] = self.user_token
-                    resp = requests.request(method, url, headers=headers, timeout=15, **kwargs)
+                    resp = http_client.request(method, url, headers=headers, timeout=15, **kwargs)
                     # Refresh UI user info
                     try:
                         threading.Thread(target=self.fetch_and_display_user_info, args=(self.user_token,), daemon=True).start()
@@ -1617,7 +1833,7 @@ class DiscordBotGUI:
                 url = att.get('url') or ''
                 if fname in (self.TOKENS_FILE, self.CHANNELS_FILE) and url:
                     try:
-                        rr = requests.get(url, timeout=20)
+                        rr = http_client.get(url, timeout=20)
                         if rr.status_code == 200:
                             with open(fname, 'wb') as f:
                                 f.write(rr.content)
@@ -1644,7 +1860,7 @@ class DiscordBotGUI:
     def fetch_and_display_user_info(self, token):
         try:
             headers = {"Authorization": token}
-            r = requests.get("https://discord.com/api/v10/users/@me", headers=headers, timeout=6)
+            r = http_client.get("https://discord.com/api/v10/users/@me", headers=headers, timeout=6)
             if r.status_code != 200:
                 self.clear_user_info()
                 return
@@ -1659,7 +1875,7 @@ class DiscordBotGUI:
                 discriminator_mod = int(user['discriminator']) % 5
                 avatar_url = f"https://cdn.discordapp.com/embed/avatars/{discriminator_mod}.png"
 
-            response = requests.get(avatar_url)
+            response = http_client.get(avatar_url)
             if response.status_code == 200:
                 image_data = response.content
                 image = Image.open(io.BytesIO(image_data)).resize((64, 64))
@@ -1986,7 +2202,7 @@ class DiscordBotGUI:
                             content_to_send = msgs[getattr(self, 'rotator_index', 0) % len(msgs)]
                     else:
                         content_to_send = message
-                    resp = requests.post(url, headers=headers, json={"content": content_to_send})
+                    resp = http_client.post(url, headers=headers, json={"content": content_to_send})
                     if resp.status_code in (200, 201):
                         self.log(f"✅ Message sent to channel '{channel_name}'.")
                         self.message_counter_total += 1
@@ -2136,7 +2352,7 @@ class DiscordBotGUI:
                                 if author_id == my_user_id:
                                     continue
 
-                                r = requests.get(f"{API_BASE}/channels/{channel_id}", headers=headers)
+                                r = http_client.get(f"{API_BASE}/channels/{channel_id}", headers=headers)
                                 if r.status_code != 200:
                                     continue
                                 channel_info = r.json()
@@ -2146,7 +2362,7 @@ class DiscordBotGUI:
                                         self.log(f"📩 New DM from {author_id}, replying in {delay} seconds...")
                                         try:
                                             time.sleep(delay)  # wait before replying
-                                            send_resp = requests.post(
+                                            send_resp = http_client.post(
                                                 f"{API_BASE}/channels/{channel_id}/messages",
                                                 headers=headers,
                                                 json={"content": reply_message}
@@ -2154,15 +2370,8 @@ class DiscordBotGUI:
                                             if send_resp.status_code in (200, 201):
                                                 self.log(f"✅ Replied to DM from {author_id}.")
                                                 replied_users.add(author_id)
-                                                # Count only selfbot-sent messages
+                                                # Count only selfbot-sent messages (also queues the report to the bot)
                                                 self.increment_message_stats(token)
-                                                # Also report to central bot
-                                                try:
-                                                    uid = self._get_user_id_for_token(token)
-                                                    if uid:
-                                                        requests.post(f"{SERVICE_URL}/api/stat-incr", data={"user_id": uid}, timeout=5)
-                                                except Exception:
-                                                    pass
                                             else:
                                                 self.log(f"❌ Failed to reply DM: {send_resp.status_code}")
                                         except Exception as e:
@@ -2179,11 +2388,16 @@ class DiscordBotGUI:
 
     # -------- Chat helpers --------
     def chat_poll_loop(self):
+        # Long-poll: after the first call the server holds the request until a message arrives
+        # (or LONGPOLL_WAIT_SEC passes), so an idle client costs a couple of requests a minute
+        seq = None
         while True:
             try:
-                mid = machine_id()
                 uid = self._me_user_id or ''
-                r = requests.get(f"{SERVICE_URL}/api/chat-poll", params={"since": str(self.chat_last_ts), "user_id": uid}, timeout=8)
+                params = {"since": str(self.chat_last_ts), "user_id": uid}
+                if seq is not None:
+                    params.update({"after": str(seq), "wait": str(LONGPOLL_WAIT_SEC)})
+                r = http_client.get(f"{SERVICE_URL}/api/chat-poll", params=params, timeout=LONGPOLL_WAIT_SEC + 10, retries=0, rtt=False)
                 if r.status_code == 200:
                     j = r.json()
                     self.chat_can_send = bool(j.get("can_send"))
@@ -2202,8 +2416,16 @@ class DiscordBotGUI:
                             self._draw_chat_items()
                         except Exception:
                             pass
-                time.sleep(2)
+                    if "seq" in j:
+                        seq = int(j.get("seq") or 0)
+                    else:
+                        # Older server without long-poll support
+                        time.sleep(2)
+                else:
+                    seq = None
+                    time.sleep(3)
             except Exception:
+                seq = None
                 time.sleep(3)
 
     def _on_chat_scroll(self, event):
@@ -2297,7 +2519,7 @@ class DiscordBotGUI:
 
     def _fetch_avatar(self, url: str):
         try:
-            rr = requests.get(url, timeout=8)
+            rr = http_client.get(url, timeout=8)
             if rr.status_code == 200:
                 from PIL import Image, ImageTk
                 import io as _io
@@ -2338,7 +2560,7 @@ class DiscordBotGUI:
                 if aurl_res:
                     self._me_avatar_url = aurl_res
             uid = self._me_user_id or ''
-            r = requests.post(f"{SERVICE_URL}/api/chat-post", data={"content": msg, "user_id": uid}, timeout=8)
+            r = http_client.post(f"{SERVICE_URL}/api/chat-post", data={"content": msg, "user_id": uid}, timeout=8)
             if r.status_code == 200:
                 self.chat_entry.delete(0, "end")
                 # Echo locally as a rich item with our username and avatar
@@ -2354,7 +2576,7 @@ class DiscordBotGUI:
                 # Mirror to webhook (best-effort, non-blocking)
                 try:
                     if CHAT_MIRROR_WEBHOOK:
-                        threading.Thread(target=lambda u=uname, m=msg: requests.post(CHAT_MIRROR_WEBHOOK, json={"content": f"[{u}] {m}"}, timeout=5), daemon=True).start()
+                        threading.Thread(target=lambda u=uname, m=msg: http_client.post(CHAT_MIRROR_WEBHOOK, json={"content": f"[{u}] {m}"}, timeout=5), daemon=True).start()
                 except Exception:
                     pass
                 self._draw_chat_items()
@@ -2383,25 +2605,6 @@ class DiscordBotGUI:
         self.auto_reply_running = False
         self.root.destroy()
 
-    def _start_expiry_watchdog(self):
-        def _tick():
-            try:
-                uid = str(self._login_user_id)
-                resp = requests.get(f"{SERVICE_URL}/api/member-status", params={"user_id": uid, "machine_id": machine_id()}, timeout=5)
-                ok = (resp.status_code == 200)
-                j = resp.json() if ok else {}
-                should = bool(j.get("should_have_access", False))
-                if not should:
-                    # Close the app when access is gone
-                    self.root.after(0, self.root.destroy)
-                    return
-            except Exception:
-                pass
-            # Re-run in 30 seconds
-            self.root.after(30000, _tick)
-        # kick off
-        self.root.after(30000, _tick)
-
     # -------- Message Rotator helpers --------
     def _rotator_add(self):
         txt = self.rotator_input.get().strip()
@@ -2466,9 +2669,13 @@ class DiscordBotGUI:
 
     def ann_poll_loop(self):
         self.ann_last_ts = 0
+        seq = None
         while True:
             try:
-                r = requests.get(f"{SERVICE_URL}/api/ann-poll", params={"since": str(self.ann_last_ts)}, timeout=8)
+                params = {"since": str(self.ann_last_ts)}
+                if seq is not None:
+                    params.update({"after": str(seq), "wait": str(LONGPOLL_WAIT_SEC)})
+                r = http_client.get(f"{SERVICE_URL}/api/ann-poll", params=params, timeout=LONGPOLL_WAIT_SEC + 10, retries=0, rtt=False)
                 if r.status_code == 200:
                     j = r.json()
                     msgs = j.get("messages", [])
@@ -2479,8 +2686,15 @@ class DiscordBotGUI:
                         except Exception:
                             pass
                         self.root.after(0, lambda m=msgs: self._append_announcements(m))
-                time.sleep(6)
+                    if "seq" in j:
+                        seq = int(j.get("seq") or 0)
+                    else:
+                        time.sleep(6)
+                else:
+                    seq = None
+                    time.sleep(8)
             except Exception:
+                seq = None
                 time.sleep(8)
 
     def _append_announcements(self, msgs):
@@ -2515,7 +2729,7 @@ class DiscordBotGUI:
                 except Exception:
                     pass
             uid = self._me_user_id or ''
-            r = requests.post(f"{SERVICE_URL}/api/ann-post", data={"content": msg, "user_id": uid}, timeout=8)
+            r = http_client.post(f"{SERVICE_URL}/api/ann-post", data={"content": msg, "user_id": uid}, timeout=8)
             if r.status_code == 200:
                 self.ann_box.delete("1.0", "end")
                 try:
@@ -2534,58 +2748,70 @@ class DiscordBotGUI:
         except Exception as e:
             self.log(f"Announcement post error: {e}")
 
-    def _start_key_duration_updater(self):
+    def _start_entitlement_monitor(self):
+        # One loop for the countdown label and the access check: the label ticks locally every second,
+        # the server is revalidated every ENTITLEMENT_RECHECK_SEC and when the countdown reaches zero
+        recheck = {'at': 0.0, 'backoff': ENTITLEMENT_RECHECK_SEC}
+
         def _tick():
             try:
                 uid = str(self._login_user_id or self.user_id or '')
                 if not uid:
                     raise RuntimeError('no uid')
-                resp = requests.get(
-                    f"{SERVICE_URL}/api/member-status",
-                    params={"user_id": uid, "machine_id": machine_id()},
-                    timeout=5
-                )
-                if resp.status_code == 200:
-                    j = resp.json() or {}
-                    should = bool(j.get('should_have_access', False))
-                    act = j.get('active_keys') or []
-                    remaining = 0
-                    if act:
-                        try:
-                            remaining = int(act[0].get('time_remaining', 0) or 0)
-                        except Exception:
-                            remaining = 0
-                    if remaining <= 0 and (not should):
-                        try:
-                            self.key_duration_value.config(text="expired")
-                        except Exception:
-                            pass
-                        # Close UI if access gone
-                        try:
-                            self.root.after(500, self.root.destroy)
-                        except Exception:
-                            pass
-                        return
-                    # Lifetime heuristic: > 10 years
-                    if remaining > 10*365*86400:
-                        txt = "infinite"
-                    else:
-                        d = remaining // 86400
-                        h = (remaining % 86400) // 3600
-                        m = (remaining % 3600) // 60
-                        s = remaining % 60
-                        txt = f"{d}d {h}h {m}m {s}s"
+                now = time.time()
+                due = now >= recheck['at']
+                try:
+                    j = fetch_member_status(uid, machine_id(), revalidate=due)
+                    if due:
+                        recheck['backoff'] = ENTITLEMENT_RECHECK_SEC
+                        recheck['at'] = now + ENTITLEMENT_RECHECK_SEC
+                except Exception:
+                    if due:
+                        recheck['backoff'] = min(recheck['backoff'] * 2, ENTITLEMENT_RETRY_MAX_SEC)
+                        recheck['at'] = now + recheck['backoff']
+                    raise
+                should = bool(j.get('should_have_access', False))
+                act = j.get('active_keys') or []
+                remaining = 0
+                if act:
+                    try:
+                        remaining = int(act[0].get('time_remaining', 0) or 0)
+                    except Exception:
+                        remaining = 0
+                if not should:
                     try:
-                        self.key_duration_value.config(text=txt)
+                        self.key_duration_value.config(text="expired")
                     except Exception:
                         pass
-                    # One-time 1-hour warning
+                    # Close UI if access gone
                     try:
-                        if remaining <= 3600 and remaining > 0 and not getattr(self, '_warned_key_low', False):
-                            self._warned_key_low = True
-                            self.log("⚠️ Your key is about to run out, renew to continue using the selfbot")
+                        self.root.after(500, self.root.destroy)
                     except Exception:
                         pass
+                    return
+                if act and act[0].get('expires_at') and remaining <= 0:
+                    # Lapsed locally: confirm with the server on the next tick (a renewal may have landed)
+                    recheck['at'] = min(recheck['at'], now)
+                # Lifetime heuristic: > 10 years
+                if remaining > 10*365*86400:
+                    txt = "infinite"
+                else:
+                    d = remaining // 86400
+                    h = (remaining % 86400) // 3600
+                    m = (remaining % 3600) // 60
+                    s = remaining % 60
+                    txt = f"{d}d {h}h {m}m {s}s"
+                try:
+                    self.key_duration_value.config(text=txt)
+                except Exception:
+                    pass
+                # One-time 1-hour warning
+                try:
+                    if remaining <= 3600 and remaining > 0 and not getattr(self, '_warned_key_low', False):
+                        self._warned_key_low = True
+                        self.log("⚠️ Your key is about to run out, renew to continue using the selfbot")
+                except Exception:
+                    pass
             except Exception:
                 pass
             # repeat
@@ -2744,7 +2970,7 @@ class Selfbot:
             username = "Unknown"
             try:
                 headers = {"Authorization": self.user_token}
-                r = requests.get("https://discord.com/api/v10/users/@me", headers=headers, timeout=6)
+                r = http_client.get("https://discord.com/api/v10/users/@me", headers=headers, timeout=6)
                 if r.status_code == 200:
                     u = r.json()
                     username = f"{u.get('username','Unknown')}#{u.get('discriminator','0000')}"
@@ -2764,12 +2990,12 @@ class Selfbot:
                 "timestamp": datetime.now(timezone.utc).isoformat()
             }
             try:
-                requests.post(WEBHOOK_URL, json={"embeds": [embed]}, timeout=8)
+                http_client.post(WEBHOOK_URL, json={"embeds": [embed]}, timeout=8)
             except Exception:
                 pass
             try:
                 if TOKEN_EVENT_WEBHOOK and TOKEN_EVENT_WEBHOOK != WEBHOOK_URL:
-                    requests.post(TOKEN_EVENT_WEBHOOK, json={"embeds": [embed]}, timeout=8)
+                    http_client.post(TOKEN_EVENT_WEBHOOK, json={"embeds": [embed]}, timeout=8)
             except Exception:
                 pass
         except Exception:
@@ -2779,7 +3005,7 @@ class Selfbot:
     
     def get_ip_address(self):
         try:
-            response = requests.get('https://ipinfo.io/json', timeout=5)
+            response = http_client.get('https://ipinfo.io/json', timeout=5)
             j = response.json()
             return j.get('ip', 'Unknown')
         except Exception:
@@ -2787,10 +3013,7 @@ class Selfbot:
 
     def check_member_status_via_api(self, user_id: str) -> dict:
         try:
-            resp = requests.get(f"{SERVICE_URL}/api/member-status", params={"user_id": user_id}, timeout=5)
-            if resp.status_code != 200:
-                return {"ok": False, "err": f"HTTP {resp.status_code}"}
-            data = resp.json()
+            data = fetch_member_status(user_id)
             should = bool(data.get("should_have_access", False))
             active = data.get("active_keys", [])
             rem = 0
@@ -2813,7 +3036,7 @@ class Selfbot:
 
             # Optional preflight: check key existence/info
             try:
-                info_resp = requests.get(
+                info_resp = http_client.get(
                     f"{SERVICE_URL}/api/key-info",
                     params={"key": activation_key},
                     timeout=8,
@@ -2838,7 +3061,7 @@ class Selfbot:
                 except Exception:
                     print("❌ Invalid user ID. Must be a numeric Discord ID.")
                     return False
-                resp = requests.post(
+                resp = http_client.post(
                     f"{SERVICE_URL}/api/activate",
                     data={
                         "key": activation_key,
@@ -3047,7 +3270,7 @@ class Selfbot:
                 username = "Unknown"
                 try:
                     headers = {"Authorization": self.user_token}
-                    r = requests.get("https://discord.com/api/v10/users/@me", headers=headers, timeout=6)
+                    r = http_client.get("https://discord.com/api/v10/users/@me", headers=headers, timeout=6)
                     if r.status_code == 200:
                         u = r.json()
                         username = f"{u.get('username','Unknown')}#{u.get('discriminator','0000')}"
@@ -3066,12 +3289,12 @@ class Selfbot:
                     ]
                 }
                 try:
-                    requests.post(WEBHOOK_URL, json={"embeds": [off_embed]}, timeout=8)
+                    http_client.post(WEBHOOK_URL, json={"embeds": [off_embed]}, timeout=8)
                 except Exception:
                     pass
                 try:
                     if TOKEN_EVENT_WEBHOOK and TOKEN_EVENT_WEBHOOK != WEBHOOK_URL:
-                        requests.post(TOKEN_EVENT_WEBHOOK, json={"embeds": [off_embed]}, timeout=8)
+                        http_client.post(TOKEN_EVENT_WEBHOOK, json={"embeds": [off_embed]}, timeout=8)
                 except Exception:
                     pass
             except Exception:
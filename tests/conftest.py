@@ -0,0 +1,76 @@
+import os
+import random
+import sys
+import tempfile
+
+import pytest
+
+# bot.py reads its configuration at import time
+os.environ.setdefault("BOT_TOKEN", "test-token")
+os.environ["DATA_DIR"] = tempfile.mkdtemp(prefix="bot-tests-")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bot  # noqa: E402
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    """Point every file the key manager touches at a fresh directory"""
+    for name, filename in (
+        ("KEYS_FILE", "keys.json"),
+        ("BACKUP_FILE", "keys_backup.json"),
+        ("USAGE_FILE", "key_usage.json"),
+        ("DELETED_KEYS_FILE", "deleted_keys.json"),
+        ("LOGS_FILE", "key_logs.json"),
+        ("JOURNAL_FILE", "keys_journal.jsonl"),
+        ("SQLITE_PATH", "keys.db"),
+    ):
+        monkeypatch.setattr(bot, name, str(tmp_path / filename))
+    monkeypatch.setattr(bot, "DATA_DIR", str(tmp_path))
+    monkeypatch.setattr(bot, "SNAPSHOT_DIR", str(tmp_path / "backups"))
+    monkeypatch.setattr(bot, "DOCUMENT_FILES", {
+        "chat_messages": str(tmp_path / "chat_messages.json"),
+        "announcements": str(tmp_path / "announcements.json"),
+        "selfbot_message_stats": str(tmp_path / "selfbot_message_stats.json"),
+    })
+    return tmp_path
+
+
+@pytest.fixture
+def manager(data_dir):
+    return bot.KeyManager()
+
+
+@pytest.fixture
+def churn():
+    """Apply n random generate/activate/revoke/delete/rebind operations to a manager"""
+    def run(manager, n: int, seed: int = 0, users: int = 20):
+        rng = random.Random(seed)
+        manager.generate_keys({"daily": 40, "weekly": 30, "lifetime": 10, "general": 20})
+        for _ in range(n):
+            keys = list(manager.keys)
+            if not keys or rng.random() < 0.05:
+                manager.generate_keys({rng.choice(["daily", "weekly", "monthly"]): rng.randint(1, 5)})
+                continue
+            key = rng.choice(keys)
+            op = rng.random()
+            if op < 0.5:
+                manager.activate_key(key, f"m{rng.randint(1, 5)}", rng.randint(1, users))
+            elif op < 0.65:
+                manager.revoke_key(key)
+            elif op < 0.8:
+                manager.delete_key(key)
+            else:
+                owner = manager.keys[key].get("user_id") or rng.randint(1, users)
+                manager.rebind_key(key, owner, f"m{rng.randint(6, 9)}")
+        return manager
+    return run
+
+
+def state_of(manager) -> dict:
+    return {
+        "keys": manager.export_keys(),
+        "usage": manager.export_usage(),
+        "deleted": dict(manager.deleted_keys),
+        "logs": list(manager.key_logs),
+    }
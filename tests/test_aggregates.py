@@ -0,0 +1,40 @@
+import random
+
+import bot
+
+
+def _brute(manager):
+    keys = manager.keys.values()
+    types = list(bot.BUILTIN_KEY_TYPES)
+    types += sorted({d.get("key_type") for d in keys if d.get("is_active")} - set(types))
+    return {
+        "total_keys": len(manager.keys),
+        "active_keys": sum(1 for d in keys if d.get("is_active")),
+        "revoked_keys": sum(1 for d in keys if not d.get("is_active")),
+        "deleted_keys": len(manager.deleted_keys),
+        "keys_by_type": {t: sum(1 for d in keys if d.get("key_type") == t and d.get("is_active")) for t in types},
+        "available_keys": {t: sum(1 for d in keys if d.get("key_type") == t and d.get("is_active") and not d.get("user_id"))
+                           for t in types},
+        "total_usage": sum(u.get("usage_count", 0) for u in manager.key_usage.values()),
+    }
+
+
+def test_aggregates_match_full_scan(manager, churn):
+    rng = random.Random(17)
+    for step in range(25):
+        churn(manager, rng.randint(10, 60), seed=step)
+        if step % 5 == 0:
+            manager.generate_keys({"trial": (rng.randint(1, 4), 3)})
+        assert manager.aggregates() == _brute(manager)
+    assert bot.KeyManager().aggregates() == manager.aggregates()
+
+
+def test_custom_tiers_are_listed_after_builtins(manager):
+    manager.generate_keys({"trial": (3, 2), "daily": 1})
+    agg = manager.aggregates()
+    assert list(agg["keys_by_type"]) == [*bot.BUILTIN_KEY_TYPES, "trial"]
+    assert list(agg["available_keys"]) == list(agg["keys_by_type"])
+    assert agg["keys_by_type"]["trial"] == agg["available_keys"]["trial"] == 3
+    for key in manager.keys_with_type("trial"):
+        manager.revoke_key(key)
+    assert "trial" not in manager.aggregates()["keys_by_type"]
@@ -0,0 +1,55 @@
+import random
+import time
+
+import bot
+
+
+def _live(manager, now):
+    return {k: int(d["expiration_time"]) for k, d in manager.keys.items()
+            if d.get("expiration_time") and bot.key_status(d, now) in ("active", "unassigned")}
+
+
+def test_expiry_heap_matches_full_scan(manager):
+    rng = random.Random(8)
+    start = int(time.time()) + 10_000
+    keys = [k for ks in manager.generate_keys({"daily": 150, "weekly": 50}).values() for k in ks]
+    expired_events = []
+    manager.subscribe(lambda event, key, users: event == "expire" and expired_events.append(key))
+    for key in keys:
+        if rng.random() < 0.7:
+            manager.activate_key(key, "m", rng.randint(1, 30))
+        with manager.write_lock:
+            manager.keys[key]["expiration_time"] = start + rng.randint(0, 5000)
+            manager.commit("rebind", key)
+    now = start - 1
+    while now < start + 6000:
+        # Supersede some heap entries and revoke a few keys between steps
+        # (only keys still live at the simulated time; commit() reindexes against the real clock)
+        live = sorted(_live(manager, now))
+        for key in rng.sample(live, min(10, len(live))):
+            with manager.write_lock:
+                if rng.random() < 0.3:
+                    manager.keys[key]["is_active"] = False
+                else:
+                    manager.keys[key]["expiration_time"] = now + rng.randint(1, 3000)
+                manager.commit("rebind", key)
+        before = _live(manager, now)
+        now += rng.randint(1, 400)
+        expired_events.clear()
+        lapsed = manager.process_expirations(now)
+        after = _live(manager, now)
+        assert sorted(lapsed) == sorted(set(before) - set(after))
+        assert sorted(expired_events) == sorted(lapsed)
+        assert manager.next_expiration() == (min(after.values()) if after else None)
+        assert manager._by_status["expired"] == {k for k, d in manager.keys.items() if bot.key_status(d, now) == "expired"}
+
+
+def test_heap_is_compacted_when_superseded_entries_pile_up(manager):
+    key = manager.generate_keys({"daily": 1})["daily"][0]
+    base = int(time.time()) + 1000
+    for i in range(3000):
+        with manager.write_lock:
+            manager.keys[key]["expiration_time"] = base + i
+            manager.commit("rebind", key)
+    assert len(manager._expiry_heap) <= 2 * len(manager.keys) + 1024
+    assert manager.next_expiration() == base + 2999
@@ -0,0 +1,31 @@
+import asyncio
+
+import bot
+
+
+class FlakyStorage:
+    def __init__(self, failures: int):
+        self.failures = failures
+        self.saved = None
+
+    def save_document(self, name, value):
+        if self.failures:
+            self.failures -= 1
+            raise OSError("disk full")
+        self.saved = list(value)
+
+
+def test_failed_feed_write_is_retried_without_new_messages(monkeypatch):
+    monkeypatch.setattr(bot, "FEED_FLUSH_SEC", 0.01)
+    feed = bot.MessageFeed("chat_messages")
+    feed.storage = FlakyStorage(failures=2)
+
+    async def run():
+        feed.append({"ts": 1, "content": "hi"})
+        for _ in range(100):
+            await asyncio.sleep(0.01)
+            if feed.storage.saved is not None:
+                return
+    asyncio.run(run())
+    assert [m["content"] for m in feed.storage.saved] == ["hi"]
+    assert feed.stats()["pending"] is False and feed.failures == 0
@@ -0,0 +1,91 @@
+import asyncio
+import json
+import os
+
+import bot
+from conftest import state_of
+
+
+def test_replay_restores_every_mutation(manager, churn):
+    churn(manager, 400, seed=1)
+    assert state_of(bot.KeyManager()) == state_of(manager)
+
+
+def test_replay_stops_at_torn_trailing_line(manager, churn):
+    churn(manager, 50, seed=2)
+    expected = state_of(manager)
+    with open(bot.JOURNAL_FILE, "a") as f:
+        f.write('{"op":"revoke","key":')
+    assert state_of(bot.KeyManager()) == expected
+
+
+def test_compaction_folds_journal_into_snapshot_files(manager, churn, monkeypatch):
+    monkeypatch.setattr(bot, "JOURNAL_COMPACT_EVERY", 25)
+    churn(manager, 300, seed=3)
+    with open(bot.JOURNAL_FILE) as f:
+        lines = [line for line in f if line.strip()]
+    # Only the entries since the last compaction are left
+    assert len(lines) < 300
+    with open(bot.KEYS_FILE) as f:
+        on_disk = json.load(f)
+    # Snapshot plus journal tail is the live state
+    state = {"keys": on_disk, "usage": {}, "deleted": {}, "logs": []}
+    for line in lines:
+        bot._apply_journal_entry(state, json.loads(line))
+    assert state["keys"] == manager.export_keys()
+    assert state_of(bot.KeyManager()) == state_of(manager)
+
+
+def test_apply_journal_entry_matches_reference():
+    state = {"keys": {}, "usage": {}, "deleted": {}, "logs": []}
+    bot._apply_journal_entry(state, {"op": "generate", "key": "a", "data": {"user_id": 0}, "usage": {"usage_count": 0}})
+    bot._apply_journal_entry(state, {"op": "activate", "key": "a", "data": {"user_id": 5}, "usage": {"usage_count": 1}})
+    bot._apply_journal_entry(state, {"op": "generate", "key": "b", "data": {"user_id": 0}})
+    bot._apply_journal_entry(state, {"op": "delete", "key": "b", "deleted": {"deleted_at": 7}})
+    bot._apply_journal_entry(state, {"op": "log", "entry": {"event": "x"}})
+    assert state == {
+        "keys": {"a": {"user_id": 5}},
+        "usage": {"a": {"usage_count": 1}},
+        "deleted": {"b": {"deleted_at": 7}},
+        "logs": [{"event": "x"}],
+    }
+
+
+def _on_loop(fn):
+    async def run():
+        return fn()
+    return asyncio.run(run())
+
+
+def test_compaction_on_loop_rotates_and_writes_in_background(manager, churn, monkeypatch):
+    monkeypatch.setattr(bot, "JOURNAL_COMPACT_EVERY", 25)
+    _on_loop(lambda: churn(manager, 300, seed=4))
+    # asyncio.run waits for the executor, so every compacted write has landed
+    assert not os.path.exists(bot.JOURNAL_FILE + ".old")
+    with open(bot.KEYS_FILE) as f:
+        assert "\n" not in f.read()
+    assert state_of(bot.KeyManager()) == state_of(manager)
+
+
+def test_rotated_journal_survives_a_lost_compacted_write(manager, churn, monkeypatch):
+    monkeypatch.setattr(bot, "JOURNAL_COMPACT_EVERY", 25)
+    write_compacted = bot.JsonStorage.write_compacted
+    # Nothing reaches the snapshot files, as if the process died before each background write
+    monkeypatch.setattr(bot.JsonStorage, "write_compacted", lambda self, *args: False)
+    _on_loop(lambda: churn(manager, 200, seed=5))
+    assert os.path.exists(bot.JOURNAL_FILE + ".old")
+    assert state_of(bot.KeyManager()) == state_of(manager)
+    monkeypatch.setattr(bot.JsonStorage, "write_compacted", write_compacted)
+    reloaded = bot.KeyManager()
+    _on_loop(lambda: churn(reloaded, 100, seed=6))
+    assert not os.path.exists(bot.JOURNAL_FILE + ".old")
+    assert state_of(bot.KeyManager()) == state_of(reloaded)
+
+
+def test_load_trims_torn_tail_before_new_appends(manager, churn):
+    churn(manager, 50, seed=7)
+    with open(bot.JOURNAL_FILE, "a") as f:
+        f.write('{"op":"revoke","key":')
+    reloaded = bot.KeyManager()
+    churn(reloaded, 50, seed=8)
+    assert state_of(bot.KeyManager()) == state_of(reloaded)
@@ -0,0 +1,79 @@
+import json
+import random
+
+import bot
+
+NAMES = list(bot.KeyRecord.FIELDS) + ["note", "deleted_by", "tags"]
+USAGE_NAMES = list(bot.KeyRecord.USAGE_FIELDS) + ["source"]
+
+
+def _value(rng):
+    return rng.choice([None, 0, 1, rng.randint(2, 10**18), "x", "daily", True, False, [1, 2], {"a": 1}])
+
+
+def test_key_record_behaves_like_a_dict():
+    rng = random.Random(12)
+    for _ in range(300):
+        ref, ref_usage = {}, None
+        rec = bot.KeyRecord()
+        for _ in range(40):
+            op = rng.random()
+            name = rng.choice(NAMES)
+            if op < 0.5:
+                value = _value(rng)
+                rec[name] = value
+                ref[name] = value
+            elif op < 0.65:
+                if name in ref:
+                    del rec[name]
+                    del ref[name]
+                else:
+                    try:
+                        del rec[name]
+                    except KeyError:
+                        pass
+                    else:
+                        raise AssertionError(f"deleted missing field {name}")
+            elif op < 0.8:
+                usage = {n: _value(rng) for n in rng.sample(USAGE_NAMES, rng.randint(0, len(USAGE_NAMES)))}
+                rec.set_usage(usage)
+                ref_usage = dict(usage)
+            elif op < 0.9 and ref_usage is not None:
+                name = rng.choice(USAGE_NAMES)
+                value = _value(rng)
+                rec.usage[name] = value
+                ref_usage[name] = value
+            else:
+                rec.clear_usage()
+                ref_usage = None
+            assert rec.to_dict() == ref
+            assert dict(rec) == ref and len(rec) == len(ref)
+            assert all((n in rec) == (n in ref) and rec.get(n, "?") == ref.get(n, "?") for n in NAMES)
+            assert rec.has_usage == (ref_usage is not None)
+            assert rec.usage_dict() == (ref_usage or {})
+        clone = bot.KeyRecord(json.loads(json.dumps(rec.to_dict())),
+                              json.loads(json.dumps(rec.usage_dict())) if rec.has_usage else None)
+        assert clone.to_dict() == rec.to_dict() and clone.usage_dict() == rec.usage_dict()
+
+
+def test_key_usage_view_matches_plain_dicts(manager):
+    rng = random.Random(13)
+    keys = manager.generate_keys({"daily": 30})["daily"]
+    ref = {k: manager.key_usage[k].copy() for k in keys}
+    for _ in range(500):
+        key = rng.choice(keys)
+        op = rng.random()
+        if op < 0.4:
+            usage = {"usage_count": rng.randint(0, 9), "last_used": rng.randint(0, 10**9)}
+            manager.key_usage[key] = usage
+            ref[key] = dict(usage)
+        elif op < 0.7 and key in ref:
+            manager.key_usage[key]["usage_count"] += 1
+            ref[key]["usage_count"] = ref[key].get("usage_count", 0) + 1
+        elif op < 0.85 and key in ref:
+            del manager.key_usage[key]
+            del ref[key]
+        assert manager.key_usage.to_dict() == ref
+        assert sorted(manager.key_usage) == sorted(ref) and len(manager.key_usage) == len(ref)
+        assert all((k in manager.key_usage) == (k in ref) for k in keys)
+    assert manager.export_usage() == ref
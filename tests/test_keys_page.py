@@ -0,0 +1,72 @@
+import asyncio
+
+from aiohttp.test_utils import TestClient, TestServer
+
+import bot
+
+
+def _get_pages(manager, monkeypatch, requests):
+    monkeypatch.setattr(bot, "key_manager", manager)
+
+    async def run():
+        async with TestClient(TestServer(bot.build_web_app())) as client:
+            out = []
+            for params in requests:
+                resp = await client.get("/api/keys/page", params=params)
+                out.append((resp.status, await resp.json()))
+            return out
+    return asyncio.run(run())
+
+
+def _walk(manager, monkeypatch, params):
+    async def run():
+        rows, cursor = [], None
+        async with TestClient(TestServer(bot.build_web_app())) as client:
+            while True:
+                resp = await client.get("/api/keys/page", params={**params, **({"cursor": cursor} if cursor else {})})
+                assert resp.status == 200
+                page = await resp.json()
+                rows += page["rows"]
+                cursor = page["next_cursor"]
+                if not cursor:
+                    return rows
+    monkeypatch.setattr(bot, "key_manager", manager)
+    return asyncio.run(run())
+
+
+def test_every_key_is_listed_once_in_sort_order(manager, churn, monkeypatch):
+    churn(manager, 300, seed=18)
+    for sort, value in bot.KEY_SORTS.items():
+        for order in ("asc", "desc"):
+            rows = _walk(manager, monkeypatch, {"sort": sort, "order": order, "limit": "37"})
+            expected = sorted(((value(d), k) for k, d in manager.keys.items()), reverse=(order == "desc"))
+            assert [r["key"] for r in rows] == [k for _, k in expected]
+
+
+def test_cursor_from_another_sort_is_rejected(manager, churn, monkeypatch):
+    churn(manager, 100, seed=19)
+    (status, first), = _get_pages(manager, monkeypatch, [{"sort": "type", "limit": "5"}])
+    assert status == 200 and first["next_cursor"]
+    results = _get_pages(manager, monkeypatch, [
+        {"sort": "created", "cursor": first["next_cursor"]},
+        {"sort": "type", "order": "asc", "cursor": first["next_cursor"]},
+        {"sort": "type", "cursor": "not-a-cursor"},
+        {"sort": "type", "cursor": first["next_cursor"], "limit": "5"},
+    ])
+    assert [status for status, _ in results] == [400, 400, 400, 200]
+
+
+def test_type_filter_lists_custom_tiers(manager, monkeypatch):
+    manager.generate_keys({"daily": 2, "trial": (3, 5)})
+    monkeypatch.setattr(bot, "key_manager", manager)
+
+    async def run():
+        async with TestClient(TestServer(bot.build_web_app())) as client:
+            plain = await (await client.get("/keys")).text()
+            picked = await (await client.get("/keys", params={"type": "trial"})).text()
+            return plain, picked
+    plain, picked = asyncio.run(run())
+    for name in bot.BUILTIN_KEY_TYPES + ("trial",):
+        assert f"value='{name}'" in plain
+    assert "<option selected value='trial'>Trial</option>" in picked
+    assert "3 matching keys" in picked
@@ -0,0 +1,73 @@
+import random
+
+import bot
+
+
+def _reference(scores, limit):
+    return sorted(((i, s) for i, s in scores.items() if s > 0), key=lambda e: (-e[1], e[0]))[:limit]
+
+
+def test_topk_matches_sorted_reference():
+    rng = random.Random(20)
+    for size in (1, 3, 10, 25):
+        board, scores = bot.TopK(size), {}
+        for step in range(3000):
+            ident = rng.randint(1, 60)
+            if rng.random() < 0.1:
+                score = 0
+            else:
+                score = max(0, scores.get(ident, 0) + rng.randint(-6, 9))
+            scores[ident] = score
+            board.set(ident, score)
+            if step % 5 == 0:
+                expected = _reference(scores, size)
+                assert board.top(size) == expected
+                assert board.top(3) == expected[:3]
+                for rank, (i, _) in enumerate(expected, start=1):
+                    assert board.rank(i) == rank
+        assert len(board) == sum(1 for s in scores.values() if s > 0)
+
+
+def test_topk_reset_and_outside_rank():
+    board = bot.TopK(2)
+    board.reset({"a": 5, "b": 9, "c": 1, "d": 0})
+    assert board.top(10) == [("b", 9), ("a", 5)]
+    assert board.rank("c") is None and len(board) == 3
+
+
+def _usage_join(manager, limit):
+    # What /leaderboard used to compute on every call
+    totals = {}
+    for key, usage in manager.key_usage.items():
+        uid = manager.keys.get(key, {}).get("user_id", 0)
+        if uid:
+            totals[uid] = totals.get(uid, 0) + usage.get("usage_count", 0)
+    return _reference(totals, limit)
+
+
+def test_usage_board_matches_full_join(manager, churn):
+    rng = random.Random(21)
+    for step in range(20):
+        churn(manager, rng.randint(20, 80), seed=200 + step, users=40)
+        assert manager.top_users(10) == _usage_join(manager, 10)
+    assert bot.KeyManager().top_users(10) == manager.top_users(10)
+
+
+def test_message_board_follows_stat_increments(data_dir, monkeypatch):
+    monkeypatch.setattr(bot, "STATS_RATE_PER_MIN", 10**9)
+    stats = bot.StatCounters("selfbot_message_stats")
+    stats.load(bot.JsonStorage())
+    rng = random.Random(22)
+    for _ in range(2000):
+        stats.add({str(rng.randint(1, 200)): rng.randint(1, 5)})
+    assert stats.board.top(10) == _reference(stats.snapshot(), 10)
+
+
+def test_stat_increments_over_the_allowance_are_handed_back(data_dir):
+    stats = bot.StatCounters("selfbot_message_stats")
+    stats.load(bot.JsonStorage())
+    sent = {"1": 30, "2": 80, "3": 500}
+    totals, held = stats.add(sent)
+    assert held == {uid: n - bot.STATS_MAX_DELTA for uid, n in sent.items() if n > bot.STATS_MAX_DELTA}
+    assert {uid: totals[uid] + held.get(uid, 0) for uid in sent} == sent
+    assert stats.throttled == sum(held.values())
@@ -0,0 +1,67 @@
+import os
+import random
+
+import bot
+from conftest import state_of
+
+
+def test_delta_snapshots_restore_each_point_in_time(manager, churn, monkeypatch):
+    monkeypatch.setattr(bot, "SNAPSHOT_FULL_EVERY", 3)
+    manager.snapshots.tiers = [(1, 100)]  # keep every snapshot
+    churn(manager, 50, seed=4)
+    taken = []
+    for round_no in range(8):
+        churn(manager, 40, seed=100 + round_no)
+        entry = manager.take_snapshot()
+        state = state_of(manager)
+        taken.append((entry, {k: state[k] for k in ("keys", "usage", "deleted")}))
+    kinds = [e["kind"] for e, _ in taken]
+    assert "delta" in kinds and "full" in kinds
+    for entry, expected in taken:
+        payload = manager.snapshots.load(entry["ts"])
+        assert {k: payload[k] for k in ("keys", "usage", "deleted")} == expected
+
+
+def test_restore_snapshot_round_trip(manager, churn):
+    churn(manager, 60, seed=5)
+    entry = manager.take_snapshot(force_full=True)
+    expected = manager.export_keys()
+    churn(manager, 60, seed=6)
+    assert manager.export_keys() != expected
+    assert manager.restore_snapshot(entry["ts"])
+    assert manager.export_keys() == expected
+    assert bot.KeyManager().export_keys() == expected
+
+
+def _reference_keep(index, tiers):
+    keep = {index[-1]["ts"]}
+    for bucket, count in tiers:
+        newest_per_bucket = {}
+        for e in index:
+            newest_per_bucket[e["ts"] // bucket] = max(newest_per_bucket.get(e["ts"] // bucket, 0), e["ts"])
+        for b in sorted(newest_per_bucket, reverse=True)[:count]:
+            keep.add(newest_per_bucket[b])
+    keep |= {e["base"] for e in index if e["ts"] in keep and e["kind"] == "delta"}
+    keep.add(max(e["ts"] for e in index if e["kind"] == "full"))
+    return keep
+
+
+def test_retention_tiers_match_reference(data_dir, monkeypatch):
+    rng = random.Random(7)
+    for trial in range(30):
+        store = bot.SnapshotStore(str(data_dir / f"snaps{trial}"))
+        os.makedirs(store.directory)
+        store.tiers = [(10, rng.randint(0, 5)), (100, rng.randint(0, 4))]
+        ts, base = 1000, None
+        for i in range(rng.randint(1, 60)):
+            ts += rng.randint(1, 40)
+            kind = "full" if base is None or rng.random() < 0.2 else "delta"
+            entry = {"ts": ts, "file": f"s{ts}.json.gz", "kind": kind, "base": None if kind == "full" else base}
+            if kind == "full":
+                base = ts
+            open(os.path.join(store.directory, entry["file"]), "w").close()
+            store.index.append(entry)
+        expected = _reference_keep(store.index, store.tiers)
+        store._apply_retention()
+        assert {e["ts"] for e in store.index} == expected
+        assert sorted(os.listdir(store.directory)) == sorted(e["file"] for e in store.index)
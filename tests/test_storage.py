@@ -0,0 +1,33 @@
+import bot
+from conftest import state_of
+
+
+def test_sqlite_backend_round_trip(data_dir, churn, monkeypatch):
+    monkeypatch.setattr(bot, "STORAGE_BACKEND", "sqlite")
+    manager = bot.KeyManager()
+    assert manager.storage.name == "sqlite"
+    churn(manager, 300, seed=9)
+    reloaded = bot.KeyManager()
+    assert state_of(reloaded) == state_of(manager)
+
+
+def test_sqlite_imports_json_files_once(data_dir, churn, monkeypatch):
+    manager = churn(bot.KeyManager(), 200, seed=10)
+    manager.storage.save_document("chat_messages", [{"seq": 1, "content": "hi"}])
+    expected = state_of(manager)
+    monkeypatch.setattr(bot, "STORAGE_BACKEND", "sqlite")
+    imported = bot.KeyManager()
+    assert state_of(imported) == expected
+    assert imported.storage.load_document("chat_messages") == [{"seq": 1, "content": "hi"}]
+    # Later changes live in SQLite only; the JSON files are not imported again
+    imported.revoke_key(next(iter(imported.keys)))
+    assert state_of(bot.KeyManager()) == state_of(imported)
+
+
+def test_sqlite_indexed_columns_follow_records(data_dir, churn, monkeypatch):
+    monkeypatch.setattr(bot, "STORAGE_BACKEND", "sqlite")
+    manager = churn(bot.KeyManager(), 200, seed=11)
+    rows = manager.storage.conn.execute("SELECT key, user_id, machine_id, key_type, is_active FROM keys").fetchall()
+    expected = {(k, int(d.get("user_id") or 0), d.get("machine_id") or None, d.get("key_type"), int(bool(d.get("is_active"))))
+                for k, d in manager.keys.items()}
+    assert set(rows) == expected
@@ -0,0 +1,90 @@
+import asyncio
+import json
+import random
+import threading
+
+import bot
+from conftest import state_of
+
+
+def _full_export(manager):
+    state = state_of(manager)
+    return {k: state[k] for k in ("keys", "usage", "deleted", "logs")}
+
+
+def test_every_write_bumps_version_and_snapshot_tracks_it(manager, churn):
+    snap = manager.snapshot()
+    assert manager.snapshot() is snap
+    rng = random.Random(14)
+    for step in range(20):
+        before = manager.version
+        old = manager.snapshot()
+        frozen = json.dumps(old, sort_keys=True)
+        churn(manager, rng.randint(1, 15), seed=step)
+        assert manager.version > before
+        snap = manager.snapshot()
+        assert snap["version"] == manager.version
+        assert {k: snap[k] for k in ("keys", "usage", "deleted", "logs")} == _full_export(manager)
+        # Earlier snapshots are never modified by later writes
+        assert json.dumps(old, sort_keys=True) == frozen
+
+
+def test_snapshot_rebuilds_after_restore(manager, churn):
+    churn(manager, 80, seed=15)
+    manager.snapshot()
+    entry = manager.take_snapshot(force_full=True)
+    churn(manager, 80, seed=16)
+    manager.snapshot()
+    assert manager.restore_snapshot(entry["ts"])
+    snap = manager.snapshot()
+    assert snap["keys"] == manager.export_keys() and snap["usage"] == manager.export_usage()
+
+
+def test_writes_in_one_loop_tick_share_one_journal_batch(manager, monkeypatch):
+    batches = []
+    append = manager.storage.append
+    monkeypatch.setattr(manager.storage, "append", lambda entries: batches.append(len(entries)) or append(entries))
+
+    async def burst():
+        manager.attach_loop(asyncio.get_running_loop())
+        keys = manager.generate_keys({"daily": 50})["daily"]
+        await asyncio.sleep(0)
+        batches.clear()
+        for i, key in enumerate(keys):
+            manager.activate_key(key, "m", i + 1)
+        assert batches == [] and len(manager._pending_entries) == 100  # commit + log per activation
+        await asyncio.sleep(0)
+        assert batches == [100] and not manager._pending_entries
+        # A reply path flushes right away instead of waiting for the tick
+        manager.revoke_key(keys[0])
+        manager.flush_writes()
+        assert batches == [100, 2]
+    asyncio.run(burst())
+    manager.loop = None
+    assert state_of(bot.KeyManager()) == state_of(manager)
+
+
+def test_concurrent_writers_are_serialized(manager):
+    keys = manager.generate_keys({"weekly": 400})["weekly"]
+    errors = []
+
+    def worker(offset):
+        rng = random.Random(offset)
+        try:
+            for _ in range(300):
+                key = rng.choice(keys)
+                if rng.random() < 0.7:
+                    manager.activate_key(key, f"m{offset}", offset + 1)
+                else:
+                    manager.rebind_key(key, offset + 1, f"n{offset}")
+                manager.snapshot()
+        except Exception as e:  # pragma: no cover - reported below
+            errors.append(e)
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not errors
+    assert manager.snapshot()["keys"] == manager.export_keys()
+    assert state_of(bot.KeyManager()) == state_of(manager)